@@ -0,0 +1,331 @@
+# audio.py
+import struct
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+SAMPLE_DTYPES = {1: np.dtype("u1"), 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+
+class WavInfo(NamedTuple):
+    sample_rate: int
+    channels: int
+    sample_width: int
+    n_frames: int
+    data_offset: int
+
+    @property
+    def duration(self) -> float:
+        return self.n_frames / self.sample_rate
+
+
+def read_wav_info(path: str) -> WavInfo:
+    # Walk the RIFF chunks ourselves so the sample data can be memory-mapped
+    # in place instead of being read through the wave module.
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path} has no fmt chunk")
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+        file_size = f.seek(0, 2)
+
+    format_tag, channels, sample_rate, _, block_align, bits_per_sample = fmt
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+        raise ValueError(f"{path} is not PCM encoded")
+    sample_width = bits_per_sample // 8
+    if sample_width not in SAMPLE_DTYPES:
+        raise ValueError(f"{path} has unsupported sample width {bits_per_sample}")
+    # Streaming writers often leave the data size unset or too large
+    data_size = file_size - data_offset
+    if 0 < chunk_size < data_size:
+        data_size = chunk_size
+    return WavInfo(
+        sample_rate, channels, sample_width, data_size // block_align, data_offset
+    )
+
+
+def wav_samples(path: str) -> Tuple[WavInfo, np.ndarray]:
+    info = read_wav_info(path)
+    samples = np.memmap(
+        path,
+        dtype=SAMPLE_DTYPES[info.sample_width],
+        mode="r",
+        offset=info.data_offset,
+        shape=(info.n_frames, info.channels),
+    )
+    return info, samples
+
+
+class AudioMetadata(NamedTuple):
+    duration: float
+    sample_rate: int
+    channels: int
+    loudness_dbfs: float
+    clipping_ratio: float
+
+
+def _full_scale(dtype: np.dtype) -> Tuple[int, int]:
+    if dtype == np.uint8:
+        return 0, 255
+    info = np.iinfo(dtype)
+    return info.min, info.max
+
+
+def analyze_samples(
+    info: WavInfo, samples: np.ndarray, block_frames: int = 1 << 18
+) -> AudioMetadata:
+    # RMS loudness of the mono mix in dBFS, and the share of samples on any
+    # channel that sit at full scale
+    low, high = _full_scale(samples.dtype)
+    square_sum = 0.0
+    clipped = 0
+    for start in range(0, len(samples), block_frames):
+        block = samples[start : start + block_frames]
+        mono = to_float(block).astype(np.float64)
+        square_sum += float(np.dot(mono, mono))
+        clipped += int(np.count_nonzero((block <= low) | (block >= high)))
+    n_frames = len(samples)
+    rms = np.sqrt(square_sum / n_frames) if n_frames else 0.0
+    return AudioMetadata(
+        duration=info.duration,
+        sample_rate=info.sample_rate,
+        channels=info.channels,
+        loudness_dbfs=float(20 * np.log10(max(rms, 1e-10))),
+        clipping_ratio=clipped / samples.size if samples.size else 0.0,
+    )
+
+
+def analyze_recording(path: str) -> Optional[AudioMetadata]:
+    # None for uploads that are not PCM WAV
+    try:
+        info, samples = wav_samples(path)
+    except (ValueError, struct.error):
+        return None
+    return analyze_samples(info, samples)
+
+
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct("<4sHIH")
+PEAKS_LEVEL_HEADER = struct.Struct("<II")
+
+
+def waveform_peaks(
+    samples: np.ndarray, levels: List[int], block_peaks: int = 4096
+) -> List[Tuple[int, np.ndarray]]:
+    # Min/max of the mono mix per bucket of samples, for each zoom level.
+    # The finest level is read from the samples; coarser levels are reduced
+    # from it, so each must be a multiple of the finest.
+    finest = levels[0]
+    if any(level % finest for level in levels):
+        raise ValueError(f"Peak levels {levels} must be multiples of {finest}")
+    n_peaks = -(-len(samples) // finest)
+    mins = np.empty(n_peaks, dtype=np.float32)
+    maxs = np.empty(n_peaks, dtype=np.float32)
+    block_frames = block_peaks * finest
+    for start in range(0, len(samples), block_frames):
+        mono = to_float(samples[start : start + block_frames])
+        starts = np.arange(0, len(mono), finest)
+        peak = start // finest
+        mins[peak : peak + len(starts)] = np.minimum.reduceat(mono, starts)
+        maxs[peak : peak + len(starts)] = np.maximum.reduceat(mono, starts)
+    peaks = []
+    for level in levels:
+        starts = np.arange(0, n_peaks, level // finest)
+        if n_peaks:
+            level_peaks = np.empty((len(starts), 2), dtype=np.float32)
+            level_peaks[:, 0] = np.minimum.reduceat(mins, starts)
+            level_peaks[:, 1] = np.maximum.reduceat(maxs, starts)
+        else:
+            level_peaks = np.empty((0, 2), dtype=np.float32)
+        peaks.append((level, level_peaks))
+    return peaks
+
+
+def encode_peaks(sample_rate: int, peaks: List[Tuple[int, np.ndarray]]) -> bytes:
+    # Header, then for each level its samples per peak, peak count and
+    # interleaved min/max pairs quantized to signed 8 bits
+    parts = [PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, sample_rate, len(peaks))]
+    for level, level_peaks in peaks:
+        quantized = np.clip(np.round(level_peaks * 127), -127, 127).astype(np.int8)
+        parts.append(PEAKS_LEVEL_HEADER.pack(level, len(level_peaks)))
+        parts.append(quantized.tobytes())
+    return b"".join(parts)
+
+
+def decode_peaks(data: bytes) -> Tuple[int, List[Tuple[int, np.ndarray]]]:
+    magic, version, sample_rate, n_levels = PEAKS_HEADER.unpack_from(data)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("Unsupported waveform peaks data")
+    offset = PEAKS_HEADER.size
+    peaks = []
+    for _ in range(n_levels):
+        level, n_peaks = PEAKS_LEVEL_HEADER.unpack_from(data, offset)
+        offset += PEAKS_LEVEL_HEADER.size
+        level_peaks = np.frombuffer(data, np.int8, n_peaks * 2, offset).reshape(n_peaks, 2)
+        offset += n_peaks * 2
+        peaks.append((level, level_peaks))
+    return sample_rate, peaks
+
+
+def recording_peaks(path: str, levels: List[int]) -> Optional[bytes]:
+    # None for uploads that are not PCM WAV
+    try:
+        info, samples = wav_samples(path)
+    except (ValueError, struct.error):
+        return None
+    return encode_peaks(info.sample_rate, waveform_peaks(samples, levels))
+
+
+def to_float(samples: np.ndarray) -> np.ndarray:
+    # Scale integer PCM to [-1, 1), averaging channels down to mono
+    if samples.dtype == np.uint8:
+        scaled = (samples.astype(np.float32) - 128) / 128
+    else:
+        scaled = samples.astype(np.float32) / float(2 ** (8 * samples.itemsize - 1))
+    return scaled.mean(axis=1)
+
+
+def _frame_blocks(samples: np.ndarray, frame_length: int, block_frames: int):
+    # Converted block by block so memory stays bounded for long recordings
+    n_frames = len(samples) // frame_length
+    for start in range(0, n_frames, block_frames):
+        stop = min(start + block_frames, n_frames)
+        block = to_float(samples[start * frame_length : stop * frame_length])
+        yield start, stop, block.reshape(stop - start, frame_length)
+
+
+def frame_rms(
+    samples: np.ndarray, frame_length: int, block_frames: int = 4096
+) -> np.ndarray:
+    rms = np.empty(len(samples) // frame_length, dtype=np.float32)
+    for start, stop, block in _frame_blocks(samples, frame_length, block_frames):
+        rms[start:stop] = np.sqrt(np.mean(block * block, axis=1))
+    return rms
+
+
+def frame_features(
+    samples: np.ndarray, frame_length: int, block_frames: int = 4096
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Per-frame RMS energy and zero-crossing rate (crossings per sample)
+    n_frames = len(samples) // frame_length
+    rms = np.empty(n_frames, dtype=np.float32)
+    zcr = np.empty(n_frames, dtype=np.float32)
+    for start, stop, block in _frame_blocks(samples, frame_length, block_frames):
+        rms[start:stop] = np.sqrt(np.mean(block * block, axis=1))
+        signs = np.signbit(block)
+        zcr[start:stop] = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return rms, zcr
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+# Bumped whenever speech_regions changes which audio it keeps
+VAD_VERSION = 2
+
+
+def speech_regions(
+    samples: np.ndarray,
+    sample_rate: int,
+    padding_seconds: float = 0.3,
+    min_silence_seconds: float = 0.5,
+    min_speech_seconds: float = 0.1,
+    frame_seconds: float = 0.02,
+    max_noise_floor_dbfs: float = -50.0,
+) -> List[Tuple[int, int]]:
+    # Energy based voice activity detection. Frames well above the
+    # recording's noise floor are voiced speech; quieter frames only count
+    # when their zero-crossing rate marks them as unvoiced consonants.
+    n_samples = len(samples)
+    frame_length = max(1, int(frame_seconds * sample_rate))
+    rms, zcr = frame_features(samples, frame_length)
+    if not len(rms):
+        return []
+    energy = 20 * np.log10(rms + 1e-10)
+    # Without pauses (continuous speech, music) the quietest frames are not
+    # noise at all, so the floor is capped at an absolute level
+    noise_floor = min(np.percentile(energy, 10), max_noise_floor_dbfs)
+    high = max(noise_floor + 12, -40)
+    low = max(noise_floor + 6, -50)
+    speech = (energy > high) | ((energy > low) & (zcr > 0.25))
+
+    starts, stops = _runs(speech)
+    # Isolated clicks and pops are not speech
+    keep = stops - starts >= max(1, int(min_speech_seconds / frame_seconds))
+    starts, stops = starts[keep], stops[keep]
+    if not len(starts):
+        return []
+    padding = int(padding_seconds / frame_seconds)
+    starts = np.maximum(starts - padding, 0)
+    stops = np.minimum(stops + padding, len(rms))
+    # Bridge pauses too short to be worth skipping
+    keep = starts[1:] - stops[:-1] >= int(min_silence_seconds / frame_seconds)
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    stops = np.concatenate((stops[:-1][keep], stops[-1:]))
+
+    regions = [
+        (int(start) * frame_length, int(stop) * frame_length)
+        for start, stop in zip(starts, stops)
+    ]
+    if stops[-1] == len(rms):
+        # Keep the partial frame at the end of the recording
+        regions[-1] = (regions[-1][0], n_samples)
+    return regions
+
+
+def pcm16_mono(samples: np.ndarray, start: int, stop: int) -> bytes:
+    mono = to_float(samples[start:stop])
+    return (np.clip(mono, -1, 1 - 1 / 32768) * 32768).astype("<i2").tobytes()
+
+
+def plan_segments(
+    samples: np.ndarray,
+    sample_rate: int,
+    segment_seconds: float,
+    search_seconds: float,
+    frame_seconds: float = 0.02,
+) -> List[Tuple[int, int]]:
+    # Cut roughly every segment_seconds, moving each cut to the quietest frame
+    # within search_seconds of the target so words are not split mid-way.
+    # Segments never shrink below half of segment_seconds.
+    n_samples = len(samples)
+    segment_length = int(segment_seconds * sample_rate)
+    if n_samples <= segment_length:
+        return [(0, n_samples)]
+    frame_length = max(1, int(frame_seconds * sample_rate))
+    rms = frame_rms(samples, frame_length)
+    search_frames = int(search_seconds * sample_rate) // frame_length
+    half_segment_frames = max(1, segment_length // frame_length // 2)
+
+    cuts = [0]
+    while n_samples - cuts[-1] > segment_length:
+        target = (cuts[-1] + segment_length) // frame_length
+        low = max(cuts[-1] // frame_length + half_segment_frames, target - search_frames)
+        high = min(len(rms), target + search_frames + 1)
+        if low >= high:
+            cut = cuts[-1] + segment_length
+        else:
+            cut = (low + int(np.argmin(rms[low:high]))) * frame_length
+        cuts.append(cut)
+    cuts.append(n_samples)
+    return list(zip(cuts[:-1], cuts[1:]))
@@ -1,23 +1,47 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import List, Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from pydantic import BaseModel
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.future import select
+import hashlib
+import hmac
 import secrets
+import time
 
+from app.cache import TTLCache
+from app.config import (
+    API_KEY_CACHE_SIZE,
+    API_KEY_CACHE_TTL_SECONDS,
+    TOKEN_CACHE_SIZE,
+    SECRET_KEY,
+    TOKEN_CACHE_TTL_SECONDS,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL_SECONDS,
+)
 from app.database import async_session
-from app.models import User as UserModel
+from app.models import ApiKey, RevokedToken, User as UserModel
+from app.passwords import password_hasher, pwd_context
 from app.schemas import UserCreate
 
-SECRET_KEY = "your_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(
+    tokenUrl="/api/v1/auth/token", auto_error=False
+)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+API_KEY_PREFIX = "vcr"
+# Users behind authenticated requests, so most requests skip the database
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+# Claims of verified access tokens, keyed by token digest
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS)
+# Usernames behind API key digests
+api_key_cache = TTLCache(API_KEY_CACHE_SIZE, API_KEY_CACHE_TTL_SECONDS)
 
 class User(BaseModel):
     username: str
@@ -26,7 +50,7 @@ class User(BaseModel):
     disabled: Optional[bool] = None
 
 async def create_user(user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     user_dict = user.model_dump()
     user_dict["hashed_password"] = hashed_password
     del user_dict["password"]
@@ -36,6 +60,7 @@ async def create_user(user: UserCreate):
             session.add(new_user)
             await session.commit()
             await session.refresh(new_user)
+    user_cache.pop(new_user.username)
     return new_user
 
 def verify_password(plain_password, hashed_password):
@@ -50,12 +75,36 @@ async def get_user(username: str):
         user = result.scalars().first()
         return user
 
+async def set_user_disabled(username: str, disabled: bool = True):
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(UserModel)
+                .where(UserModel.username == username)
+                .values(disabled=disabled)
+            )
+    user_cache.pop(username)
+
 async def authenticate_user(username: str, password: str):
     user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(
+        password, user.hashed_password
+    )
+    if not valid:
         return False
+    if new_hash:
+        # The configured bcrypt cost changed since this password was stored
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    update(UserModel)
+                    .where(UserModel.id == user.id)
+                    .values(hashed_password=new_hash)
+                )
+        user.hashed_password = new_hash
+        user_cache.pop(username)
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -68,6 +117,57 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def is_token_revoked(digest: str) -> bool:
+    async with async_session() as session:
+        result = await session.execute(
+            select(RevokedToken.token_digest).where(RevokedToken.token_digest == digest)
+        )
+        return result.first() is not None
+
+async def _verify_token(token: str, digest: str) -> dict:
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if await is_token_revoked(digest):
+        raise JWTError("Token has been revoked")
+    return claims
+
+def _token_ttl(claims: dict) -> Optional[float]:
+    return claims["exp"] - time.time() if "exp" in claims else None
+
+async def decode_token(token: str) -> dict:
+    # The signature and revocation list are checked once per token; later
+    # requests reuse the claims until the token expires. Loading through the
+    # cache lets revoke_token discard a check that is still in flight.
+    return await token_cache.get_or_load(
+        token_digest(token),
+        lambda digest: _verify_token(token, digest),
+        ttl=_token_ttl,
+    )
+
+async def revoke_token(token: str):
+    claims = await decode_token(token)
+    digest = token_digest(token)
+    now = datetime.now(timezone.utc)
+    expires_at = (
+        datetime.fromtimestamp(claims["exp"], timezone.utc)
+        if "exp" in claims
+        else now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                insert(RevokedToken)
+                .values(token_digest=digest, expires_at=expires_at, revoked_at=now)
+                .on_conflict_do_nothing(index_elements=["token_digest"])
+            )
+            # Expired tokens are rejected anyway, so their entries can go
+            await session.execute(
+                delete(RevokedToken).where(RevokedToken.expires_at < now)
+            )
+    token_cache.pop(digest)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -75,19 +175,110 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = await decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = await get_user(username=token_data.username)
+    user = await user_cache.get_or_load(token_data.username, get_user)
     if user is None:
         raise credentials_exception
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+def api_key_digest(key: str) -> str:
+    # Keys carry 256 random bits, so the digest alone cannot be reversed
+    return hmac.new(SECRET_KEY.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+async def create_api_key(user: UserModel, name: Optional[str] = None):
+    # The key itself is only returned here; it cannot be recovered later
+    prefix = secrets.token_hex(4)
+    key = f"{API_KEY_PREFIX}_{prefix}_{secrets.token_urlsafe(32)}"
+    api_key = ApiKey(
+        user_id=user.id, name=name, prefix=prefix, key_digest=api_key_digest(key)
+    )
+    async with async_session() as session:
+        async with session.begin():
+            session.add(api_key)
+        await session.refresh(api_key)
+    return api_key, key
+
+async def list_api_keys(user: UserModel) -> List[ApiKey]:
+    async with async_session() as session:
+        result = await session.execute(
+            select(ApiKey).where(ApiKey.user_id == user.id).order_by(ApiKey.id)
+        )
+        return result.scalars().all()
+
+async def revoke_api_key(user: UserModel, key_id: int) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            api_key = (
+                await session.execute(
+                    select(ApiKey).where(
+                        ApiKey.id == key_id,
+                        ApiKey.user_id == user.id,
+                        ApiKey.revoked_at.is_(None),
+                    )
+                )
+            ).scalar_one_or_none()
+            if api_key is None:
+                return False
+            api_key.revoked_at = datetime.now(timezone.utc)
+            digest = api_key.key_digest
+    api_key_cache.pop(digest)
+    return True
+
+async def _api_key_username(digest: str) -> Optional[str]:
+    async with async_session() as session:
+        row = (
+            await session.execute(
+                select(ApiKey.key_digest, UserModel.username)
+                .join(UserModel, UserModel.id == ApiKey.user_id)
+                .where(ApiKey.key_digest == digest, ApiKey.revoked_at.is_(None))
+            )
+        ).first()
+    if row is None or not hmac.compare_digest(row.key_digest, digest):
+        return None
+    return row.username
+
+async def get_api_key_user(key: str):
+    # Keys resolve to a username, and the user itself comes from the user
+    # cache so disabling an account applies to its keys too
+    username = await api_key_cache.get_or_load(api_key_digest(key), _api_key_username)
+    if username is None:
+        return None
+    return await user_cache.get_or_load(username, get_user)
+
+async def get_request_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    api_key: Optional[str] = Depends(api_key_header),
+):
+    # Machine clients send an X-API-Key header instead of a bearer token
+    if api_key:
+        user = await get_api_key_user(api_key)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key"
+            )
+        return user
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token)
+
+async def get_current_active_user(current_user: User = Depends(get_request_user)):
+    if current_user.disabled:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+async def get_interactive_user(current_user: User = Depends(get_current_user)):
+    # Bearer tokens only: a leaked API key must not be able to mint keys that
+    # outlive its own revocation
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
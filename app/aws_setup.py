@@ -21,9 +21,11 @@ except (NoCredentialsError, PartialCredentialsError) as e:
     logger.error(f"Credentials error: {e}")
     raise
 
-def upload_file_to_s3(file_path, bucket_name, s3_file_name):
+def upload_file_to_s3(file_path, bucket_name, s3_file_name, client=None, config=None):
     try:
-        s3_client.upload_file(file_path, bucket_name, s3_file_name)
+        (client or s3_client).upload_file(
+            file_path, bucket_name, s3_file_name, Config=config
+        )
         logger.info(f"File {file_path} uploaded to S3 bucket {bucket_name} as {s3_file_name}")
         return f"https://{bucket_name}.s3.amazonaws.com/{s3_file_name}"
     except (FileNotFoundError, NoCredentialsError, ClientError) as e:
@@ -32,3 +34,22 @@ def upload_file_to_s3(file_path, bucket_name, s3_file_name):
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
         raise
+
+def download_file_from_s3(bucket_name, s3_file_name, file_path, client=None):
+    try:
+        (client or s3_client).download_file(bucket_name, s3_file_name, file_path)
+        logger.info(f"File {s3_file_name} downloaded from S3 bucket {bucket_name}")
+    except ClientError as e:
+        logger.error(f"Error downloading file: {e}")
+        raise
+
+def get_s3_object(bucket_name, s3_file_name, byte_range=None, client=None):
+    # Returns the GetObject response; its Body is streamed by the caller
+    kwargs = {"Range": byte_range} if byte_range else {}
+    try:
+        return (client or s3_client).get_object(
+            Bucket=bucket_name, Key=s3_file_name, **kwargs
+        )
+    except ClientError as e:
+        logger.error(f"Error reading file from S3: {e}")
+        raise
@@ -0,0 +1,139 @@
+# cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self._items.pop(key, default)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TTLCache(LRUCache):
+    # LRU cache whose entries also expire ttl seconds after they were stored
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.clock = clock
+        self.expirations = 0
+        self.loads = 0
+        self._loading = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            self._items.pop(key, None)
+            self.hits -= 1
+            self.misses += 1
+            self.expirations += 1
+            return default
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: float = None):
+        # ttl may shorten the lifetime of a single entry
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        super().put(key, (self.clock() + ttl, value))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        # Also detaches a load in flight so its result is not stored
+        self._loading.pop(key, None)
+        entry = super().pop(key)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._loading.clear()
+        super().clear()
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        load: Callable[[Hashable], Awaitable[Any]],
+        ttl: Callable[[Any], Optional[float]] = None,
+    ) -> Any:
+        # Concurrent misses for one key share a single load; None results
+        # are returned but not cached. ttl, given the loaded value, may
+        # shorten how long it is kept.
+        value = self.get(key)
+        if value is not None:
+            return value
+        future = self._loading.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(key, load, ttl))
+            self._loading[key] = future
+        return await asyncio.shield(future)
+
+    async def _load(
+        self,
+        key: Hashable,
+        load: Callable[[Hashable], Awaitable[Any]],
+        ttl: Callable[[Any], Optional[float]] = None,
+    ) -> Any:
+        self.loads += 1
+        task = asyncio.current_task()
+        try:
+            value = await load(key)
+        except BaseException:
+            if self._loading.get(key) is task:
+                del self._loading[key]
+            raise
+        if self._loading.get(key) is task:
+            del self._loading[key]
+            if value is not None:
+                self.put(key, value, ttl=ttl(value) if ttl else None)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "ttl": self.ttl,
+            "expirations": self.expirations,
+            "loads": self.loads,
+            "loading": len(self._loading),
+        }
@@ -0,0 +1,14 @@
+# caller_id.py
+import re
+
+
+def caller_id_digits(caller_id: str):
+    return re.sub(r"\D", "", caller_id or "") or None
+
+
+def normalize_caller_id(caller_id: str):
+    # E.164 digits only: drop formatting, the leading + and a 00 exit code
+    digits = caller_id_digits(caller_id) or ""
+    if digits.startswith("00"):
+        digits = digits[2:]
+    return digits or None
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,6 +11,126 @@ if not os.path.exists(LOG_DIR):
 DATABASE_URL = "sqlite+aiosqlite:///./vonage_call_recording.db"
 LOG_FILE = os.path.join(LOG_DIR, "file_{time}.log")
 
+# Local spool for recordings in flight (uploads, downloads, transcoding)
+SPOOL_DIR = os.getenv(
+    "SPOOL_DIR", os.path.join(tempfile.gettempdir(), "vonage_call_recording")
+)
+SPOOL_CHUNK_SIZE = int(os.getenv("SPOOL_CHUNK_SIZE", 1024 * 1024))
+
+# Local cache of downloaded recordings, kept next to the spool so moving a
+# finished download into it is a rename
+RECORDING_CACHE_DIR = os.getenv(
+    "RECORDING_CACHE_DIR", os.path.join(SPOOL_DIR, "recordings")
+)
+RECORDING_CACHE_MAX_BYTES = int(
+    os.getenv("RECORDING_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+)
+
+# S3 uploads
+S3_MAX_CONCURRENT_UPLOADS = int(os.getenv("S3_MAX_CONCURRENT_UPLOADS", 4))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024))
+S3_MULTIPART_MAX_CONCURRENCY = int(os.getenv("S3_MULTIPART_MAX_CONCURRENCY", 4))
+
+# Presigned recording URLs
+PRESIGNED_URL_TTL_SECONDS = int(os.getenv("PRESIGNED_URL_TTL_SECONDS", 3600))
+PRESIGNED_URL_REFRESH_SECONDS = int(os.getenv("PRESIGNED_URL_REFRESH_SECONDS", 300))
+PRESIGNED_URL_CACHE_SIZE = int(os.getenv("PRESIGNED_URL_CACHE_SIZE", 10000))
+
+# Recording downloads
+FETCH_MAX_CONCURRENT_DOWNLOADS = int(os.getenv("FETCH_MAX_CONCURRENT_DOWNLOADS", 4))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", 10))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", 30))
+FETCH_MAX_ATTEMPTS = int(os.getenv("FETCH_MAX_ATTEMPTS", 4))
+FETCH_RETRY_BASE_SECONDS = float(os.getenv("FETCH_RETRY_BASE_SECONDS", 0.5))
+FETCH_RETRY_MAX_SECONDS = float(os.getenv("FETCH_RETRY_MAX_SECONDS", 10))
+FETCH_MAX_REDIRECTS = int(os.getenv("FETCH_MAX_REDIRECTS", 5))
+# Recording URLs arrive on unauthenticated webhooks, so only these hosts are
+# fetched and sent Vonage credentials; "*." matches any subdomain
+VONAGE_RECORDING_HOSTS = [
+    host.strip().lower()
+    for host in os.getenv(
+        "VONAGE_RECORDING_HOSTS", "api.nexmo.com,*.vonage.com,*.nexmo.com"
+    ).split(",")
+    if host.strip()
+]
+
+# Most hourly or daily buckets one analytics request may span
+ANALYTICS_MAX_BUCKETS = int(os.getenv("ANALYTICS_MAX_BUCKETS", 10000))
+
+# Background transcription jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", 5))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", 600))
+
+# Speech recognition
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", os.cpu_count() or 1))
+TRANSCRIPTION_SEGMENT_SECONDS = float(os.getenv("TRANSCRIPTION_SEGMENT_SECONDS", 30))
+TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS = float(
+    os.getenv("TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS", 0.5)
+)
+TRANSCRIPTION_SILENCE_SEARCH_SECONDS = float(
+    os.getenv("TRANSCRIPTION_SILENCE_SEARCH_SECONDS", 5)
+)
+TRANSCRIPTION_VAD_ENABLED = os.getenv("TRANSCRIPTION_VAD_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+TRANSCRIPTION_VAD_PADDING_SECONDS = float(
+    os.getenv("TRANSCRIPTION_VAD_PADDING_SECONDS", 0.3)
+)
+TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS = float(
+    os.getenv("TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS", 0.5)
+)
+
+# Waveform peaks for playback UIs, as samples per peak at each zoom level
+WAVEFORM_PEAK_LEVELS = sorted(
+    int(level) for level in os.getenv("WAVEFORM_PEAK_LEVELS", "256,1024,4096,16384").split(",")
+)
+
+# Archival compression of recordings before they are stored in S3
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "flac")
+ARCHIVE_FLAC_LEVEL = int(os.getenv("ARCHIVE_FLAC_LEVEL", 5))
+ARCHIVE_OPUS_BITRATE = int(os.getenv("ARCHIVE_OPUS_BITRATE", 24000))
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", os.cpu_count() or 1))
+
+# Translation
+TRANSLATION_LANGUAGES = [
+    language.strip()
+    for language in os.getenv("TRANSLATION_LANGUAGES", "es").split(",")
+    if language.strip()
+]
+TRANSLATION_CLIENT = os.getenv("TRANSLATION_CLIENT", "google")
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", 32))
+TRANSLATION_BATCH_MAX_CHARS = int(os.getenv("TRANSLATION_BATCH_MAX_CHARS", 4500))
+TRANSLATION_BATCH_WAIT_SECONDS = float(
+    os.getenv("TRANSLATION_BATCH_WAIT_SECONDS", 0.05)
+)
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", 4096))
+
+# Password hashing
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_QUEUE_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_QUEUE_TIMEOUT_SECONDS", 2))
+
+# Authenticated user lookups
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 30))
+# Signs access tokens and keys API key digests; set it in production, since
+# tokens and API keys stop working whenever it changes
+SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
+
+# Verified access tokens are cached until they expire, but at most this long
+# so revocations made by other processes are picked up
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 60))
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", 4096))
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", 60))
+
 # Vonage API credentials
 VONAGE_API_KEY = os.getenv("VONAGE_API_KEY")
 VONAGE_API_SECRET = os.getenv("VONAGE_API_SECRET")
@@ -1,25 +1,63 @@
 # crud.py
+import asyncio
+import base64
+import html
 import os
+import re
 import uuid
+from datetime import datetime, timezone
+from functools import partial
 
-from sqlalchemy import func
+from botocore.exceptions import ClientError
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import column, false, func, literal_column, table, tuple_
+from sqlalchemy.dialects.sqlite import insert
 from sqlmodel import select, delete
 
-from app.aws_setup import upload_file_to_s3, AWS_BUCKET_NAME
-from app.database import async_session
-from app.enums import CallStatus
-from app.models import CallState
+from app.audio import AudioMetadata, analyze_recording, recording_peaks
+from app.aws_setup import AWS_BUCKET_NAME, download_file_from_s3, get_s3_object
+from app.caller_id import caller_id_digits, normalize_caller_id
+from app.config import WAVEFORM_PEAK_LEVELS
+from app.database import CALL_TRANSCRIPT_FTS_TABLE, async_session
+from app.enums import BucketGranularity, CallerMatch, CallStatus
+from app.models import CallState, CallStatsBucket, DashboardRollup, WaveformPeaks
+from app.rollups import (
+    ROLLUP_ID,
+    apply_rollup_delta,
+    as_utc,
+    bucket_start,
+    rollup_delta,
+)
+from app.recording_cache import recording_cache
+from app.spool import create_spool_file, remove_spool_file, spooled_upload
+from app.transcode import (
+    CODEC_SUFFIXES,
+    ORIGINAL_CODEC,
+    archive_suffix,
+    decode_file,
+    transcoder,
+)
+from app.transcript_cache import file_digest
+from app.uploader import s3_uploader
 
 
-async def create_call_state(call_uuid: str, status: str):
+async def create_call_state(call_uuid: str, status: str) -> bool:
+    # One statement whether or not the call is already known; concurrent
+    # webhooks for the same call race on the unique uuid index, and only the
+    # one that inserted the row counts it in the rollups
+    created_at = datetime.now(timezone.utc)
     async with async_session() as session:
         async with session.begin():
-            existing_call_state = await session.execute(
-                select(CallState).where(CallState.uuid == call_uuid)
+            result = await session.execute(
+                insert(CallState)
+                .values(uuid=call_uuid, status=status, created_at=created_at)
+                .on_conflict_do_nothing(index_elements=["uuid"])
+                .returning(CallState.id)
             )
-            if existing_call_state.scalar_one_or_none() is None:
-                call_state = CallState(uuid=call_uuid, status=status)
-                session.add(call_state)
+            if result.scalar() is None:
+                return False
+            await apply_rollup_delta(session, rollup_delta(None, (status, None)), created_at)
+    return True
 
 async def get_call_state(call_uuid: str):
     async with async_session() as session:
@@ -30,36 +68,217 @@ async def get_call_state(call_uuid: str):
 async def delete_call_state(call_uuid: str):
     async with async_session() as session:
         async with session.begin():
+            result = await session.execute(
+                select(
+                    CallState.status, CallState.duration, CallState.created_at
+                ).where(CallState.uuid == call_uuid)
+            )
+            for status, duration, created_at in result.all():
+                await apply_rollup_delta(
+                    session, rollup_delta((status, duration), None), created_at
+                )
             await session.execute(delete(CallState).where(CallState.uuid == call_uuid))
 
+async def set_call_status(call_uuid: str, status: str):
+    async with async_session() as session:
+        async with session.begin():
+            call_state = (
+                await session.execute(select(CallState).where(CallState.uuid == call_uuid))
+            ).scalar_one_or_none()
+            if call_state is None or call_state.status == status:
+                return
+            await apply_rollup_delta(
+                session,
+                rollup_delta(
+                    (call_state.status, call_state.duration),
+                    (status, call_state.duration),
+                ),
+                call_state.created_at,
+            )
+            call_state.status = status
+            session.add(call_state)
+
 async def get_all_call_states():
     async with async_session() as session:
         async with session.begin():
             result = await session.execute(select(CallState))
             return result.scalars().all()
 
-async def search_call_states(search: str, page: int, limit: int):
+async def get_dashboard_rollup():
+    async with async_session() as session:
+        return await session.get(DashboardRollup, ROLLUP_ID)
+
+async def get_stats_buckets(
+    granularity: BucketGranularity, start: datetime, end: datetime
+):
+    async with async_session() as session:
+        result = await session.execute(
+            select(CallStatsBucket)
+            .where(
+                CallStatsBucket.granularity == granularity.value,
+                CallStatsBucket.bucket_start >= bucket_start(start, granularity),
+                CallStatsBucket.bucket_start < as_utc(end),
+            )
+            .order_by(CallStatsBucket.bucket_start)
+        )
+        return result.scalars().all()
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(call_state: CallState) -> str:
+    raw = f"{call_state.created_at.isoformat()}|{call_state.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, call_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        )
+        return datetime.fromisoformat(created_at), int(call_id)
+    except ValueError as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+def _digits_range(column, digits: str):
+    # ":" sorts right after "9", so this is a "starts with" the index can seek
+    return [column >= digits, column < digits + ":"]
+
+def caller_id_filters(search: str, match: CallerMatch = None):
+    if match is None:
+        return [func.coalesce(CallState.caller_id, "").like(f"%{search}%")]
+    if match == CallerMatch.SUFFIX:
+        # The end of a number has no exit code; "0018" must stay "0018"
+        digits = caller_id_digits(search)
+    else:
+        digits = normalize_caller_id(search)
+    if digits is None:
+        return [false()]
+    if match == CallerMatch.EXACT:
+        return [CallState.caller_digits == digits]
+    if match == CallerMatch.PREFIX:
+        return _digits_range(CallState.caller_digits, digits)
+    return _digits_range(CallState.caller_digits_reversed, digits[::-1])
+
+async def search_call_states(
+    search: str, page: int, limit: int, cursor: str = None, match: CallerMatch = None
+):
+    filters = caller_id_filters(search, match) if search else []
+
+    query = (
+        select(CallState)
+        .where(*filters)
+        .order_by(CallState.created_at.desc(), CallState.id.desc())
+        .limit(limit)
+    )
+    if cursor:
+        # Keyset pagination: seek past the last row of the previous page so
+        # deep pages use the (created_at, id) index instead of an OFFSET scan.
+        created_at, call_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(CallState.created_at, CallState.id) < tuple_(created_at, call_id)
+        )
+    else:
+        query = query.offset((page - 1) * limit)
+
+    count_query = select(func.count()).select_from(CallState).where(*filters)
+
     async with async_session() as session:
         async with session.begin():
-            query = select(CallState)
-            if search:
-                query = query.where(
-                    func.coalesce(CallState.caller_id, "").like(f"%{search}%")
-                )
             result = await session.execute(query)
-            call_states = result.scalars().all()
-            total = len(call_states)
-            start = (page - 1) * limit
-            end = start + limit
-            paginated_call_states = call_states[start:end]
+            paginated_call_states = result.scalars().all()
+            total = (await session.execute(count_query)).scalar_one()
             return paginated_call_states, total
 
-async def create_recording_file(audio, caller_id: str, duration: int):
-    filename = f"{uuid.uuid4()}.wav"
-    with open(filename, "wb") as buffer:
-        buffer.write(audio.file.read())
+def build_fts_query(search: str) -> str:
+    # Quote every term so user input can never be parsed as FTS5 syntax;
+    # a trailing * on a term is kept as a prefix search.
+    terms = [
+        f'"{word}"*' if star else f'"{word}"'
+        for word, star in re.findall(r"(\w+)(\*?)", search)
+    ]
+    if not terms:
+        raise ValueError("Search query has no searchable terms")
+    return " ".join(terms)
 
-    s3_url = upload_file_to_s3(filename, AWS_BUCKET_NAME, filename)
+# Control characters that never occur in transcripts mark the matches until
+# the snippet has been escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+def highlight_snippet(snippet: str):
+    # The transcript text is escaped before the markers become <mark> tags,
+    # so snippets are safe to render as HTML
+    if snippet is None:
+        return None
+    return (
+        html.escape(snippet)
+        .replace(MATCH_START, "<mark>")
+        .replace(MATCH_END, "</mark>")
+    )
+
+async def search_transcripts(search: str, page: int, limit: int):
+    match = build_fts_query(search)
+    fts = table(CALL_TRANSCRIPT_FTS_TABLE, column("rowid"))
+    fts_column = literal_column(CALL_TRANSCRIPT_FTS_TABLE)
+    rank = func.bm25(fts_column)
+    query = (
+        select(
+            CallState,
+            func.snippet(fts_column, 0, MATCH_START, MATCH_END, "…", 12),
+            func.snippet(fts_column, 1, MATCH_START, MATCH_END, "…", 12),
+            rank,
+        )
+        .join(fts, fts.c.rowid == CallState.id)
+        .where(fts_column.op("MATCH")(match))
+        .order_by(rank)
+        .limit(limit)
+        .offset((page - 1) * limit)
+    )
+    count_query = (
+        select(func.count()).select_from(fts).where(fts_column.op("MATCH")(match))
+    )
+
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(query)
+            matches = [
+                (call, highlight_snippet(transcript), highlight_snippet(translation), rank)
+                for call, transcript, translation, rank in result.all()
+            ]
+            total = (await session.execute(count_query)).scalar_one()
+            return matches, total
+
+def metadata_fields(metadata: AudioMetadata) -> dict:
+    if metadata is None:
+        return {}
+    return {
+        "duration": round(metadata.duration),
+        "sample_rate": metadata.sample_rate,
+        "channels": metadata.channels,
+        "loudness_dbfs": metadata.loudness_dbfs,
+        "clipping_ratio": metadata.clipping_ratio,
+    }
+
+async def create_recording_file(audio, caller_id: str, duration: int = None):
+    async with spooled_upload(audio, suffix=".wav") as path:
+        content_hash, transcoded, metadata, peaks = await asyncio.gather(
+            run_in_threadpool(file_digest, path),
+            transcoder.transcode(path),
+            run_in_threadpool(analyze_recording, path),
+            run_in_threadpool(recording_peaks, path, WAVEFORM_PEAK_LEVELS),
+        )
+        suffix = archive_suffix(transcoded.codec, getattr(audio, "filename", None))
+        filename = f"{uuid.uuid4()}{suffix}"
+        try:
+            s3_url = await s3_uploader.upload(transcoded.path, filename)
+        finally:
+            if transcoded.path != path:
+                await run_in_threadpool(remove_spool_file, transcoded.path)
+        # The spool file is moved into the recording cache for later playback
+        await run_in_threadpool(recording_cache.add, content_hash, path, True)
+    caller_digits = normalize_caller_id(caller_id)
+    # The duration measured from the audio wins over the one the client sent
+    measured = {"duration": duration, **metadata_fields(metadata)}
 
     async with async_session() as session:
         async with session.begin():
@@ -67,10 +286,93 @@ async def create_recording_file(audio, caller_id: str, duration: int):
                 uuid=str(uuid.uuid4()),
                 status=CallStatus.COMPLETED.value,
                 caller_id=caller_id,
-                duration=duration,
+                caller_digits=caller_digits,
+                caller_digits_reversed=caller_digits[::-1] if caller_digits else None,
                 recording_url=s3_url,
+                recording_key=filename,
+                recording_hash=content_hash,
+                archive_codec=transcoded.codec,
+                archive_bitrate=transcoded.bitrate,
+                archive_size=transcoded.size,
+                **measured,
             )
             session.add(new_call)
+            await store_waveform_peaks(session, content_hash, peaks)
+            await apply_rollup_delta(
+                session,
+                rollup_delta(None, (new_call.status, new_call.duration)),
+                new_call.created_at,
+            )
 
-    os.remove(filename)
     return new_call.uuid
+
+async def store_waveform_peaks(session, content_hash: str, data: bytes):
+    # Peaks depend only on the audio, so a known recording keeps its own
+    if data is None:
+        return
+    await session.execute(
+        insert(WaveformPeaks)
+        .values(content_hash=content_hash, data=data)
+        .on_conflict_do_nothing(index_elements=["content_hash"])
+    )
+
+async def has_waveform_peaks(content_hash: str) -> bool:
+    async with async_session() as session:
+        result = await session.execute(
+            select(WaveformPeaks.content_hash).where(
+                WaveformPeaks.content_hash == content_hash
+            )
+        )
+        return result.first() is not None
+
+async def get_waveform_peaks(call_uuid: str):
+    async with async_session() as session:
+        result = await session.execute(
+            select(WaveformPeaks.content_hash, WaveformPeaks.data)
+            .join(CallState, CallState.recording_hash == WaveformPeaks.content_hash)
+            .where(CallState.uuid == call_uuid)
+            .limit(1)
+        )
+        return result.first()
+
+def pin_recording(content_hash: str):
+    # Keeps the cached recording from being evicted and unlinked while it is
+    # served; the returned function releases it
+    recording_cache.pin(content_hash)
+    return partial(recording_cache.unpin, content_hash)
+
+async def lookup_recording(content_hash: str):
+    return await run_in_threadpool(recording_cache.lookup, content_hash)
+
+def restore_recording(recording_key: str, archive_codec: str, file_path: str):
+    if archive_codec in (None, "wav", ORIGINAL_CODEC):
+        download_file_from_s3(AWS_BUCKET_NAME, recording_key, file_path)
+        return
+    # Compressed archives are decoded back to WAV for playback
+    fd, archive_path = create_spool_file(CODEC_SUFFIXES[archive_codec])
+    os.close(fd)
+    try:
+        download_file_from_s3(AWS_BUCKET_NAME, recording_key, archive_path)
+        decode_file(archive_codec, archive_path, file_path)
+    finally:
+        remove_spool_file(archive_path)
+
+async def fill_recording_from_s3(
+    content_hash: str, recording_key: str, archive_codec: str = None
+):
+    # Downloaded straight into the cache so the next request is served locally
+    return await run_in_threadpool(
+        recording_cache.add_from,
+        content_hash,
+        partial(restore_recording, recording_key, archive_codec),
+    )
+
+async def open_recording_range(recording_key: str, byte_range: str):
+    try:
+        return await run_in_threadpool(
+            get_s3_object, AWS_BUCKET_NAME, recording_key, byte_range
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "InvalidRange":
+            raise ValueError("Requested range not satisfiable")
+        raise
@@ -1,16 +1,174 @@
 # database.py
+from contextlib import asynccontextmanager
+
+from loguru import logger
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
 
+from app.caller_id import normalize_caller_id
 from app.config import DATABASE_URL
-from app.models import User
+from app.models import CallState, TranscriptCacheEntry, TranscriptionJob, User
 
 # Database setup
 engine = create_async_engine(DATABASE_URL, echo=True)
 async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
+# External-content FTS5 index over call transcripts, kept in sync by triggers
+CALL_TRANSCRIPT_FTS_TABLE = f"{CallState.__tablename__}_fts"
+CALL_TRANSCRIPT_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE {CALL_TRANSCRIPT_FTS_TABLE} USING fts5(
+        transcript, translation,
+        content='{CallState.__tablename__}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CALL_TRANSCRIPT_FTS_TABLE}_ai
+    AFTER INSERT ON {CallState.__tablename__} BEGIN
+        INSERT INTO {CALL_TRANSCRIPT_FTS_TABLE}(rowid, transcript, translation)
+        VALUES (new.id, new.transcript, new.translation);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CALL_TRANSCRIPT_FTS_TABLE}_ad
+    AFTER DELETE ON {CallState.__tablename__} BEGIN
+        INSERT INTO {CALL_TRANSCRIPT_FTS_TABLE}({CALL_TRANSCRIPT_FTS_TABLE}, rowid, transcript, translation)
+        VALUES ('delete', old.id, old.transcript, old.translation);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CALL_TRANSCRIPT_FTS_TABLE}_au
+    AFTER UPDATE OF transcript, translation ON {CallState.__tablename__} BEGIN
+        INSERT INTO {CALL_TRANSCRIPT_FTS_TABLE}({CALL_TRANSCRIPT_FTS_TABLE}, rowid, transcript, translation)
+        VALUES ('delete', old.id, old.transcript, old.translation);
+        INSERT INTO {CALL_TRANSCRIPT_FTS_TABLE}(rowid, transcript, translation)
+        VALUES (new.id, new.transcript, new.translation);
+    END""",
+]
+
 
 async def init_db():
-    async with engine.begin() as conn:
+    # Imported here because app.rollups builds on this module
+    from app.rollups import init_rollups
+
+    async with write_transaction() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await init_caller_digits(conn)
+        await add_missing_columns(conn, TranscriptionJob, ["lease_token"])
+        await add_missing_columns(conn, CallState, ["transcript_segments"])
+        await add_missing_columns(conn, CallState, ["speech_ratio"])
+        await add_missing_columns(conn, CallState, ["recording_key", "recording_hash"])
+        for model in (CallState, TranscriptCacheEntry):
+            await add_missing_columns(
+                conn, model, ["archive_codec", "archive_bitrate", "archive_size"]
+            )
+        await add_missing_columns(
+            conn,
+            CallState,
+            ["sample_rate", "channels", "loudness_dbfs", "clipping_ratio"],
+        )
+        merged = await init_call_state_uuid_index(conn)
+        await add_missing_indexes(conn, CallState)
+        await init_transcript_search(conn)
+        # Counters that included merged duplicates are recomputed along with
+        # the merge
+        await init_rollups(conn, rebuild=bool(merged))
+
+
+@asynccontextmanager
+async def write_transaction(bind=engine):
+    # BEGIN IMMEDIATE takes SQLite's write lock before the first read, so no
+    # other writer can commit between what the transaction reads and writes
+    async with bind.begin() as conn:
+        await conn.exec_driver_sql("BEGIN IMMEDIATE")
+        yield conn
+
+
+async def add_missing_columns(conn, model, names):
+    # create_all never alters a table that already exists, so columns added
+    # to a model later are added here, along with their indexes
+    table = model.__table__
+    result = await conn.exec_driver_sql(f"PRAGMA table_info('{table.name}')")
+    existing = {row[1] for row in result.all()}
+    added = [name for name in names if name not in existing]
+    for name in added:
+        column_type = table.c[name].type.compile(dialect=conn.dialect)
+        await conn.exec_driver_sql(
+            f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"
+        )
+    for index in table.indexes:
+        if any(name in index.columns for name in added):
+            await conn.run_sync(index.create, checkfirst=True)
+    return added
+
+
+async def add_missing_indexes(conn, model):
+    # Indexes added to a model after its table was created, such as the one
+    # keyset pagination walks, are likewise skipped by create_all
+    for index in model.__table__.indexes:
+        await conn.run_sync(index.create, checkfirst=True)
+
+
+async def init_caller_digits(conn):
+    if not await add_missing_columns(
+        conn, CallState, ["caller_digits", "caller_digits_reversed"]
+    ):
+        return
+    # Calls stored before the columns existed would never match a prefix or
+    # suffix search without their digits
+    table = CallState.__tablename__
+    result = await conn.exec_driver_sql(
+        f"SELECT id, caller_id FROM {table} WHERE caller_id IS NOT NULL"
+    )
+    rows = [
+        (digits, digits[::-1], call_id)
+        for call_id, caller_id in result.all()
+        if (digits := normalize_caller_id(caller_id))
+    ]
+    if rows:
+        await conn.exec_driver_sql(
+            f"UPDATE {table} SET caller_digits = ?, caller_digits_reversed = ? WHERE id = ?",
+            rows,
+        )
+    logger.info(f"Backfilled caller digits for {len(rows)} call states")
+
+
+async def init_call_state_uuid_index(conn) -> list:
+    # Databases created before CallState.uuid was unique have a plain index
+    # under the same name, which create_all leaves alone
+    table = CallState.__tablename__
+    index = f"ix_{table}_uuid"
+    result = await conn.exec_driver_sql(f"PRAGMA index_list('{table}')")
+    if any(row[1] == index and row[2] for row in result.all()):
+        return []
+    result = await conn.exec_driver_sql(
+        f"SELECT uuid FROM {table} GROUP BY uuid HAVING COUNT(*) > 1"
+    )
+    duplicates = [row[0] for row in result.all()]
+    if duplicates:
+        # Each call keeps the row that holds its recording and transcript
+        await conn.exec_driver_sql(
+            f"""DELETE FROM {table} WHERE id NOT IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY uuid
+                        ORDER BY recording_hash IS NULL, transcript IS NULL, id
+                    ) AS position
+                    FROM {table}
+                ) WHERE position = 1
+            )"""
+        )
+        logger.warning(f"Merged duplicate call states for uuids: {duplicates}")
+    await conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+    await conn.exec_driver_sql(f"CREATE UNIQUE INDEX {index} ON {table} (uuid)")
+    return duplicates
+
+
+async def init_transcript_search(conn):
+    result = await conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (CALL_TRANSCRIPT_FTS_TABLE,),
+    )
+    if result.first() is not None:
+        return
+    for statement in CALL_TRANSCRIPT_FTS_DDL:
+        await conn.exec_driver_sql(statement)
+    # Index transcripts that were written before the FTS table existed
+    await conn.exec_driver_sql(
+        f"INSERT INTO {CALL_TRANSCRIPT_FTS_TABLE}({CALL_TRANSCRIPT_FTS_TABLE}) VALUES ('rebuild')"
+    )
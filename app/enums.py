@@ -4,4 +4,21 @@ from enum import Enum
 class CallStatus(Enum):
     RECORDING = "recording"
     COMPLETED = "completed"
-    FAILED = "failed"
\ No newline at end of file
+    FAILED = "failed"
+
+class BucketGranularity(Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+
+class CallerMatch(Enum):
+    PREFIX = "prefix"
+    SUFFIX = "suffix"
+    EXACT = "exact"
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
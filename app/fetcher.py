@@ -0,0 +1,206 @@
+# fetcher.py
+import asyncio
+import os
+import random
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.config import (
+    FETCH_MAX_ATTEMPTS,
+    FETCH_MAX_CONCURRENT_DOWNLOADS,
+    FETCH_MAX_CONNECTIONS,
+    FETCH_MAX_REDIRECTS,
+    FETCH_RETRY_BASE_SECONDS,
+    FETCH_RETRY_MAX_SECONDS,
+    FETCH_TIMEOUT_SECONDS,
+    SPOOL_CHUNK_SIZE,
+    VONAGE_RECORDING_HOSTS,
+)
+from app.spool import create_spool_file, remove_spool_file
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_remote(url: str) -> bool:
+    return urlparse(url).scheme in ("http", "https")
+
+
+class UntrustedRecordingURL(ValueError):
+    pass
+
+
+def is_allowed_host(url: str, allowed_hosts=VONAGE_RECORDING_HOSTS) -> bool:
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme != "https" or not host:
+        return False
+    for pattern in allowed_hosts:
+        if pattern.startswith("*."):
+            if host.endswith(pattern[1:]):
+                return True
+        elif host == pattern:
+            return True
+    return False
+
+
+def vonage_auth_header(auth) -> str:
+    # Recording URLs belonging to a Vonage application need a signed JWT;
+    # account credentials fall back to basic auth.
+    if auth.application_id:
+        return auth.create_jwt_auth_string().decode()
+    return auth.create_basic_auth_string()
+
+
+class RecordingFetcher:
+    def __init__(
+        self,
+        auth=None,
+        max_downloads: int = FETCH_MAX_CONCURRENT_DOWNLOADS,
+        max_connections: int = FETCH_MAX_CONNECTIONS,
+        timeout: float = FETCH_TIMEOUT_SECONDS,
+        max_attempts: int = FETCH_MAX_ATTEMPTS,
+        retry_base: float = FETCH_RETRY_BASE_SECONDS,
+        retry_max: float = FETCH_RETRY_MAX_SECONDS,
+        max_redirects: int = FETCH_MAX_REDIRECTS,
+        allowed_hosts=VONAGE_RECORDING_HOSTS,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.auth = auth
+        self.max_downloads = max_downloads
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_redirects = max_redirects
+        self.allowed_hosts = allowed_hosts
+        self.transport = transport
+        # Created on first use so they bind to the running event loop
+        self._client = None
+        self._semaphore = None
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes_downloaded = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # One keep-alive pool shared by every download
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=self.timeout,
+                # Redirects are followed in _download so credentials never
+                # travel to a host outside the allowlist
+                follow_redirects=False,
+                transport=self.transport,
+            )
+        return self._client
+
+    def _headers(self, url: str) -> dict:
+        if self.auth is None or not is_allowed_host(url, self.allowed_hosts):
+            return {}
+        return {"Authorization": vonage_auth_header(self.auth)}
+
+    def retry_delay(self, attempt: int) -> float:
+        # Full jitter so downloads failing together spread their retries out
+        return random.uniform(
+            0, min(self.retry_base * 2 ** (attempt - 1), self.retry_max)
+        )
+
+    async def _download(self, url: str, fd: int):
+        with os.fdopen(fd, "wb") as target:
+            for _ in range(self.max_redirects + 1):
+                async with self._get_client().stream(
+                    "GET", url, headers=self._headers(url)
+                ) as response:
+                    if response.is_redirect:
+                        url = str(response.url.join(response.headers["Location"]))
+                        continue
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(SPOOL_CHUNK_SIZE):
+                        await run_in_threadpool(target.write, chunk)
+                        self.bytes_downloaded += len(chunk)
+                    return
+            raise httpx.TooManyRedirects(f"Too many redirects fetching {url}")
+
+    async def fetch(self, url: str, suffix: str = "") -> str:
+        # Streams the recording to a spool file and returns its path; the
+        # caller owns the file.
+        if not is_allowed_host(url, self.allowed_hosts):
+            self.failed += 1
+            raise UntrustedRecordingURL(f"Refusing to fetch recording from {url}")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_downloads)
+        async with self._semaphore:
+            self.active += 1
+            try:
+                return await self._fetch_with_retries(url, suffix)
+            finally:
+                self.active -= 1
+
+    async def _fetch_with_retries(self, url: str, suffix: str) -> str:
+        attempt = 1
+        while True:
+            fd, path = create_spool_file(suffix)
+            try:
+                await self._download(url, fd)
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                await run_in_threadpool(remove_spool_file, path)
+                retryable = (
+                    isinstance(e, httpx.TransportError)
+                    or e.response.status_code in RETRYABLE_STATUS_CODES
+                )
+                if not retryable or attempt >= self.max_attempts:
+                    self.failed += 1
+                    raise
+                delay = self.retry_delay(attempt)
+                logger.warning(
+                    f"Download of {url} failed on attempt {attempt} ({e}); "
+                    f"retrying in {delay:.1f}s"
+                )
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+            except BaseException:
+                await run_in_threadpool(remove_spool_file, path)
+                self.failed += 1
+                raise
+            else:
+                self.completed += 1
+                return path
+
+    @asynccontextmanager
+    async def fetched(self, url: str, suffix: str = ""):
+        # Local paths are used in place; remote recordings are downloaded
+        # once and removed when the block exits.
+        if not is_remote(url):
+            yield url
+            return
+        path = await self.fetch(url, suffix)
+        try:
+            yield path
+        finally:
+            await run_in_threadpool(remove_spool_file, path)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "max_downloads": self.max_downloads,
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "bytes_downloaded": self.bytes_downloaded,
+        }
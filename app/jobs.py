@@ -0,0 +1,272 @@
+# jobs.py
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from loguru import logger
+from sqlalchemy import and_, or_, update
+from sqlmodel import select
+
+from app.config import (
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+    JOB_RETRY_BASE_SECONDS,
+    JOB_RETRY_MAX_SECONDS,
+    JOB_WORKERS,
+)
+from app.database import async_session
+from app.enums import JobStatus
+from app.models import TranscriptionJob
+
+_worker_pools = set()
+
+
+class PermanentJobError(Exception):
+    # Raised by job handlers for failures that retrying cannot fix
+    pass
+
+
+def retry_delay(attempts: int) -> float:
+    # Exponential backoff capped at JOB_RETRY_MAX_SECONDS, jittered so that
+    # jobs failing together do not retry together
+    delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+    return random.uniform(delay / 2, delay)
+
+
+def describe_error(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+
+
+async def enqueue_transcription_job(call_uuid: str, recording_url: str):
+    job = TranscriptionJob(
+        call_uuid=call_uuid,
+        recording_url=recording_url,
+        status=JobStatus.QUEUED.value,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    )
+    async with async_session() as session:
+        async with session.begin():
+            session.add(job)
+    for pool in _worker_pools:
+        pool.notify()
+    return job
+
+
+async def get_job(job_id: int):
+    async with async_session() as session:
+        return await session.get(TranscriptionJob, job_id)
+
+
+async def claim_next_job(lease_seconds: int = JOB_LEASE_SECONDS):
+    now = datetime.now(timezone.utc)
+    # A running job whose lease ran out belongs to a worker that died or hung
+    expired = and_(
+        TranscriptionJob.status == JobStatus.RUNNING.value,
+        TranscriptionJob.lease_expires_at < now,
+    )
+    claimable = or_(
+        and_(
+            TranscriptionJob.status == JobStatus.QUEUED.value,
+            TranscriptionJob.available_at <= now,
+        ),
+        and_(expired, TranscriptionJob.attempts < TranscriptionJob.max_attempts),
+    )
+    async with async_session() as session:
+        async with session.begin():
+            # Recordings that keep killing or hanging their worker stop here
+            # instead of being reclaimed forever
+            await session.execute(
+                update(TranscriptionJob)
+                .where(expired, TranscriptionJob.attempts >= TranscriptionJob.max_attempts)
+                .values(
+                    status=JobStatus.FAILED.value,
+                    lease_expires_at=None,
+                    lease_token=None,
+                    last_error="Lease expired on the last attempt",
+                    updated_at=now,
+                )
+            )
+            job_id = (
+                await session.execute(
+                    select(TranscriptionJob.id)
+                    .where(claimable)
+                    .order_by(TranscriptionJob.available_at)
+                    .limit(1)
+                )
+            ).scalar()
+            if job_id is None:
+                return None
+            # Re-check the claim condition so two workers racing for the same
+            # row cannot both take it.
+            result = await session.execute(
+                update(TranscriptionJob)
+                .where(TranscriptionJob.id == job_id, claimable)
+                .values(
+                    status=JobStatus.RUNNING.value,
+                    attempts=TranscriptionJob.attempts + 1,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    lease_token=uuid.uuid4().hex,
+                    updated_at=now,
+                )
+            )
+            if result.rowcount != 1:
+                return None
+            return await session.get(TranscriptionJob, job_id)
+
+
+def _lease_held(job: TranscriptionJob):
+    return and_(
+        TranscriptionJob.id == job.id,
+        TranscriptionJob.status == JobStatus.RUNNING.value,
+        TranscriptionJob.lease_token == job.lease_token,
+    )
+
+
+async def renew_lease(
+    job: TranscriptionJob, lease_seconds: int = JOB_LEASE_SECONDS
+) -> bool:
+    # False once another worker has reclaimed the job
+    now = datetime.now(timezone.utc)
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(TranscriptionJob)
+                .where(_lease_held(job))
+                .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+            )
+            return result.rowcount == 1
+
+
+async def complete_job(job: TranscriptionJob) -> bool:
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(TranscriptionJob)
+                .where(_lease_held(job))
+                .values(
+                    status=JobStatus.SUCCEEDED.value,
+                    lease_expires_at=None,
+                    lease_token=None,
+                    last_error=None,
+                    updated_at=datetime.now(timezone.utc),
+                )
+            )
+            return result.rowcount == 1
+
+
+async def fail_job(job: TranscriptionJob, error: str, retry: bool = True) -> bool:
+    now = datetime.now(timezone.utc)
+    if not retry or job.attempts >= job.max_attempts:
+        values = {"status": JobStatus.FAILED.value}
+    else:
+        values = {
+            "status": JobStatus.QUEUED.value,
+            "available_at": now + timedelta(seconds=retry_delay(job.attempts)),
+        }
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(TranscriptionJob)
+                .where(_lease_held(job))
+                .values(
+                    lease_expires_at=None,
+                    lease_token=None,
+                    last_error=error,
+                    updated_at=now,
+                    **values,
+                )
+            )
+            return result.rowcount == 1
+
+
+class JobWorkerPool:
+    def __init__(
+        self,
+        handler,
+        concurrency: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        lease_seconds: int = JOB_LEASE_SECONDS,
+    ):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._tasks = []
+        self._wakeup = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._run_worker(worker_id))
+            for worker_id in range(self.concurrency)
+        ]
+        _worker_pools.add(self)
+
+    async def stop(self):
+        _worker_pools.discard(self)
+        for task in self._tasks:
+            task.cancel()
+        # Cancelled jobs keep their lease and are picked up again once it
+        # expires, after a restart.
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _wait_for_work(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _run_worker(self, worker_id: int):
+        while True:
+            try:
+                job = await claim_next_job(self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} failed to claim a job: {e}")
+                job = None
+            if job is None:
+                await self._wait_for_work()
+                continue
+            try:
+                await self._run_job(worker_id, job)
+            except Exception as e:
+                # Recording the outcome failed; the job is retried once its
+                # lease expires, and this worker moves on
+                logger.error(f"Job worker {worker_id} failed to record job {job.id}: {e}")
+
+    async def _heartbeat(self, job: TranscriptionJob):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await renew_lease(job, self.lease_seconds):
+                logger.warning(f"Lost the lease on job {job.id}")
+                return
+
+    async def _run_job(self, worker_id: int, job: TranscriptionJob):
+        logger.info(
+            f"Job worker {worker_id} running job {job.id} (attempt {job.attempts})"
+        )
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            raise
+        except PermanentJobError as e:
+            logger.error(f"Job {job.id} failed permanently: {e}")
+            recorded = await fail_job(job, str(e), retry=False)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed on attempt {job.attempts}: {e}")
+            recorded = await fail_job(job, describe_error(e))
+        else:
+            recorded = await complete_job(job)
+        finally:
+            heartbeat.cancel()
+        if not recorded:
+            # The lease expired and another worker owns the job now
+            logger.warning(f"Discarded the result of job {job.id} after losing its lease")
@@ -1,26 +1,60 @@
 from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional
 
+from sqlalchemy import JSON, Column, Index, LargeBinary, UniqueConstraint
 from sqlmodel import SQLModel, Field
 
 
 # Database model
 class CallState(SQLModel, table=True):
+    __table_args__ = (Index("ix_callstate_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    uuid: str = Field(index=True)
+    uuid: str = Field(index=True, unique=True)
     status: str = Field(index=True)
     transcript: Optional[str] = Field(default=None, nullable=True)
+    transcript_segments: Optional[List[dict]] = Field(
+        default=None, sa_column=Column(JSON, nullable=True)
+    )
     translation: Optional[str] = Field(default=None, nullable=True)
+    speech_ratio: Optional[float] = Field(default=None, nullable=True, ge=0, le=1)
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
     duration: Optional[int] = Field(default=None, nullable=True, ge=0)
+    sample_rate: Optional[int] = Field(default=None, nullable=True)
+    channels: Optional[int] = Field(default=None, nullable=True)
+    loudness_dbfs: Optional[float] = Field(default=None, nullable=True)
+    clipping_ratio: Optional[float] = Field(default=None, nullable=True, ge=0, le=1)
     caller_id: Optional[str] = Field(default=None, nullable=True, index=True)
+    caller_digits: Optional[str] = Field(default=None, nullable=True, index=True)
+    caller_digits_reversed: Optional[str] = Field(
+        default=None, nullable=True, index=True
+    )
     recording_url: Optional[str] = Field(default=None, nullable=True)
+    recording_key: Optional[str] = Field(default=None, nullable=True)
+    recording_hash: Optional[str] = Field(default=None, nullable=True, index=True)
+    archive_codec: Optional[str] = Field(default=None, nullable=True)
+    archive_bitrate: Optional[int] = Field(default=None, nullable=True)
+    archive_size: Optional[int] = Field(default=None, nullable=True)
     user_id: Optional[int] = Field(default=None, nullable=True, index=True)
     user_role: Optional[str] = Field(default=None, nullable=True)
 
 
+
+# One translated transcript per call and target language
+class CallTranslation(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("call_uuid", "language"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    call_uuid: str = Field(index=True)
+    language: str = Field(nullable=False)
+    text: str = Field(nullable=False)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+
 # User model
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -32,3 +66,98 @@ class User(SQLModel, table=True):
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), nullable=False
     )
+
+
+# API keys for machine clients; only an HMAC digest of each key is stored
+class ApiKey(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(index=True, nullable=False)
+    name: Optional[str] = Field(default=None, nullable=True)
+    prefix: str = Field(nullable=False)
+    key_digest: str = Field(unique=True, index=True, nullable=False)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
+    revoked_at: Optional[datetime] = Field(default=None, nullable=True)
+
+
+# Access tokens revoked before they expire, e.g. by logging out
+class RevokedToken(SQLModel, table=True):
+    token_digest: str = Field(primary_key=True)
+    expires_at: datetime = Field(nullable=False, index=True)
+    revoked_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+
+# Dashboard counters, kept in step with CallState writes
+class DashboardRollup(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    total_recordings: int = Field(default=0, nullable=False)
+    completed_count: int = Field(default=0, nullable=False)
+    duration_sum: int = Field(default=0, nullable=False)
+    duration_count: int = Field(default=0, nullable=False)
+
+
+# Per-hour / per-day call counters for the analytics endpoint
+class CallStatsBucket(SQLModel, table=True):
+    granularity: str = Field(primary_key=True)
+    bucket_start: datetime = Field(primary_key=True)
+    total_recordings: int = Field(default=0, nullable=False)
+    completed_count: int = Field(default=0, nullable=False)
+    duration_sum: int = Field(default=0, nullable=False)
+    duration_count: int = Field(default=0, nullable=False)
+
+
+# Durable queue of recordings waiting for transcription
+class TranscriptionJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    call_uuid: str = Field(index=True)
+    recording_url: str = Field(nullable=False)
+    status: str = Field(index=True)
+    attempts: int = Field(default=0, nullable=False)
+    max_attempts: int = Field(nullable=False)
+    available_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False, index=True
+    )
+    lease_expires_at: Optional[datetime] = Field(default=None, nullable=True)
+    # Set on every claim; only the worker holding it may renew or finish the job
+    lease_token: Optional[str] = Field(default=None, nullable=True)
+    last_error: Optional[str] = Field(default=None, nullable=True)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+
+# Transcription results keyed by recording content, so duplicate deliveries
+# of the same audio are not recognised and translated twice
+class TranscriptCacheEntry(SQLModel, table=True):
+    content_hash: str = Field(primary_key=True)
+    engine: str = Field(primary_key=True)
+    language: str = Field(primary_key=True)
+    transcript: str = Field(nullable=False)
+    transcript_segments: Optional[List[dict]] = Field(
+        default=None, sa_column=Column(JSON, nullable=True)
+    )
+    speech_ratio: Optional[float] = Field(default=None, nullable=True)
+    translation: str = Field(nullable=False)
+    s3_key: Optional[str] = Field(default=None, nullable=True)
+    archive_codec: Optional[str] = Field(default=None, nullable=True)
+    archive_bitrate: Optional[int] = Field(default=None, nullable=True)
+    archive_size: Optional[int] = Field(default=None, nullable=True)
+    hit_count: int = Field(default=0, nullable=False)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+
+# Min/max waveform peaks per recording, see app.audio.encode_peaks
+class WaveformPeaks(SQLModel, table=True):
+    content_hash: str = Field(primary_key=True)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
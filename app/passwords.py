@@ -0,0 +1,101 @@
+# passwords.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import (
+    PASSWORD_BCRYPT_ROUNDS,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_QUEUE_TIMEOUT_SECONDS,
+)
+
+# Hashes made with other bcrypt costs still verify but are flagged for rehash
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=PASSWORD_BCRYPT_ROUNDS
+)
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        context: CryptContext = pwd_context,
+        max_workers: int = PASSWORD_HASH_WORKERS,
+        queue_timeout: float = PASSWORD_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.context = context
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout
+        # bcrypt is deliberately slow; it runs on its own threads so a burst
+        # of logins cannot block the event loop or starve the default pool
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password"
+        )
+        self._semaphore = None
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        # Callers wait at most queue_timeout for a free worker, then are
+        # turned away rather than piling up behind the pool
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PasswordHasherBusy("Password hashing is at capacity")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, func, *args
+            )
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        # Returns the new hash when the stored one uses outdated settings
+        valid, new_hash = await self._run(
+            self.context.verify_and_update, password, hashed_password
+        )
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "queue_timeout": self.queue_timeout,
+            "waiting": self.waiting,
+            "active": self.active,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
+
+
+password_hasher = PasswordHasher()
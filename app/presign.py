@@ -0,0 +1,91 @@
+# presign.py
+import time
+from typing import Dict, Iterable, List
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.aws_setup import AWS_BUCKET_NAME, s3_client
+from app.cache import LRUCache
+from app.config import (
+    PRESIGNED_URL_CACHE_SIZE,
+    PRESIGNED_URL_REFRESH_SECONDS,
+    PRESIGNED_URL_TTL_SECONDS,
+)
+
+
+class PresignedUrlService:
+    def __init__(
+        self,
+        bucket_name: str = AWS_BUCKET_NAME,
+        ttl: int = PRESIGNED_URL_TTL_SECONDS,
+        refresh_margin: int = PRESIGNED_URL_REFRESH_SECONDS,
+        cache_size: int = PRESIGNED_URL_CACHE_SIZE,
+        client=None,
+    ):
+        self.bucket_name = bucket_name
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.client = client
+        # key -> (url, expires_at)
+        self.cache = LRUCache(cache_size)
+        self.hits = 0
+        self.misses = 0
+        self.signed = 0
+        self.sign_batches = 0
+
+    def _sign(self, keys: List[str]) -> Dict[str, tuple]:
+        client = self.client or s3_client
+        expires_at = time.time() + self.ttl
+        return {
+            key: (
+                client.generate_presigned_url(
+                    "get_object",
+                    Params={"Bucket": self.bucket_name, "Key": key},
+                    ExpiresIn=self.ttl,
+                ),
+                expires_at,
+            )
+            for key in keys
+        }
+
+    async def urls_for(self, keys: Iterable[str]) -> Dict[str, str]:
+        # Cached URLs are handed out until refresh_margin before they expire,
+        # so clients always have at least that long to start playback.
+        now = time.time()
+        urls = {}
+        missing = []
+        for key in dict.fromkeys(key for key in keys if key):
+            cached = self.cache.get(key)
+            if cached is not None and cached[1] - self.refresh_margin > now:
+                urls[key] = cached[0]
+                self.hits += 1
+            else:
+                missing.append(key)
+                self.misses += 1
+        if missing:
+            # A whole page is signed in one hop to the thread pool
+            signed = await run_in_threadpool(self._sign, missing)
+            self.sign_batches += 1
+            self.signed += len(signed)
+            for key, entry in signed.items():
+                self.cache.put(key, entry)
+                urls[key] = entry[0]
+        return urls
+
+    async def url_for(self, key: str) -> str:
+        return (await self.urls_for([key])).get(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "cached": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "signed": self.signed,
+            "sign_batches": self.sign_batches,
+        }
+
+
+presigned_urls = PresignedUrlService()
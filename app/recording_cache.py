@@ -0,0 +1,183 @@
+# recording_cache.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from loguru import logger
+
+from app.config import RECORDING_CACHE_DIR, RECORDING_CACHE_MAX_BYTES
+
+RECORDING_SUFFIX = ".wav"
+PARTIAL_SUFFIX = ".part"
+# Partial writes older than this belong to a process that died mid-write;
+# younger ones may still be in progress in another worker
+PARTIAL_WRITE_GRACE_SECONDS = 3600
+
+
+class RecordingCache:
+    # Recordings on local disk, named by content hash and evicted least
+    # recently used first once their total size passes max_bytes.
+    def __init__(
+        self, directory: str = RECORDING_CACHE_DIR, max_bytes: int = RECORDING_CACHE_MAX_BYTES
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None
+        self._pins = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    def path_for(self, content_hash: str) -> str:
+        return os.path.join(self.directory, content_hash + RECORDING_SUFFIX)
+
+    def _load(self):
+        # Rebuild the index from disk on first use, oldest access first
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        stale_before = time.time() - PARTIAL_WRITE_GRACE_SECONDS
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(PARTIAL_SUFFIX):
+                if entry.stat().st_mtime < stale_before:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            if not entry.name.endswith(RECORDING_SUFFIX):
+                # Not ours; the directory may be shared
+                continue
+            stat = entry.stat()
+            files.append((stat.st_atime, entry.name[: -len(RECORDING_SUFFIX)], stat.st_size))
+        self._entries = OrderedDict(
+            (content_hash, size) for _, content_hash, size in sorted(files)
+        )
+        self.size = sum(self._entries.values())
+
+    def lookup(self, content_hash: str) -> Optional[str]:
+        with self._lock:
+            self._load()
+            size = self._entries.get(content_hash)
+            if size is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(content_hash)
+            self.hits += 1
+            self.bytes_saved += size
+        path = self.path_for(content_hash)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(content_hash)
+            return None
+        return path
+
+    def add_from(self, content_hash: str, write: Callable[[str], None]) -> str:
+        # write() fills a temporary file in the cache directory, which is then
+        # renamed into place so readers never see a partial recording.
+        with self._lock:
+            self._load()
+        fd, tmp_path = tempfile.mkstemp(suffix=PARTIAL_SUFFIX, dir=self.directory)
+        os.close(fd)
+        try:
+            write(tmp_path)
+            size = os.path.getsize(tmp_path)
+            path = self.path_for(content_hash)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self.size += size - self._entries.get(content_hash, 0)
+            self._entries[content_hash] = size
+            self._entries.move_to_end(content_hash)
+            self._evict()
+        return path
+
+    def add(self, content_hash: str, source_path: str, move: bool = False) -> str:
+        def write(tmp_path):
+            if move:
+                try:
+                    os.replace(source_path, tmp_path)
+                    return
+                except OSError:
+                    # Spool and cache directories on different filesystems
+                    pass
+            shutil.copyfile(source_path, tmp_path)
+
+        return self.add_from(content_hash, write)
+
+    def pin(self, content_hash: str):
+        # Pinned recordings are in use and are skipped by eviction until
+        # unpinned as many times as they were pinned
+        with self._lock:
+            self._pins[content_hash] = self._pins.get(content_hash, 0) + 1
+
+    def unpin(self, content_hash: str):
+        with self._lock:
+            self._pins[content_hash] -= 1
+            if not self._pins[content_hash]:
+                del self._pins[content_hash]
+            self._evict()
+
+    @contextmanager
+    def pinned(self, content_hash: str):
+        self.pin(content_hash)
+        try:
+            yield
+        finally:
+            self.unpin(content_hash)
+
+    def _forget(self, content_hash: str):
+        size = self._entries.pop(content_hash, None)
+        if size is not None:
+            self.size -= size
+
+    def _evict(self):
+        for content_hash in list(self._entries):
+            if self.size <= self.max_bytes:
+                break
+            if content_hash in self._pins:
+                continue
+            try:
+                os.remove(self.path_for(content_hash))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error evicting cached recording {content_hash}: {e}")
+                continue
+            self._forget(content_hash)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries or ()),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+            }
+
+
+recording_cache = RecordingCache()
@@ -0,0 +1,188 @@
+# rollups.py
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import case, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import delete, select
+
+from app.database import init_db, write_transaction
+from app.enums import BucketGranularity, CallStatus
+from app.models import CallState, CallStatsBucket, DashboardRollup
+
+ROLLUP_ID = 1
+BUCKET_WIDTHS = {
+    BucketGranularity.HOUR: timedelta(hours=1),
+    BucketGranularity.DAY: timedelta(days=1),
+}
+ROLLUP_FIELDS = ("total_recordings", "completed_count", "duration_sum", "duration_count")
+REBUILD_CHUNK_SIZE = 10000
+
+
+def _counters(call: Optional[tuple]) -> dict:
+    if call is None:
+        return dict.fromkeys(ROLLUP_FIELDS, 0)
+    status, duration = call
+    return {
+        "total_recordings": 1,
+        "completed_count": 1 if status == CallStatus.COMPLETED.value else 0,
+        "duration_sum": duration or 0,
+        "duration_count": 1 if duration else 0,
+    }
+
+
+def rollup_delta(old: Optional[tuple], new: Optional[tuple]) -> dict:
+    # old and new are a call's (status, duration) before and after a write,
+    # None where the call does not exist
+    before, after = _counters(old), _counters(new)
+    return {field: after[field] - before[field] for field in ROLLUP_FIELDS}
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite hands back CallState.created_at without an offset; those values
+    # are UTC, as are naive query parameters.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def bucket_start(created_at: datetime, granularity: BucketGranularity) -> datetime:
+    start = as_utc(created_at).replace(minute=0, second=0, microsecond=0)
+    if granularity == BucketGranularity.DAY:
+        start = start.replace(hour=0)
+    return start
+
+
+def _upsert_counters(model, delta: dict, **key):
+    stmt = insert(model).values(**key, **delta)
+    return stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={field: getattr(model, field) + stmt.excluded[field] for field in delta},
+    )
+
+
+async def apply_rollup_delta(session, delta: dict, created_at: datetime):
+    # Must run inside the caller's transaction so the counters commit or roll
+    # back together with the CallState write they describe.
+    if not any(delta.values()):
+        return
+    await session.execute(_upsert_counters(DashboardRollup, delta, id=ROLLUP_ID))
+    for granularity in BucketGranularity:
+        await session.execute(
+            _upsert_counters(
+                CallStatsBucket,
+                delta,
+                granularity=granularity.value,
+                bucket_start=bucket_start(created_at, granularity),
+            )
+        )
+
+
+async def compute_rollups(conn, chunk_size: int = REBUILD_CHUNK_SIZE):
+    totals = dict.fromkeys(ROLLUP_FIELDS, 0)
+    buckets = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    max_id = (await conn.execute(select(func.max(CallState.id)))).scalar()
+    if max_id is None:
+        return totals, buckets
+
+    hour = func.strftime("%Y-%m-%d %H:00:00", CallState.created_at)
+    for start in range(0, max_id, chunk_size):
+        result = await conn.execute(
+            select(
+                hour,
+                func.count(),
+                func.sum(
+                    case((CallState.status == CallStatus.COMPLETED.value, 1), else_=0)
+                ),
+                func.sum(CallState.duration),
+                func.sum(case((CallState.duration > 0, 1), else_=0)),
+            )
+            .where(CallState.id > start, CallState.id <= start + chunk_size)
+            .group_by(hour)
+        )
+        for hour_start, *counts in result.all():
+            hour_start = datetime.strptime(hour_start, "%Y-%m-%d %H:%M:%S").replace(
+                tzinfo=timezone.utc
+            )
+            for granularity in BucketGranularity:
+                key = (granularity, bucket_start(hour_start, granularity))
+                for field, value in zip(ROLLUP_FIELDS, counts):
+                    buckets[key][field] += value or 0
+            for field, value in zip(ROLLUP_FIELDS, counts):
+                totals[field] += value or 0
+    return totals, buckets
+
+
+async def write_rollups(conn, totals: dict, buckets: dict):
+    current = (
+        await conn.execute(
+            select(*(getattr(DashboardRollup, field) for field in ROLLUP_FIELDS)).where(
+                DashboardRollup.id == ROLLUP_ID
+            )
+        )
+    ).first()
+    if current is not None:
+        drift = {
+            field: totals[field] - value
+            for field, value in zip(ROLLUP_FIELDS, current)
+            if totals[field] != value
+        }
+        if drift:
+            logger.warning(f"Dashboard rollup drift corrected: {drift}")
+    stmt = insert(DashboardRollup).values(id=ROLLUP_ID, **totals)
+    await conn.execute(
+        stmt.on_conflict_do_update(index_elements=["id"], set_=totals)
+    )
+    await conn.execute(delete(CallStatsBucket))
+    if buckets:
+        await conn.execute(
+            insert(CallStatsBucket),
+            [
+                {"granularity": granularity.value, "bucket_start": start, **counts}
+                for (granularity, start), counts in buckets.items()
+            ],
+        )
+
+
+async def init_rollups(conn, rebuild: bool = False):
+    # Databases that had calls before the rollup tables existed start out
+    # with their counters filled in rather than at zero
+    exists = (
+        await conn.execute(
+            select(DashboardRollup.id).where(DashboardRollup.id == ROLLUP_ID)
+        )
+    ).first()
+    if exists is not None and not rebuild:
+        return
+    totals, buckets = await compute_rollups(conn)
+    await write_rollups(conn, totals, buckets)
+    logger.info(f"Dashboard rollup initialized: {totals}")
+
+
+async def rebuild_dashboard_rollup(chunk_size: int = REBUILD_CHUNK_SIZE) -> dict:
+    # Counting and overwriting happen under one write lock, so deltas from
+    # calls written meanwhile are neither lost nor counted twice
+    async with write_transaction() as conn:
+        totals, buckets = await compute_rollups(conn, chunk_size)
+        await write_rollups(conn, totals, buckets)
+    return totals
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Recompute dashboard rollup counters and analytics buckets "
+        "from the CallState table."
+    )
+    parser.add_argument("--chunk-size", type=int, default=REBUILD_CHUNK_SIZE)
+    args = parser.parse_args()
+    await init_db()
+    totals = await rebuild_dashboard_rollup(args.chunk_size)
+    logger.info(f"Dashboard rollup rebuilt: {totals}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
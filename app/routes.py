@@ -1,26 +1,57 @@
-from datetime import timedelta
-from typing import List
+from datetime import datetime, timedelta
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi import Request, Query, UploadFile, Form, File
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import iterate_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError
+from starlette.background import BackgroundTask
 
 from app.auth import (
     authenticate_user,
     create_access_token,
     get_current_active_user,
+    get_interactive_user,
     Token,
     User,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_user,
+    create_api_key,
+    list_api_keys,
+    oauth2_scheme,
+    revoke_api_key,
+    revoke_token,
 )
+from app.config import SPOOL_CHUNK_SIZE
+from app.crud import InvalidCursor
 from app.decorators import handle_exceptions
-from app.schemas import CallEvent, DashboardData, Recording, RecordingEvent, UserCreate
+from app.enums import BucketGranularity, CallerMatch
+from app.passwords import PasswordHasherBusy
+from app.schemas import (
+    ApiKeyCreate,
+    ApiKeyCreated,
+    ApiKeyInfo,
+    CallAnalytics,
+    CallEvent,
+    DashboardData,
+    JobStatusData,
+    Recording,
+    RecordingEvent,
+    TranscriptSearchResults,
+    UserCreate,
+)
 from app.services import (
     store_call_state,
     get_dashboard_data,
+    get_call_analytics,
+    get_system_metrics,
+    get_job_status,
     get_recordings_data,
+    get_recording_audio,
+    get_recording_peaks,
+    search_transcripts_data,
     create_new_recording,
     handle_call_event_service,
     handle_recording,
@@ -29,6 +60,17 @@ from app.vonage_setup import create_ncco
 
 router = APIRouter()
 
+# Peaks never change for a stored recording
+PEAKS_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def password_hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many password checks in progress, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 
 @router.post(
     "/auth/signup",
@@ -38,7 +80,10 @@ router = APIRouter()
     description="Register a new user by providing username, password, and optional details.",
 )
 async def sign_up(user: UserCreate):
-    new_user = await create_user(user)
+    try:
+        new_user = await create_user(user)
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
     return new_user
 
 
@@ -50,7 +95,10 @@ async def sign_up(user: UserCreate):
     description="Authenticate user and return a JWT token.",
 )
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except PasswordHasherBusy:
+        raise password_hasher_busy()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,6 +112,77 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post(
+    "/auth/logout",
+    response_class=JSONResponse,
+    tags=["Authentication"],
+    summary="Logout",
+    description="Revoke the bearer token used for this request.",
+)
+async def logout(token: str = Depends(oauth2_scheme)):
+    try:
+        await revoke_token(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return JSONResponse({"status": "success"})
+
+
+def api_key_info(api_key) -> dict:
+    return {
+        "id": api_key.id,
+        "name": api_key.name,
+        "prefix": api_key.prefix,
+        "created_at": api_key.created_at.isoformat(),
+        "revoked_at": api_key.revoked_at.isoformat() if api_key.revoked_at else None,
+    }
+
+
+@router.post(
+    "/auth/api-keys",
+    response_model=ApiKeyCreated,
+    tags=["Authentication"],
+    summary="Create API key",
+    description="Create an API key for the current user. Send it in the X-API-Key header "
+    "instead of a bearer token. The key is only shown in this response. Requires a "
+    "bearer token; API keys cannot create keys.",
+)
+async def create_api_key_route(
+    api_key: ApiKeyCreate, current_user: User = Depends(get_interactive_user)
+):
+    new_key, key = await create_api_key(current_user, api_key.name)
+    return ApiKeyCreated(**api_key_info(new_key), key=key)
+
+
+@router.get(
+    "/auth/api-keys",
+    response_model=List[ApiKeyInfo],
+    tags=["Authentication"],
+    summary="List API keys",
+    description="List the current user's API keys without their secret part.",
+)
+async def list_api_keys_route(current_user: User = Depends(get_current_active_user)):
+    return [ApiKeyInfo(**api_key_info(api_key)) for api_key in await list_api_keys(current_user)]
+
+
+@router.delete(
+    "/auth/api-keys/{key_id}",
+    response_class=JSONResponse,
+    tags=["Authentication"],
+    summary="Revoke API key",
+    description="Revoke one of the current user's API keys. Requires a bearer token.",
+)
+async def revoke_api_key_route(
+    key_id: int, current_user: User = Depends(get_interactive_user)
+):
+    if not await revoke_api_key(current_user, key_id):
+        raise HTTPException(status_code=404, detail="API key not found")
+    return JSONResponse({"status": "success"})
+
+
 @router.get(
     "/auth/user",
     response_model=User,
@@ -107,35 +226,160 @@ async def handle_call_event(event: CallEvent):
     response_class=JSONResponse,
     tags=["Calls"],
     summary="Handle recording event",
-    description="Handle a recording event and update the call state.",
+    description="Handle a recording event and queue the recording for transcription.",
 )
 @handle_exceptions
 async def handle_recording_event(event: RecordingEvent):
-    await handle_recording(event.uuid, event.url, event.status)
+    await handle_recording(event.uuid, str(event.url), event.status)
     return JSONResponse({"status": "ok"})
 
 
+@router.get(
+    "/jobs/{job_id}",
+    response_model=JobStatusData,
+    tags=["Calls"],
+    summary="Get transcription job status",
+    description="Retrieve the status, attempt count, and last error of a background transcription job.",
+)
+@handle_exceptions
+async def get_job_status_route(
+    job_id: int, current_user: User = Depends(get_current_active_user)
+):
+    job = await get_job_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @router.get(
     "/recordings/list",
     response_model=List[Recording],
     tags=["Recordings"],
     summary="Get recordings",
-    description="Retrieve a list of recordings with optional search, pagination, and limit parameters.",
+    description="Retrieve a list of recordings with optional search, pagination, and limit parameters. "
+    "Pass the returned next_cursor as cursor to fetch the following page. "
+    "Use match=prefix|suffix|exact to search caller IDs by normalized digits.",
 )
 @handle_exceptions
 async def list_recordings(
     search: str = Query(None, min_length=1),
-    page: int = Query(1),
-    limit: int = Query(10),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: str = Query(None, min_length=1),
+    match: CallerMatch = Query(None),
     current_user: User = Depends(get_current_active_user),
 ):
-    recordings_data = await get_recordings_data(search, page, limit)
+    try:
+        recordings_data = await get_recordings_data(
+            search, page, limit, cursor, match
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     recordings_data["recordings"] = [
         recording.dict() for recording in recordings_data["recordings"]
     ]
     return JSONResponse(recordings_data)
 
 
+@router.get(
+    "/recordings/search",
+    response_model=TranscriptSearchResults,
+    tags=["Recordings"],
+    summary="Search transcripts",
+    description="Full-text search over call transcripts and translations, ranked by relevance with highlighted snippets.",
+)
+@handle_exceptions
+async def search_recordings(
+    q: str = Query(..., min_length=1),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        return await search_transcripts_data(q, page, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid search query")
+
+
+@router.get(
+    "/recordings/{call_uuid}/audio",
+    response_class=FileResponse,
+    tags=["Recordings"],
+    summary="Get recording audio",
+    description="Stream the audio of a recording. Supports Range requests for seeking and "
+    "ETag / If-None-Match for conditional requests. Served from the local recording cache; "
+    "uncached ranges are read from S3 without downloading the whole file.",
+)
+@handle_exceptions
+async def get_recording_audio_route(
+    call_uuid: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        audio = await get_recording_audio(
+            call_uuid,
+            request.headers.get("range"),
+            request.headers.get("if-range"),
+            request.headers.get("if-none-match"),
+        )
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    headers = {"etag": audio["etag"], "accept-ranges": "bytes"}
+    if audio["not_modified"]:
+        return Response(status_code=304, headers=headers)
+    if audio["path"]:
+        # FileResponse answers Range / If-Range itself and hands whole files
+        # to the server, which uses zero-copy sendfile where it supports the
+        # pathsend extension
+        return FileResponse(
+            audio["path"],
+            media_type=audio["media_type"],
+            filename=f"{call_uuid}{audio['suffix']}",
+            content_disposition_type="inline",
+            headers=headers,
+            background=BackgroundTask(audio["release"]),
+        )
+    s3_object = audio["s3_object"]
+    headers["content-length"] = str(s3_object["ContentLength"])
+    if "ContentRange" in s3_object:
+        headers["content-range"] = s3_object["ContentRange"]
+    return StreamingResponse(
+        iterate_in_threadpool(s3_object["Body"].iter_chunks(SPOOL_CHUNK_SIZE)),
+        status_code=206 if "ContentRange" in s3_object else 200,
+        media_type=audio["media_type"],
+        headers=headers,
+    )
+
+
+@router.get(
+    "/recordings/{call_uuid}/peaks",
+    response_class=Response,
+    tags=["Recordings"],
+    summary="Get recording waveform peaks",
+    description="Min/max waveform peaks of a recording at several zoom levels, as a compact "
+    "binary blob for drawing the waveform without downloading the audio. Responses carry an "
+    "ETag and long-lived cache headers.",
+)
+@handle_exceptions
+async def get_recording_peaks_route(
+    call_uuid: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+):
+    peaks = await get_recording_peaks(call_uuid, request.headers.get("if-none-match"))
+    if peaks is None:
+        raise HTTPException(status_code=404, detail="Waveform peaks not found")
+    headers = {"etag": peaks["etag"], "cache-control": PEAKS_CACHE_CONTROL}
+    if peaks["not_modified"]:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        peaks["data"], media_type="application/octet-stream", headers=headers
+    )
+
+
 @router.get(
     "/dashboard/data",
     response_model=DashboardData,
@@ -148,16 +392,37 @@ async def get_dashboard_data_route():
     return await get_dashboard_data()
 
 
+@router.get(
+    "/dashboard/analytics",
+    response_model=CallAnalytics,
+    tags=["Dashboard"],
+    summary="Get call analytics",
+    description="Retrieve per-hour or per-day call count, completed rate, total duration, and average duration for a date range.",
+)
+@handle_exceptions
+async def get_call_analytics_route(
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    granularity: BucketGranularity = Query(BucketGranularity.DAY),
+):
+    try:
+        return await get_call_analytics(granularity, start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+
+
 @router.post(
     "/recordings/create",
     response_class=JSONResponse,
     tags=["Recordings"],
     summary="Create recording",
-    description="Create a new recording by uploading an audio file and providing caller ID and duration.",
+    description="Create a new recording by uploading an audio file and providing caller ID. The duration is measured from WAV uploads; the submitted duration is only used for other formats.",
 )
 @handle_exceptions
 async def create_recording(
-    audio: UploadFile = File(...), caller_id: str = Form(...), duration: int = Form(...)
+    audio: UploadFile = File(...),
+    caller_id: str = Form(...),
+    duration: Optional[int] = Form(None),
 ):
     recording_id = await create_new_recording(audio, caller_id, duration)
     return JSONResponse(
@@ -166,3 +431,17 @@ async def create_recording(
             "recording_id": recording_id,
         }
     )
+
+
+@router.get(
+    "/system/metrics",
+    response_class=JSONResponse,
+    tags=["System"],
+    summary="Get system metrics",
+    description="Retrieve runtime metrics for background services such as the S3 uploader.",
+)
+@handle_exceptions
+async def get_system_metrics_route(
+    current_user: User = Depends(get_current_active_user),
+):
+    return JSONResponse(await get_system_metrics())
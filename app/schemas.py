@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, HttpUrl, constr, conint, confloat, EmailStr
 
@@ -11,6 +11,22 @@ class UserCreate(BaseModel):
     full_name: Optional[str] = None
 
 
+class ApiKeyCreate(BaseModel):
+    name: Optional[constr(max_length=100)] = None
+
+
+class ApiKeyInfo(BaseModel):
+    id: int
+    name: Optional[str]
+    prefix: str
+    created_at: str
+    revoked_at: Optional[str] = None
+
+
+class ApiKeyCreated(ApiKeyInfo):
+    key: str
+
+
 class RecordingEvent(BaseModel):
     url: HttpUrl
     uuid: constr(min_length=1)
@@ -29,11 +45,61 @@ class DashboardData(BaseModel):
     average_duration: confloat(ge=0)
 
 
+class AnalyticsBucket(BaseModel):
+    bucket_start: str
+    call_count: conint(ge=0)
+    completed_rate: confloat(ge=0, le=100)
+    total_duration: conint(ge=0)
+    average_duration: confloat(ge=0)
+
+
+class CallAnalytics(BaseModel):
+    granularity: str
+    start: str
+    end: str
+    buckets: List[AnalyticsBucket]
+
+
 class Recording(BaseModel):
     id: conint(ge=1)
     date: str
-    duration: conint(ge=0)
+    duration: Optional[conint(ge=0)] = None
     caller_id: Optional[constr(min_length=1)]
     status: constr(min_length=1)
-    user_id: Optional[int]
-    user_role: Optional[str]
+    user_id: Optional[int] = None
+    user_role: Optional[str] = None
+    audio_url: Optional[str] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    loudness_dbfs: Optional[float] = None
+    clipping_ratio: Optional[float] = None
+
+
+class TranscriptMatch(BaseModel):
+    id: conint(ge=1)
+    uuid: str
+    date: str
+    caller_id: Optional[str]
+    status: constr(min_length=1)
+    rank: float
+    transcript_snippet: Optional[str]
+    translation_snippet: Optional[str]
+
+
+class TranscriptSearchResults(BaseModel):
+    results: List[TranscriptMatch]
+    total: conint(ge=0)
+    page: conint(ge=1)
+    limit: conint(ge=1)
+
+
+class JobStatusData(BaseModel):
+    id: conint(ge=1)
+    call_uuid: str
+    status: str
+    attempts: conint(ge=0)
+    max_attempts: conint(ge=1)
+    last_error: Optional[str]
+    created_at: str
+    updated_at: str
+    available_at: str
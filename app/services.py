@@ -1,54 +1,122 @@
 # services.py
-import statistics
+import mimetypes
+import os
+from datetime import datetime
 
+import httpx
+
+from app.auth import api_key_cache, token_cache, user_cache
 from app.crud import (
-    create_call_state,
     get_call_state,
-    delete_call_state,
-    get_all_call_states,
+    get_dashboard_rollup,
+    get_stats_buckets,
     search_call_states,
+    search_transcripts,
     create_recording_file,
+    encode_cursor,
+    fill_recording_from_s3,
+    get_waveform_peaks,
+    lookup_recording,
+    open_recording_range,
+    pin_recording,
+    set_call_status,
+)
+from app.config import ANALYTICS_MAX_BUCKETS
+from app.enums import BucketGranularity, CallerMatch, CallStatus
+from app.fetcher import RETRYABLE_STATUS_CODES
+from app.jobs import (
+    PermanentJobError,
+    describe_error,
+    enqueue_transcription_job,
+    get_job,
+)
+from app.passwords import password_hasher
+from app.rollups import BUCKET_WIDTHS, as_utc, bucket_start
+from app.presign import presigned_urls
+from app.recording_cache import recording_cache
+from app.schemas import (
+    AnalyticsBucket,
+    CallAnalytics,
+    DashboardData,
+    JobStatusData,
+    Recording,
+    TranscriptMatch,
+    TranscriptSearchResults,
+)
+from app.transcode import ORIGINAL_CODEC, transcoder
+from app.transcript_cache import transcript_cache
+from app.transcription import transcription_engine
+from app.translation import translation_service
+from app.uploader import s3_uploader
+from app.vonage_setup import (
+    recording_fetcher,
+    store_call_state,
+    transcribe_and_translate,
 )
-from app.enums import CallStatus
-from app.schemas import DashboardData, Recording
-from app.vonage_setup import transcribe_and_translate
-
-
-async def store_call_state(call_uuid: str):
-    existing_call_state = await get_call_state(call_uuid)
-    if not existing_call_state:
-        await create_call_state(call_uuid, CallStatus.RECORDING.value)
 
 
 async def handle_recording(call_uuid: str, recording_url: str, status: str):
     call_state = await get_call_state(call_uuid)
     if call_state and status == CallStatus.COMPLETED.value:
-        await transcribe_and_translate(call_uuid, recording_url)
-        await delete_call_state(call_uuid)
+        return await enqueue_transcription_job(call_uuid, recording_url)
+
+
+def is_permanent_error(error: Exception) -> bool:
+    # An untrusted or missing recording, a URL Vonage rejects, or audio that
+    # cannot be decoded fails the same way on every attempt
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code not in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ValueError, FileNotFoundError))
+
+
+async def process_transcription_job(job):
+    try:
+        await transcribe_and_translate(job.call_uuid, job.recording_url)
+    except Exception as e:
+        if is_permanent_error(e):
+            raise PermanentJobError(describe_error(e)) from e
+        raise
+    # Completed calls stay on record with their transcript, audio and
+    # metadata for search, playback and the dashboard
+    await set_call_status(job.call_uuid, CallStatus.COMPLETED.value)
+
+
+async def get_job_status(job_id: int):
+    job = await get_job(job_id)
+    if job is None:
+        return None
+    return JobStatusData(
+        id=job.id,
+        call_uuid=job.call_uuid,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        last_error=job.last_error,
+        created_at=job.created_at.isoformat(),
+        updated_at=job.updated_at.isoformat(),
+        available_at=job.available_at.isoformat(),
+    )
 
 
 async def handle_call_event_service(call_uuid: str, status: str):
     call_state = await get_call_state(call_uuid)
     if call_state and status == CallStatus.COMPLETED.value:
-        await delete_call_state(call_uuid)
+        # The recording webhook may still be on its way, so the call is kept
+        await set_call_status(call_uuid, CallStatus.COMPLETED.value)
 
 
 async def get_dashboard_data():
-    call_states = await get_all_call_states()
-
-    total_recordings = len(call_states)
-    total_duration = sum(call.duration for call in call_states if call.duration)
-    successful_calls = sum(
-        1 for call in call_states if call.status == CallStatus.COMPLETED.value
-    )
+    rollup = await get_dashboard_rollup()
+    total_recordings = rollup.total_recordings if rollup else 0
+    total_duration = rollup.duration_sum if rollup else 0
+    successful_calls = rollup.completed_count if rollup else 0
+    calls_with_duration = rollup.duration_count if rollup else 0
 
     success_rate = (
         (successful_calls / total_recordings) * 100 if total_recordings > 0 else 0
     )
     average_duration = (
-        statistics.mean(call.duration for call in call_states if call.duration)
-        if total_recordings > 0 and any(call.duration for call in call_states)
-        else 0
+        total_duration / calls_with_duration if calls_with_duration > 0 else 0
     )
 
     return DashboardData(
@@ -59,8 +127,57 @@ async def get_dashboard_data():
     )
 
 
-async def get_recordings_data(search: str, page: int, limit: int):
-    paginated_call_states, total = await search_call_states(search, page, limit)
+def _analytics_bucket(start: datetime, bucket) -> AnalyticsBucket:
+    # Periods without calls have no stored bucket and count as zero
+    total = bucket.total_recordings if bucket else 0
+    completed = bucket.completed_count if bucket else 0
+    duration_sum = bucket.duration_sum if bucket else 0
+    duration_count = bucket.duration_count if bucket else 0
+    return AnalyticsBucket(
+        # Bucket starts are UTC and reported without an offset, as stored
+        bucket_start=start.replace(tzinfo=None).isoformat(),
+        call_count=total,
+        completed_rate=(completed / total) * 100 if total > 0 else 0,
+        total_duration=duration_sum,
+        average_duration=duration_sum / duration_count if duration_count > 0 else 0,
+    )
+
+
+async def get_call_analytics(
+    granularity: BucketGranularity, start: datetime, end: datetime
+):
+    if as_utc(end) <= as_utc(start):
+        raise ValueError("end must be after start")
+    width = BUCKET_WIDTHS[granularity]
+    first, stop = bucket_start(start, granularity), as_utc(end)
+    if (stop - first) / width > ANALYTICS_MAX_BUCKETS:
+        raise ValueError("Date range spans too many buckets")
+    stored = {
+        as_utc(bucket.bucket_start): bucket
+        for bucket in await get_stats_buckets(granularity, start, end)
+    }
+    buckets = []
+    current = first
+    while current < stop:
+        buckets.append(_analytics_bucket(current, stored.get(current)))
+        current += width
+    return CallAnalytics(
+        granularity=granularity.value,
+        start=start.isoformat(),
+        end=end.isoformat(),
+        buckets=buckets,
+    )
+
+
+async def get_recordings_data(
+    search: str, page: int, limit: int, cursor: str = None, match: CallerMatch = None
+):
+    paginated_call_states, total = await search_call_states(
+        search, page, limit, cursor, match
+    )
+    audio_urls = await presigned_urls.urls_for(
+        call.recording_key for call in paginated_call_states
+    )
     recordings = [
         Recording(
             id=call.id,
@@ -68,16 +185,147 @@ async def get_recordings_data(search: str, page: int, limit: int):
             duration=call.duration,
             caller_id=call.caller_id,
             status=call.status,
+            audio_url=audio_urls.get(call.recording_key),
+            sample_rate=call.sample_rate,
+            channels=call.channels,
+            loudness_dbfs=call.loudness_dbfs,
+            clipping_ratio=call.clipping_ratio,
         )
         for call in paginated_call_states
     ]
+    next_cursor = (
+        encode_cursor(paginated_call_states[-1])
+        if len(paginated_call_states) == limit
+        else None
+    )
     return {
         "recordings": recordings,
         "total": total,
         "page": page,
         "limit": limit,
+        "next_cursor": next_cursor,
     }
 
 
-async def create_new_recording(audio, caller_id: str, duration: int):
+async def search_transcripts_data(search: str, page: int, limit: int):
+    matches, total = await search_transcripts(search, page, limit)
+    return TranscriptSearchResults(
+        results=[
+            TranscriptMatch(
+                id=call.id,
+                uuid=call.uuid,
+                date=call.created_at.isoformat(),
+                caller_id=call.caller_id,
+                status=call.status,
+                rank=rank,
+                transcript_snippet=transcript_snippet,
+                translation_snippet=translation_snippet,
+            )
+            for call, transcript_snippet, translation_snippet, rank in matches
+        ],
+        total=total,
+        page=page,
+        limit=limit,
+    )
+
+
+async def create_new_recording(audio, caller_id: str, duration: int = None):
     return await create_recording_file(audio, caller_id, duration)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+async def get_recording_audio(
+    call_uuid: str,
+    byte_range: str = None,
+    if_range: str = None,
+    if_none_match: str = None,
+):
+    call_state = await get_call_state(call_uuid)
+    if call_state is None or not call_state.recording_hash:
+        return None
+    # Recordings never change once stored, so the content hash is a strong
+    # validator whether the bytes come from the cache or from S3
+    audio = {
+        "etag": f'"{call_state.recording_hash}"',
+        "not_modified": False,
+        "path": None,
+        "s3_object": None,
+        "media_type": "audio/wav",
+        "suffix": ".wav",
+    }
+    if call_state.archive_codec == ORIGINAL_CODEC:
+        # Kept as uploaded, so served in its own format; compressed archives
+        # are decoded back to WAV
+        audio["suffix"] = os.path.splitext(call_state.recording_key or "")[1]
+        audio["media_type"] = (
+            mimetypes.guess_type(f"recording{audio['suffix']}")[0]
+            or "application/octet-stream"
+        )
+    if if_none_match and _etag_matches(if_none_match, audio["etag"]):
+        audio["not_modified"] = True
+        return audio
+    if if_range and if_range != audio["etag"]:
+        byte_range = None
+
+    release = pin_recording(call_state.recording_hash)
+    try:
+        audio["path"] = await lookup_recording(call_state.recording_hash)
+        if audio["path"] is None and call_state.recording_key:
+            if byte_range and call_state.archive_codec in (None, "wav"):
+                # Seeking in a recording that is not cached fetches only the
+                # requested bytes rather than the whole file; compressed
+                # archives have to be decoded as a whole
+                audio["s3_object"] = await open_recording_range(
+                    call_state.recording_key, byte_range
+                )
+            else:
+                audio["path"] = await fill_recording_from_s3(
+                    call_state.recording_hash,
+                    call_state.recording_key,
+                    call_state.archive_codec,
+                )
+    except BaseException:
+        release()
+        raise
+    if audio["path"] is None:
+        release()
+        if audio["s3_object"] is None:
+            return None
+    else:
+        # The caller releases the pin once the file has been sent
+        audio["release"] = release
+    return audio
+
+
+async def get_recording_peaks(call_uuid: str, if_none_match: str = None):
+    row = await get_waveform_peaks(call_uuid)
+    if row is None:
+        return None
+    content_hash, data = row
+    etag = f'"{content_hash}.peaks"'
+    return {
+        "etag": etag,
+        "not_modified": bool(if_none_match and _etag_matches(if_none_match, etag)),
+        "data": data,
+    }
+
+
+async def get_system_metrics():
+    return {
+        "api_key_cache": api_key_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "presigned_urls": presigned_urls.stats(),
+        "recording_cache": recording_cache.stats(),
+        "recording_fetcher": recording_fetcher.stats(),
+        "s3_uploader": s3_uploader.stats(),
+        "token_cache": token_cache.stats(),
+        "transcoder": transcoder.stats(),
+        "transcription_engine": transcription_engine.stats(),
+        "transcript_cache": transcript_cache.stats(),
+        "translation_service": translation_service.stats(),
+        "user_cache": user_cache.stats(),
+    }
@@ -0,0 +1,45 @@
+# spool.py
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.config import SPOOL_CHUNK_SIZE, SPOOL_DIR
+
+
+def create_spool_file(suffix: str = ""):
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    return tempfile.mkstemp(suffix=suffix, dir=SPOOL_DIR)
+
+
+def remove_spool_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Error removing spool file {path}: {e}")
+
+
+def spool_fileobj(source, suffix: str = "") -> str:
+    # Copy in bounded chunks so memory stays flat regardless of file size
+    fd, path = create_spool_file(suffix)
+    try:
+        with os.fdopen(fd, "wb") as target:
+            shutil.copyfileobj(source, target, SPOOL_CHUNK_SIZE)
+    except BaseException:
+        remove_spool_file(path)
+        raise
+    return path
+
+
+@asynccontextmanager
+async def spooled_upload(upload, suffix: str = ""):
+    path = await run_in_threadpool(spool_fileobj, upload.file, suffix)
+    try:
+        yield path
+    finally:
+        await run_in_threadpool(remove_spool_file, path)
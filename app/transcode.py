@@ -0,0 +1,163 @@
+# transcode.py
+import asyncio
+import os
+import struct
+import subprocess
+import time
+from typing import List, NamedTuple
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from speech_recognition.audio import get_flac_converter
+
+from app.audio import read_wav_info
+from app.config import (
+    ARCHIVE_CODEC,
+    ARCHIVE_FLAC_LEVEL,
+    ARCHIVE_OPUS_BITRATE,
+    TRANSCODE_WORKERS,
+)
+from app.spool import create_spool_file, remove_spool_file
+
+CODEC_SUFFIXES = {"wav": ".wav", "flac": ".flac", "opus": ".opus"}
+# Uploads that are not PCM WAV are archived byte for byte in their own format
+ORIGINAL_CODEC = "original"
+FFMPEG = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y"]
+
+
+class Transcoded(NamedTuple):
+    path: str
+    codec: str
+    bitrate: int
+    size: int
+
+
+def archive_suffix(codec: str, source_name: str = None) -> str:
+    if codec == ORIGINAL_CODEC:
+        return os.path.splitext(source_name or "")[1].lower()
+    return CODEC_SUFFIXES[codec]
+
+
+def encode_command(codec: str, source: str, target: str) -> List[str]:
+    if codec == "flac":
+        # speech_recognition ships a FLAC encoder binary for each platform
+        return [
+            get_flac_converter(),
+            "--silent",
+            "--force",
+            f"-{ARCHIVE_FLAC_LEVEL}",
+            "-o",
+            target,
+            source,
+        ]
+    if codec == "opus":
+        bitrate = str(ARCHIVE_OPUS_BITRATE)
+        return FFMPEG + ["-i", source, "-c:a", "libopus", "-b:a", bitrate, target]
+    raise ValueError(f"Unsupported archive codec {codec}")
+
+
+def decode_command(codec: str, source: str, target: str) -> List[str]:
+    if codec == "flac":
+        return [get_flac_converter(), "--silent", "--force", "-d", "-o", target, source]
+    if codec == "opus":
+        return FFMPEG + ["-i", source, "-c:a", "pcm_s16le", "-f", "wav", target]
+    raise ValueError(f"Unsupported archive codec {codec}")
+
+
+def decode_file(codec: str, source: str, target: str):
+    # Blocking; used when an archived recording is restored to WAV
+    if codec in ("wav", ORIGINAL_CODEC):
+        os.replace(source, target)
+        return
+    subprocess.run(decode_command(codec, source, target), check=True, capture_output=True)
+
+
+def average_bitrate(size: int, duration: float) -> int:
+    return int(size * 8 / duration) if duration else 0
+
+
+class Transcoder:
+    def __init__(self, codec: str = ARCHIVE_CODEC, max_workers: int = TRANSCODE_WORKERS):
+        self.codec = codec
+        self.max_workers = max_workers
+        self._semaphore = None
+        self.files = 0
+        self.failed = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    async def _encode(self, source: str, target: str):
+        # Encoders run as separate processes, at most max_workers at a time,
+        # so they use other cores without blocking the event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                *encode_command(self.codec, source, target),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await process.communicate()
+            self.busy_seconds += time.monotonic() - started
+        if process.returncode:
+            raise RuntimeError(
+                f"{self.codec} encoder failed: {stderr.decode(errors='replace').strip()}"
+            )
+
+    async def transcode(self, source: str) -> Transcoded:
+        # The caller owns the returned file unless it is the source itself,
+        # which is the case when archiving uncompressed WAV
+        input_size = await run_in_threadpool(os.path.getsize, source)
+        try:
+            info = await run_in_threadpool(read_wav_info, source)
+        except (ValueError, struct.error) as e:
+            # Uploads that are not PCM WAV are archived exactly as received
+            logger.warning(f"Archiving {source} as received: {e}")
+            return Transcoded(source, ORIGINAL_CODEC, 0, input_size)
+        if self.codec == "wav":
+            return Transcoded(
+                source, "wav", average_bitrate(input_size, info.duration), input_size
+            )
+        fd, target = create_spool_file(CODEC_SUFFIXES[self.codec])
+        os.close(fd)
+        try:
+            await self._encode(source, target)
+            size = await run_in_threadpool(os.path.getsize, target)
+        except Exception as e:
+            # A missing or failing encoder must not lose the recording
+            self.failed += 1
+            await run_in_threadpool(remove_spool_file, target)
+            logger.error(f"Error encoding {source} as {self.codec}: {e}")
+            return Transcoded(
+                source, "wav", average_bitrate(input_size, info.duration), input_size
+            )
+        except BaseException:
+            await run_in_threadpool(remove_spool_file, target)
+            raise
+        self.files += 1
+        self.input_bytes += input_size
+        self.output_bytes += size
+        self.audio_seconds += info.duration
+        return Transcoded(target, self.codec, average_bitrate(size, info.duration), size)
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.codec,
+            "max_workers": self.max_workers,
+            "files": self.files,
+            "failed": self.failed,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "compression_ratio": (
+                self.input_bytes / self.output_bytes if self.output_bytes else 0.0
+            ),
+            "seconds_per_audio_minute": (
+                60 * self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0
+            ),
+        }
+
+
+transcoder = Transcoder()
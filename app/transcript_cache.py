@@ -0,0 +1,81 @@
+# transcript_cache.py
+import hashlib
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+
+from app.config import SPOOL_CHUNK_SIZE
+from app.database import async_session
+from app.models import TranscriptCacheEntry
+
+
+def file_digest(path: str, chunk_size: int = SPOOL_CHUNK_SIZE) -> str:
+    # Hashed in bounded chunks so long recordings are never held in memory
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    async def get(
+        self, content_hash: str, engine: str, language: str
+    ) -> Optional[TranscriptCacheEntry]:
+        async with async_session() as session:
+            async with session.begin():
+                entry = await session.get(
+                    TranscriptCacheEntry, (content_hash, engine, language)
+                )
+                if entry is None:
+                    self.misses += 1
+                    return None
+                await session.execute(
+                    update(TranscriptCacheEntry)
+                    .where(
+                        TranscriptCacheEntry.content_hash == content_hash,
+                        TranscriptCacheEntry.engine == engine,
+                        TranscriptCacheEntry.language == language,
+                    )
+                    .values(hit_count=TranscriptCacheEntry.hit_count + 1)
+                )
+        self.hits += 1
+        return entry
+
+    async def put(self, entry: TranscriptCacheEntry):
+        # Two deliveries of the same recording can finish together; the later
+        # one simply refreshes the stored result.
+        values = entry.model_dump(exclude={"hit_count", "created_at"})
+        stmt = insert(TranscriptCacheEntry).values(
+            **values, created_at=entry.created_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["content_hash", "engine", "language"],
+            set_={
+                field: stmt.excluded[field]
+                for field in values
+                if field not in ("content_hash", "engine", "language")
+            },
+        )
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(stmt)
+        self.stores += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+transcript_cache = TranscriptCache()
@@ -0,0 +1,305 @@
+# transcription.py
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Tuple
+
+import speech_recognition as sr
+from loguru import logger
+
+from app.audio import (
+    VAD_VERSION,
+    pcm16_mono,
+    plan_segments,
+    speech_regions,
+    wav_samples,
+)
+from app.config import (
+    TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS,
+    TRANSCRIPTION_SEGMENT_SECONDS,
+    TRANSCRIPTION_SILENCE_SEARCH_SECONDS,
+    TRANSCRIPTION_VAD_ENABLED,
+    TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS,
+    TRANSCRIPTION_VAD_PADDING_SECONDS,
+    TRANSCRIPTION_WORKERS,
+)
+
+# Bumped whenever stitching changes the words kept from recognized segments
+STITCH_VERSION = 2
+# Fast speech; bounds how many words can fall inside a segment overlap
+MAX_WORDS_PER_SECOND = 3
+
+
+def engine_version() -> str:
+    # Cached transcripts are reused only while the recognizer and every
+    # setting that decides which audio it sees are unchanged
+    version = (
+        f"sphinx-{sr.__version__}"
+        f"/seg{TRANSCRIPTION_SEGMENT_SECONDS:g}"
+        f"-overlap{TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS:g}"
+        f"-search{TRANSCRIPTION_SILENCE_SEARCH_SECONDS:g}"
+        f"-stitch{STITCH_VERSION}"
+    )
+    if not TRANSCRIPTION_VAD_ENABLED:
+        return f"{version}/vad0"
+    return (
+        f"{version}/vad{VAD_VERSION}"
+        f"-pad{TRANSCRIPTION_VAD_PADDING_SECONDS:g}"
+        f"-gap{TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS:g}"
+    )
+
+
+ENGINE_VERSION = engine_version()
+
+# Per-process state, populated once by _init_worker in each pool process
+_recognizer = None
+_decoder = None
+
+
+def _load_sphinx_decoder():
+    try:
+        from pocketsphinx import pocketsphinx
+    except ImportError:
+        logger.warning("PocketSphinx is not installed; models will load per call")
+        return None
+    language_directory = os.path.join(
+        os.path.dirname(os.path.realpath(sr.__file__)), "pocketsphinx-data", "en-US"
+    )
+    config = pocketsphinx.Config()
+    config.set_string("-hmm", os.path.join(language_directory, "acoustic-model"))
+    config.set_string("-lm", os.path.join(language_directory, "language-model.lm.bin"))
+    config.set_string(
+        "-dict", os.path.join(language_directory, "pronounciation-dictionary.dict")
+    )
+    config.set_string("-logfn", os.devnull)
+    return pocketsphinx.Decoder(config)
+
+
+def _init_worker():
+    # Loading the acoustic and language models takes far longer than decoding
+    # a short call, so each worker does it once and reuses the decoder.
+    global _recognizer, _decoder
+    _recognizer = sr.Recognizer()
+    _decoder = _load_sphinx_decoder()
+
+
+def _recognize(audio: sr.AudioData) -> str:
+    if _decoder is None:
+        return _recognizer.recognize_sphinx(audio)
+    # The bundled models expect 16-bit mono 16 kHz audio
+    raw_data = audio.get_raw_data(convert_rate=16000, convert_width=2)
+    _decoder.start_utt()
+    _decoder.process_raw(raw_data, False, True)
+    _decoder.end_utt()
+    hypothesis = _decoder.hyp()
+    if hypothesis is None:
+        raise sr.UnknownValueError()
+    return hypothesis.hypstr
+
+
+def _transcribe_file(path: str) -> str:
+    with sr.AudioFile(path) as source:
+        audio = _recognizer.record(source)
+    return _recognize(audio)
+
+
+def _transcribe_buffer(name: str, size: int, sample_rate: int, sample_width: int) -> str:
+    buffer = shared_memory.SharedMemory(name=name)
+    try:
+        audio = sr.AudioData(bytes(buffer.buf[:size]), sample_rate, sample_width)
+    finally:
+        buffer.close()
+    return _recognize(audio)
+
+
+class Transcription(NamedTuple):
+    text: str
+    segments: List[dict]
+    speech_ratio: float
+
+
+def _plan_recording(path: str):
+    # Silence and low-level line noise are dropped before anything reaches
+    # the recognizer; only the speech regions are split into segments.
+    info, samples = wav_samples(path)
+    if TRANSCRIPTION_VAD_ENABLED:
+        regions = speech_regions(
+            samples,
+            info.sample_rate,
+            TRANSCRIPTION_VAD_PADDING_SECONDS,
+            TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS,
+        )
+    else:
+        regions = [(0, info.n_frames)] if info.n_frames else []
+    segments = []
+    for region_start, region_stop in regions:
+        segments.extend(
+            (region_start + start, region_start + stop)
+            for start, stop in plan_segments(
+                samples[region_start:region_stop],
+                info.sample_rate,
+                TRANSCRIPTION_SEGMENT_SECONDS,
+                TRANSCRIPTION_SILENCE_SEARCH_SECONDS,
+            )
+        )
+    return info.sample_rate, info.n_frames, segments
+
+
+def _transcribe_segment(path: str, start: int, stop: int) -> str:
+    info, samples = wav_samples(path)
+    audio = sr.AudioData(pcm16_mono(samples, start, stop), info.sample_rate, 2)
+    try:
+        return _recognize(audio)
+    except sr.UnknownValueError:
+        # A segment with no recognizable speech contributes no words
+        return ""
+
+
+def overlap_words(overlap_seconds: float) -> int:
+    # Neighbouring segments share twice the overlap: each is padded by it
+    return math.ceil(2 * overlap_seconds * MAX_WORDS_PER_SECOND)
+
+
+def drop_repeated_words(
+    previous: List[str], words: List[str], max_words: int
+) -> List[str]:
+    # Neighbouring segments overlap slightly, so the same words can be
+    # recognized at the end of one segment and the start of the next. Only
+    # as many words as fit in the overlap are treated as repeats; longer
+    # matches are the speaker repeating themselves.
+    for size in range(min(len(previous), len(words), max_words), 0, -1):
+        if previous[-size:] == words[:size]:
+            return words[size:]
+    return words
+
+
+def stitch_segments(
+    sample_rate: int, segments, texts, max_words: int = None
+) -> Tuple[str, List[dict]]:
+    if max_words is None:
+        max_words = overlap_words(TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS)
+    stitched = []
+    previous = []
+    for (start, stop), text in zip(segments, texts):
+        words = drop_repeated_words(previous, text.split(), max_words)
+        previous = text.split()
+        stitched.append(
+            {
+                "start": round(start / sample_rate, 3),
+                "end": round(stop / sample_rate, 3),
+                "text": " ".join(words),
+            }
+        )
+    transcript = " ".join(segment["text"] for segment in stitched if segment["text"])
+    return transcript, stitched
+
+
+def _run_timed(func, *args):
+    started = time.monotonic()
+    try:
+        result, error = func(*args), None
+    except Exception as e:
+        result, error = None, e
+    return os.getpid(), time.monotonic() - started, result, error
+
+
+class TranscriptionEngine:
+    def __init__(self, max_workers: int = TRANSCRIPTION_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._started_at = None
+        self._tasks = defaultdict(int)
+        self._busy_seconds = defaultdict(float)
+        self._audio_seconds = 0.0
+        self._speech_seconds = 0.0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_init_worker
+        )
+        self._started_at = time.monotonic()
+        # Spawn every worker up front so model loading happens at startup
+        # rather than on the first recordings.
+        for _ in range(self.max_workers):
+            self._executor.submit(os.getpid)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    async def _submit(self, func, *args) -> str:
+        self.start()
+        pid, elapsed, result, error = await asyncio.get_running_loop().run_in_executor(
+            self._executor, _run_timed, func, *args
+        )
+        self._tasks[pid] += 1
+        self._busy_seconds[pid] += elapsed
+        if error is not None:
+            raise error
+        return result
+
+    async def transcribe_file(self, path: str) -> str:
+        return await self._submit(_transcribe_file, path)
+
+    async def transcribe_buffer(
+        self,
+        buffer: shared_memory.SharedMemory,
+        size: int,
+        sample_rate: int,
+        sample_width: int,
+    ) -> str:
+        # Raw PCM is read by the worker straight from shared memory instead of
+        # being pickled through the executor's call queue.
+        return await self._submit(
+            _transcribe_buffer, buffer.name, size, sample_rate, sample_width
+        )
+
+    async def transcribe_recording(self, path: str) -> Transcription:
+        # Long recordings are split at quiet points and the segments decoded
+        # in parallel, so latency tracks segment length rather than call length.
+        sample_rate, n_samples, segments = await self._submit(_plan_recording, path)
+        overlap = int(TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS * sample_rate)
+        texts = await asyncio.gather(
+            *(
+                self._submit(
+                    _transcribe_segment,
+                    path,
+                    max(0, start - overlap),
+                    min(n_samples, stop + overlap),
+                )
+                for start, stop in segments
+            )
+        )
+        speech_samples = sum(stop - start for start, stop in segments)
+        self._audio_seconds += n_samples / sample_rate
+        self._speech_seconds += speech_samples / sample_rate
+        text, stitched = stitch_segments(sample_rate, segments, texts)
+        return Transcription(
+            text, stitched, speech_samples / n_samples if n_samples else 0.0
+        )
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "max_workers": self.max_workers,
+            "audio_seconds": self._audio_seconds,
+            "speech_seconds": self._speech_seconds,
+            "workers": {
+                str(pid): {
+                    "tasks": self._tasks[pid],
+                    "busy_seconds": self._busy_seconds[pid],
+                    "utilization": self._busy_seconds[pid] / uptime if uptime else 0.0,
+                }
+                for pid in self._tasks
+            },
+        }
+
+
+transcription_engine = TranscriptionEngine()
@@ -0,0 +1,170 @@
+# translation.py
+import asyncio
+from typing import Dict, List, Sequence
+
+from googletrans import Translator
+from loguru import logger
+
+from app.cache import LRUCache
+from app.config import (
+    TRANSLATION_BATCH_MAX_CHARS,
+    TRANSLATION_BATCH_SIZE,
+    TRANSLATION_BATCH_WAIT_SECONDS,
+    TRANSLATION_CACHE_SIZE,
+    TRANSLATION_CLIENT,
+)
+
+BATCH_SEPARATOR = "\n"
+
+
+class GoogleTranslateClient:
+    # Identifies the translations this client produces in persistent caches
+    version = "google-1"
+
+    def __init__(self):
+        # One translator, and with it one HTTP connection pool, for every call
+        self._translator = None
+
+    async def translate_batch(self, texts: Sequence[str], dest: str) -> List[str]:
+        if self._translator is None:
+            self._translator = Translator()
+        # googletrans sends a request per list item, so the batch goes out as
+        # one newline separated document and is split up again afterwards.
+        document = BATCH_SEPARATOR.join(" ".join(text.split()) for text in texts)
+        translated = await self._translator.translate(document, dest=dest)
+        lines = translated.text.split(BATCH_SEPARATOR)
+        if len(lines) == len(texts):
+            return [line.strip() for line in lines]
+        logger.warning("Batched translation lost its line breaks; retrying per text")
+        translated = await self._translator.translate(list(texts), dest=dest)
+        return [item.text for item in translated]
+
+
+class LocalTranslator:
+    # Offline stand-in for tests and benchmarks
+    version = "local-1"
+
+    async def translate_batch(self, texts: Sequence[str], dest: str) -> List[str]:
+        return [f"[{dest}] {text}" for text in texts]
+
+
+TRANSLATION_CLIENTS = {"google": GoogleTranslateClient, "local": LocalTranslator}
+
+
+class TranslationService:
+    def __init__(
+        self,
+        client=None,
+        batch_size: int = TRANSLATION_BATCH_SIZE,
+        batch_max_chars: int = TRANSLATION_BATCH_MAX_CHARS,
+        batch_wait: float = TRANSLATION_BATCH_WAIT_SECONDS,
+        cache_size: int = TRANSLATION_CACHE_SIZE,
+    ):
+        self.client = client or TRANSLATION_CLIENTS[TRANSLATION_CLIENT]()
+        self.batch_size = batch_size
+        self.batch_max_chars = batch_max_chars
+        self.batch_wait = batch_wait
+        self.cache = LRUCache(cache_size)
+        # Texts waiting to be sent, per target language
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}
+        self._pending_chars: Dict[str, int] = {}
+        self._flush_handles = {}
+        self._batches = set()
+        self.requests = 0
+        self.texts_translated = 0
+        self.failed_requests = 0
+
+    async def translate(self, text: str, dest: str) -> str:
+        if not text.strip():
+            return ""
+        cached = self.cache.get((dest, text))
+        if cached is not None:
+            return cached
+        pending = self._pending.setdefault(dest, {})
+        future = pending.get(text)
+        if future is None:
+            if pending and self._pending_chars[dest] + len(text) > self.batch_max_chars:
+                self._flush(dest)
+                pending = self._pending.setdefault(dest, {})
+            future = asyncio.get_running_loop().create_future()
+            pending[text] = future
+            self._pending_chars[dest] = self._pending_chars.get(dest, 0) + len(text)
+            if len(pending) >= self.batch_size:
+                self._flush(dest)
+            elif dest not in self._flush_handles:
+                # Wait briefly so transcripts finishing together share a request
+                self._flush_handles[dest] = asyncio.get_running_loop().call_later(
+                    self.batch_wait, self._flush, dest
+                )
+        # Shielded so one cancelled caller does not fail others waiting on
+        # the same text
+        return await asyncio.shield(future)
+
+    async def translate_texts(self, texts: Sequence[str], dest: str) -> str:
+        translated = await asyncio.gather(*(self.translate(text, dest) for text in texts))
+        return " ".join(text for text in translated if text)
+
+    async def translate_to(
+        self, texts: Sequence[str], languages: Sequence[str]
+    ) -> Dict[str, str]:
+        results = await asyncio.gather(
+            *(self.translate_texts(texts, language) for language in languages)
+        )
+        return dict(zip(languages, results))
+
+    def _flush(self, dest: str):
+        handle = self._flush_handles.pop(dest, None)
+        if handle is not None:
+            handle.cancel()
+        batch = self._pending.pop(dest, {})
+        self._pending_chars.pop(dest, None)
+        if batch:
+            task = asyncio.ensure_future(self._send(dest, batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _send(self, dest: str, batch: Dict[str, asyncio.Future]):
+        texts = list(batch)
+        self.requests += 1
+        error = None
+        try:
+            translated = await self.client.translate_batch(texts, dest)
+            if len(translated) != len(texts):
+                raise RuntimeError(
+                    f"Translation client returned {len(translated)} results "
+                    f"for {len(texts)} texts"
+                )
+        except Exception as e:
+            self.failed_requests += 1
+            logger.error(f"Translation of {len(texts)} texts to {dest} failed: {e}")
+            error = e
+        else:
+            self.texts_translated += len(texts)
+            for text, result in zip(texts, translated):
+                self.cache.put((dest, text), result)
+                if not batch[text].done():
+                    batch[text].set_result(result)
+        finally:
+            # Every caller gets an answer, even if this task is cancelled
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(
+                        error or RuntimeError(f"Translation batch to {dest} was lost")
+                    )
+
+    @property
+    def version(self) -> str:
+        return getattr(self.client, "version", type(self.client).__name__)
+
+    def stats(self) -> dict:
+        return {
+            "client": type(self.client).__name__,
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "texts_translated": self.texts_translated,
+            "pending": sum(len(pending) for pending in self._pending.values()),
+            "cache": self.cache.stats(),
+        }
+
+
+translation_service = TranslationService()
@@ -0,0 +1,111 @@
+# uploader.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.s3.transfer import TransferConfig
+
+from app.aws_setup import AWS_BUCKET_NAME, upload_file_to_s3
+from app.config import (
+    S3_MAX_CONCURRENT_UPLOADS,
+    S3_MULTIPART_CHUNKSIZE,
+    S3_MULTIPART_MAX_CONCURRENCY,
+    S3_MULTIPART_THRESHOLD,
+)
+
+
+class S3Uploader:
+    def __init__(
+        self,
+        bucket_name: str = AWS_BUCKET_NAME,
+        max_uploads: int = S3_MAX_CONCURRENT_UPLOADS,
+        transfer_config: TransferConfig = None,
+        client=None,
+    ):
+        self.bucket_name = bucket_name
+        self.max_uploads = max_uploads
+        self.transfer_config = transfer_config or TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_MULTIPART_MAX_CONCURRENCY,
+        )
+        self.client = client
+        # Uploads beyond max_uploads wait in the executor queue instead of
+        # tying up the event loop or opening unbounded S3 connections.
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_uploads, thread_name_prefix="s3-upload"
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes_uploaded = 0
+        # Wall-clock time with at least one transfer running, so throughput
+        # reflects concurrent uploads rather than the sum of their durations.
+        self.busy_seconds = 0.0
+        self._busy_since = None
+
+    def upload(self, file_path: str, s3_file_name: str) -> asyncio.Future:
+        with self._lock:
+            self.queued += 1
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, self._transfer, file_path, s3_file_name
+        )
+
+    def _transfer(self, file_path: str, s3_file_name: str) -> str:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            if self._busy_since is None:
+                self._busy_since = time.monotonic()
+        try:
+            size = os.path.getsize(file_path)
+            s3_url = upload_file_to_s3(
+                file_path,
+                self.bucket_name,
+                s3_file_name,
+                client=self.client,
+                config=self.transfer_config,
+            )
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                if self.active == 0:
+                    self.busy_seconds += time.monotonic() - self._busy_since
+                    self._busy_since = None
+        with self._lock:
+            self.completed += 1
+            self.bytes_uploaded += size
+        return s3_url
+
+    def stats(self) -> dict:
+        with self._lock:
+            busy_seconds = self.busy_seconds
+            if self._busy_since is not None:
+                busy_seconds += time.monotonic() - self._busy_since
+            return {
+                "max_uploads": self.max_uploads,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "bytes_uploaded": self.bytes_uploaded,
+                "throughput_bytes_per_second": (
+                    self.bytes_uploaded / busy_seconds
+                    if busy_seconds > 0
+                    else 0.0
+                ),
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+s3_uploader = S3Uploader()
@@ -1,20 +1,50 @@
-from fastapi import Request, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
 from vonage import Vonage, Auth
 from halo import Halo
 from loguru import logger
-from sqlalchemy import select, exists
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
 
-from app.config import VONAGE_API_KEY, VONAGE_API_SECRET, VONAGE_NUMBER
+from app.config import (
+    TRANSLATION_LANGUAGES,
+    VONAGE_API_KEY,
+    VONAGE_API_SECRET,
+    VONAGE_NUMBER,
+    WAVEFORM_PEAK_LEVELS,
+)
+from app.audio import AudioMetadata, analyze_recording, recording_peaks
+from app.crud import (
+    create_call_state,
+    has_waveform_peaks,
+    metadata_fields,
+    store_waveform_peaks,
+)
 from app.database import async_session
 from app.enums import CallStatus
-from googletrans import Translator
-import speech_recognition as sr
-from app.aws_setup import upload_file_to_s3, AWS_BUCKET_NAME
-from app.models import CallState
+from app.fetcher import RecordingFetcher, is_remote
+from app.models import CallState, CallTranslation, TranscriptCacheEntry
+from app.recording_cache import recording_cache
+from app.rollups import apply_rollup_delta, rollup_delta
+from app.spool import remove_spool_file
+from app.transcode import archive_suffix, transcoder
+from app.transcript_cache import file_digest, transcript_cache
+from app.transcription import ENGINE_VERSION, transcription_engine
+from app.translation import translation_service
+from app.uploader import s3_uploader
 
 auth = Auth(api_key=VONAGE_API_KEY, api_secret=VONAGE_API_SECRET)
 vonage_client = Vonage(auth=auth)
 voice = vonage_client.voice
+recording_fetcher = RecordingFetcher(auth=auth)
+
+# Vonage records MP3 unless asked otherwise; transcription reads PCM WAV
+RECORDING_FORMAT = "wav"
 
 def create_ncco(request: Request):
     return [
@@ -25,6 +55,7 @@ def create_ncco(request: Request):
         {
             "action": "record",
             "eventUrl": [f"{request.base_url}api/v1/calls/recordings"],
+            "format": RECORDING_FORMAT,
             "beepStart": False,
         },
         {
@@ -38,77 +69,209 @@ def create_ncco(request: Request):
         },
     ]
 
-async def store_call_state(call_uuid: str):
+async def store_call_state(call_uuid: str) -> bool:
     spinner = Halo(text="Storing call state", spinner="dots")
     spinner.start()
-    async with async_session() as session:
-        async with session.begin():
-            existing_call_state = await session.execute(
-                select(exists().where(CallState.uuid == call_uuid))
-            )
-            existing_call_state = existing_call_state.scalar_one_or_none()
-            if not existing_call_state:
-                call_state = CallState(
-                    uuid=call_uuid, status=CallStatus.RECORDING.value
-                )
-                session.add(call_state)
-            else:
-                logger.info(f"Call state with uuid {call_uuid} already exists")
+    created = await create_call_state(call_uuid, CallStatus.RECORDING.value)
+    if not created:
+        logger.info(f"Call state with uuid {call_uuid} already exists")
     spinner.succeed("Call state stored successfully")
+    return created
 
-async def handle_recording(call_uuid: str, recording_url: str, status: str):
-    spinner = Halo(text="Handling recording event", spinner="dots")
-    spinner.start()
+@asynccontextmanager
+async def _local_recording(call_uuid: str, recording_url: str):
+    # Reprocessing a call reuses its cached recording when it is still on
+    # disk. Otherwise the recording is downloaded once and moved into the
+    # cache, and that file feeds hashing, recognition and the S3 upload.
     async with async_session() as session:
-        async with session.begin():
-            call_state = await session.get(CallState, call_uuid)
-            if call_state:
-                if status == CallStatus.RECORDING.value:
-                    logger.info(f"Recording started for call {call_uuid}")
-                elif status == CallStatus.COMPLETED.value:
-                    logger.info(
-                        f"Recording completed for call {call_uuid}. URL: {recording_url}"
-                    )
-                    await transcribe_and_translate(call_uuid, recording_url)
-                    await session.delete(call_state)
-                elif status == CallStatus.FAILED.value:
-                    logger.error(f"Recording failed for call {call_uuid}")
-                    await session.delete(call_state)
-    spinner.succeed("Recording event handled successfully")
+        known_hash = (
+            await session.execute(
+                select(CallState.recording_hash).where(CallState.uuid == call_uuid)
+            )
+        ).scalar()
+    if known_hash:
+        with recording_cache.pinned(known_hash):
+            path = await run_in_threadpool(recording_cache.lookup, known_hash)
+            if path:
+                yield path, known_hash
+                return
+    async with recording_fetcher.fetched(
+        recording_url, f".{RECORDING_FORMAT}"
+    ) as fetched_path:
+        content_hash = await run_in_threadpool(file_digest, fetched_path)
+        with recording_cache.pinned(content_hash):
+            path = await run_in_threadpool(
+                recording_cache.add, content_hash, fetched_path, is_remote(recording_url)
+            )
+            yield path, content_hash
 
-async def handle_call_event(call_uuid: str, status: str):
-    spinner = Halo(text="Handling call event", spinner="dots")
-    spinner.start()
+async def _store_translations(session, call_uuid: str, translations: dict):
+    if not translations:
+        return
+    now = datetime.now(timezone.utc)
+    stmt = insert(CallTranslation).values(
+        [
+            {"call_uuid": call_uuid, "language": language, "text": text, "created_at": now}
+            for language, text in translations.items()
+        ]
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["call_uuid", "language"], set_={"text": stmt.excluded.text}
+        )
+    )
+
+async def _recording_metadata(content_hash: str, recording_path: str):
+    # A recording seen before keeps the metadata measured the first time
     async with async_session() as session:
-        async with session.begin():
-            call_state = await session.get(CallState, call_uuid)
-            if call_state and status == CallStatus.COMPLETED.value:
-                logger.info(f"Call {call_uuid} completed")
-                await session.delete(call_state)
-    spinner.succeed("Call event handled successfully")
+        known = (
+            await session.execute(
+                select(CallState)
+                .where(
+                    CallState.recording_hash == content_hash,
+                    CallState.sample_rate.is_not(None),
+                )
+                .limit(1)
+            )
+        ).scalar_one_or_none()
+    if known:
+        return AudioMetadata(
+            known.duration,
+            known.sample_rate,
+            known.channels,
+            known.loudness_dbfs,
+            known.clipping_ratio,
+        )
+    return await run_in_threadpool(analyze_recording, recording_path)
+
+async def _missing_peaks(content_hash: str, recording_path: str):
+    if await has_waveform_peaks(content_hash):
+        return None
+    return await run_in_threadpool(
+        recording_peaks, recording_path, WAVEFORM_PEAK_LEVELS
+    )
+
+def _cache_engine() -> str:
+    # Cached results are only reused for the recognizer settings and the
+    # translation client that produced them
+    return f"{ENGINE_VERSION}/translate-{translation_service.version}"
 
 async def transcribe_and_translate(call_uuid: str, recording_url: str):
-    recognizer = sr.Recognizer()
-    translator = Translator()
+    cache_engine = _cache_engine()
     try:
-        with sr.AudioFile(recording_url) as source:
-            audio = recognizer.record(source)
-        transcript = recognizer.recognize_sphinx(audio)
-        translation = await translator.translate(transcript, dest="es")
-        translation_text = translation.text
+        async with _local_recording(call_uuid, recording_url) as (
+            recording_path,
+            content_hash,
+        ):
+            cached = await asyncio.gather(
+                *(
+                    transcript_cache.get(content_hash, cache_engine, language)
+                    for language in TRANSLATION_LANGUAGES
+                )
+            )
+            translations = {
+                entry.language: entry.translation for entry in cached if entry
+            }
+            source = next((entry for entry in cached if entry), None)
+            if source:
+                logger.info(f"Reusing transcript of recording {content_hash}")
+                transcript = source.transcript
+                segments = source.transcript_segments
+                speech_ratio = source.speech_ratio
+                s3_key = source.s3_key
+                archive = (source.archive_codec, source.archive_bitrate, source.archive_size)
+                metadata, peaks = await asyncio.gather(
+                    _recording_metadata(content_hash, recording_path),
+                    _missing_peaks(content_hash, recording_path),
+                )
+            else:
+                (transcript, segments, speech_ratio), transcoded, metadata, peaks = (
+                    await asyncio.gather(
+                        transcription_engine.transcribe_recording(recording_path),
+                        transcoder.transcode(recording_path),
+                        run_in_threadpool(analyze_recording, recording_path),
+                        _missing_peaks(content_hash, recording_path),
+                    )
+                )
+                s3_key = f"{call_uuid}{archive_suffix(transcoded.codec, urlparse(recording_url).path)}"
+                try:
+                    s3_url = await s3_uploader.upload(transcoded.path, s3_key)
+                finally:
+                    if transcoded.path != recording_path:
+                        await run_in_threadpool(remove_spool_file, transcoded.path)
+                logger.info(f"Audio file uploaded to S3: {s3_url}")
+                archive = (transcoded.codec, transcoded.bitrate, transcoded.size)
+
+        missing = [
+            language for language in TRANSLATION_LANGUAGES if language not in translations
+        ]
+        if missing:
+            # Segments are translated one by one so their translations are
+            # cached and batched alongside other calls' segments
+            texts = [segment["text"] for segment in segments] if segments else [transcript]
+            translations.update(await translation_service.translate_to(texts, missing))
+            await asyncio.gather(
+                *(
+                    transcript_cache.put(
+                        TranscriptCacheEntry(
+                            content_hash=content_hash,
+                            engine=cache_engine,
+                            language=language,
+                            transcript=transcript,
+                            transcript_segments=segments,
+                            speech_ratio=speech_ratio,
+                            translation=translations[language],
+                            s3_key=s3_key,
+                            archive_codec=archive[0],
+                            archive_bitrate=archive[1],
+                            archive_size=archive[2],
+                        )
+                    )
+                    for language in missing
+                )
+            )
 
         async with async_session() as session:
             async with session.begin():
-                call_state = await session.get(CallState, call_uuid)
+                call_state = (
+                    await session.execute(
+                        select(CallState).where(CallState.uuid == call_uuid)
+                    )
+                ).scalar_one_or_none()
                 if call_state:
                     call_state.transcript = transcript
-                    call_state.translation = translation_text
+                    call_state.transcript_segments = segments
+                    call_state.speech_ratio = speech_ratio
+                    call_state.recording_key = s3_key
+                    call_state.recording_hash = content_hash
+                    (
+                        call_state.archive_codec,
+                        call_state.archive_bitrate,
+                        call_state.archive_size,
+                    ) = archive
+                    measured = metadata_fields(metadata)
+                    if "duration" in measured:
+                        await apply_rollup_delta(
+                            session,
+                            rollup_delta(
+                                (call_state.status, call_state.duration),
+                                (call_state.status, measured["duration"]),
+                            ),
+                            call_state.created_at,
+                        )
+                    for field, value in measured.items():
+                        setattr(call_state, field, value)
+                    # The first configured language stays on the call itself
+                    call_state.translation = translations.get(
+                        next(iter(TRANSLATION_LANGUAGES), None)
+                    )
                     session.add(call_state)
+                await _store_translations(session, call_uuid, translations)
+                await store_waveform_peaks(session, content_hash, peaks)
 
-        s3_url = upload_file_to_s3(recording_url, AWS_BUCKET_NAME, f"{call_uuid}.mp3")
-        logger.info(f"Audio file uploaded to S3: {s3_url}")
         logger.info(f"Transcript: {transcript}")
-        logger.info(f"Translation: {translation_text}")
+        logger.info(f"Translations: {translations}")
     except Exception as e:
+        # The job worker records the error and decides whether to retry
         logger.error(f"Error during transcription or translation: {e}")
-        raise HTTPException(status_code=500, detail="Failed to process recording")
+        raise
@@ -0,0 +1,59 @@
+# auth.py
+# Per-request cost of resolving a bearer token: verifying the JWT on every
+# request against reusing the cached claims.
+#
+#   python -m benchmarks.auth -n 20000
+import argparse
+import asyncio
+import time
+
+from jose import jwt
+
+from app.auth import (
+    ALGORITHM,
+    SECRET_KEY,
+    create_access_token,
+    decode_token,
+    token_cache,
+    token_digest,
+)
+
+
+async def per_call_micros(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def run(iterations: int):
+    token = create_access_token({"sub": "benchmark"})
+
+    async def verify():
+        jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    async def cached():
+        await decode_token(token)
+
+    # Prime the cache directly so the run measures only the hit path and
+    # does not need a database for the revocation check
+    token_cache.put(token_digest(token), jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]))
+    uncached_us = await per_call_micros(verify, iterations)
+    cached_us = await per_call_micros(cached, iterations)
+    print(f"{'path':<22} {'us/request':>10}")
+    print(f"{'jwt.decode':<22} {uncached_us:>10.1f}")
+    print(f"{'cached claims':<22} {cached_us:>10.1f}")
+    print(f"speedup {uncached_us / max(cached_us, 1e-9):.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare JWT verification with the verified-token cache."
+    )
+    parser.add_argument("-n", "--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# transcode.py
+# Measure archive size and encoder CPU time per minute of audio for each
+# codec that can run here.
+#
+#   python -m benchmarks.transcode recordings/*.wav
+#
+# Without arguments synthetic calls are generated as in benchmarks.vad.
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import tempfile
+
+from app.audio import read_wav_info
+from app.transcode import Transcoder
+from benchmarks.vad import synthetic_call
+
+
+def available_codecs():
+    codecs = ["flac"]
+    if shutil.which("ffmpeg"):
+        codecs.append("opus")
+    return codecs
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def benchmark(codec: str, paths) -> dict:
+    transcoder = Transcoder(codec)
+    started = children_cpu()
+    results = await asyncio.gather(*(transcoder.transcode(path) for path in paths))
+    cpu_seconds = children_cpu() - started
+    for result in results:
+        if result.path not in paths:
+            os.remove(result.path)
+    audio_seconds = sum(read_wav_info(path).duration for path in paths)
+    stats = transcoder.stats()
+    return {
+        "input_bytes": stats["input_bytes"],
+        "output_bytes": stats["output_bytes"],
+        "ratio": stats["compression_ratio"],
+        "kbps": 8 * stats["output_bytes"] / audio_seconds / 1000,
+        "cpu_per_minute": 60 * cpu_seconds / audio_seconds,
+        "failed": stats["failed"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure archive size and encoder CPU time per audio minute."
+    )
+    parser.add_argument("paths", nargs="*", help="PCM WAV recordings")
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        directory = tempfile.mkdtemp()
+        paths = [
+            synthetic_call(os.path.join(directory, f"call_{i}.wav"), speech, silence)
+            for i, (speech, silence) in enumerate([(5, 10), (10, 20), (20, 40)])
+        ]
+
+    print(f"{'codec':<6} {'wav MB':>8} {'archive MB':>11} {'ratio':>6} {'kbps':>7} {'cpu s/min':>10}")
+    for codec in available_codecs():
+        result = asyncio.run(benchmark(codec, paths))
+        if result["failed"]:
+            print(f"{codec:<6} encoder failed on {result['failed']} recordings")
+            continue
+        print(
+            f"{codec:<6} {result['input_bytes'] / 1e6:>8.2f} "
+            f"{result['output_bytes'] / 1e6:>11.2f} {result['ratio']:>5.1f}x "
+            f"{result['kbps']:>7.1f} {result['cpu_per_minute']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
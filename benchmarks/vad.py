@@ -0,0 +1,95 @@
+# vad.py
+# Compare recognizer CPU time with and without voice activity detection.
+#
+#   python -m benchmarks.vad recordings/*.wav
+#
+# Without arguments a few synthetic calls (tone bursts between long silences)
+# are generated so the script can run anywhere.
+import argparse
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from app import transcription
+from app.audio import speech_regions, wav_samples
+from app.config import (
+    TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS,
+    TRANSCRIPTION_VAD_PADDING_SECONDS,
+)
+
+
+def synthetic_call(path: str, speech_seconds: float, silence_seconds: float):
+    sample_rate = 16000
+    rng = np.random.default_rng(0)
+    t = np.arange(int(speech_seconds * sample_rate)) / sample_rate
+    burst = 6000 * np.sin(2 * np.pi * 180 * t) * (1 + np.sin(2 * np.pi * 3 * t)) / 2
+    quiet = rng.normal(0, 20, int(silence_seconds * sample_rate))
+    audio = np.concatenate([quiet, burst, quiet, burst, quiet])
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(audio.astype("<i2").tobytes())
+    return path
+
+
+def recognize_regions(path: str, regions) -> float:
+    started = time.process_time()
+    for start, stop in regions:
+        transcription._transcribe_segment(path, start, stop)
+    return time.process_time() - started
+
+
+def benchmark(path: str) -> dict:
+    info, samples = wav_samples(path)
+    started = time.process_time()
+    regions = speech_regions(
+        samples,
+        info.sample_rate,
+        TRANSCRIPTION_VAD_PADDING_SECONDS,
+        TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS,
+    )
+    vad_seconds = time.process_time() - started
+    speech_samples = sum(stop - start for start, stop in regions)
+    return {
+        "duration": info.duration,
+        "speech_ratio": speech_samples / info.n_frames if info.n_frames else 0.0,
+        "vad_cpu": vad_seconds,
+        "untrimmed_cpu": recognize_regions(path, [(0, info.n_frames)]),
+        "trimmed_cpu": recognize_regions(path, regions) + vad_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare recognizer CPU time with and without voice activity "
+        "detection."
+    )
+    parser.add_argument("paths", nargs="*", help="PCM WAV recordings")
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        directory = tempfile.mkdtemp()
+        paths = [
+            synthetic_call(os.path.join(directory, f"call_{i}.wav"), speech, silence)
+            for i, (speech, silence) in enumerate([(5, 10), (10, 20), (20, 40)])
+        ]
+
+    transcription._init_worker()
+    print(f"{'recording':<30} {'secs':>7} {'speech':>7} {'full cpu':>9} {'trim cpu':>9} {'speedup':>8}")
+    for path in paths:
+        result = benchmark(path)
+        speedup = result["untrimmed_cpu"] / max(result["trimmed_cpu"], 1e-9)
+        print(
+            f"{os.path.basename(path):<30} {result['duration']:>7.1f} "
+            f"{result['speech_ratio']:>7.0%} {result['untrimmed_cpu']:>9.2f} "
+            f"{result['trimmed_cpu']:>9.2f} {speedup:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,28 @@ from loguru import logger
 
 from app.config import LOG_FILE
 from app.database import init_db
+from app.jobs import JobWorkerPool
+from app.passwords import password_hasher
 from app.routes import router
+from app.services import process_transcription_job
+from app.transcription import transcription_engine
+from app.uploader import s3_uploader
+from app.vonage_setup import recording_fetcher
 
 logger.add(LOG_FILE, rotation="1 day")
 
 @asynccontextmanager
 async def lifespan(app_context: FastAPI):
     await init_db()
+    transcription_engine.start()
+    transcription_workers = JobWorkerPool(process_transcription_job)
+    transcription_workers.start()
     yield
+    await transcription_workers.stop()
+    await recording_fetcher.close()
+    s3_uploader.shutdown()
+    password_hasher.shutdown()
+    transcription_engine.shutdown()
 
 # FastAPI app configuration
 app = FastAPI(
@@ -0,0 +1,179 @@
+import wave
+
+import numpy as np
+import pytest
+
+from app.audio import (
+    analyze_recording,
+    decode_peaks,
+    frame_features,
+    frame_rms,
+    pcm16_mono,
+    plan_segments,
+    read_wav_info,
+    recording_peaks,
+    speech_regions,
+    waveform_peaks,
+    wav_samples,
+)
+
+
+def write_wav(path, samples, sample_rate=8000, channels=1):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.astype("<i2").tobytes())
+    return str(path)
+
+
+def tone(seconds, sample_rate=8000, amplitude=8000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return amplitude * np.sin(2 * np.pi * 440 * t)
+
+
+def silence(seconds, sample_rate=8000):
+    return np.zeros(int(seconds * sample_rate))
+
+
+def test_read_wav_info(tmp_path):
+    path = write_wav(tmp_path / "stereo.wav", np.zeros(16000), channels=2)
+    info = read_wav_info(path)
+    assert info.sample_rate == 8000
+    assert info.channels == 2
+    assert info.sample_width == 2
+    assert info.n_frames == 8000
+    assert info.duration == 1.0
+    assert info.data_offset == 44
+
+
+def test_read_wav_info_rejects_other_formats(tmp_path):
+    path = tmp_path / "recording.mp3"
+    path.write_bytes(b"ID3" + b"\x00" * 100)
+    with pytest.raises(ValueError):
+        read_wav_info(str(path))
+
+
+def test_frame_rms(tmp_path):
+    path = write_wav(tmp_path / "recording.wav", np.concatenate([silence(1), tone(1)]))
+    _, samples = wav_samples(path)
+    rms = frame_rms(samples, 80, block_frames=7)
+    assert rms.shape == (200,)
+    assert rms[:100].max() == 0
+    assert rms[100:].min() == pytest.approx(8000 / 32768 / np.sqrt(2), rel=0.05)
+
+
+def test_pcm16_mono(tmp_path):
+    stereo = np.array([[1000, 3000], [-1000, -3000]]).reshape(-1)
+    path = write_wav(tmp_path / "stereo.wav", stereo, channels=2)
+    _, samples = wav_samples(path)
+    assert np.frombuffer(pcm16_mono(samples, 0, 2), "<i2").tolist() == [2000, -2000]
+
+
+def test_plan_segments_cuts_at_silence(tmp_path):
+    audio = np.concatenate([tone(9), silence(0.5), tone(9), silence(0.5), tone(3)])
+    path = write_wav(tmp_path / "recording.wav", audio)
+    _, samples = wav_samples(path)
+    segments = plan_segments(samples, 8000, segment_seconds=10, search_seconds=2)
+    assert len(segments) == 3
+    assert segments[0][0] == 0
+    assert segments[-1][1] == len(audio)
+    assert 9 * 8000 <= segments[0][1] <= 9.5 * 8000
+    assert all(stop - start <= 12 * 8000 for start, stop in segments)
+
+
+def test_plan_segments_short_recording(tmp_path):
+    path = write_wav(tmp_path / "recording.wav", tone(3))
+    _, samples = wav_samples(path)
+    assert plan_segments(samples, 8000, segment_seconds=10, search_seconds=2) == [(0, 24000)]
+
+
+def test_frame_features(tmp_path):
+    path = write_wav(tmp_path / "recording.wav", np.concatenate([silence(1), tone(1)]))
+    _, samples = wav_samples(path)
+    rms, zcr = frame_features(samples, 80, block_frames=7)
+    assert np.allclose(rms, frame_rms(samples, 80))
+    assert zcr[:100].max() == 0
+    # A 440 Hz tone crosses zero 880 times a second
+    assert zcr[100:].mean() == pytest.approx(880 / 8000, rel=0.1)
+
+
+def test_speech_regions(tmp_path):
+    audio = np.concatenate([silence(2), tone(1), silence(0.2), tone(1), silence(3)])
+    path = write_wav(tmp_path / "recording.wav", audio)
+    _, samples = wav_samples(path)
+    assert speech_regions(samples, 8000) == [(int(1.7 * 8000), int(4.5 * 8000))]
+
+
+def test_speech_regions_drops_noise(tmp_path):
+    rng = np.random.default_rng(0)
+    noise = rng.normal(0, 30, 8000 * 5)
+    click = np.zeros(8000 * 5)
+    click[20000:20080] = 10000
+    path = write_wav(tmp_path / "recording.wav", noise + click)
+    _, samples = wav_samples(path)
+    assert speech_regions(samples, 8000) == []
+
+
+def test_speech_regions_continuous_audio(tmp_path):
+    t = np.arange(10 * 8000) / 8000
+    # 14 dB envelope: no frame is 12 dB above the quietest tenth
+    envelope = 10 ** ((7 * np.sin(2 * np.pi * 0.5 * t) - 7) / 20)
+    for audio in (tone(10), tone(10) * envelope):
+        path = write_wav(tmp_path / "recording.wav", audio)
+        _, samples = wav_samples(path)
+        assert speech_regions(samples, 8000) == [(0, len(audio))]
+
+
+def test_speech_regions_silence(tmp_path):
+    path = write_wav(tmp_path / "recording.wav", silence(2))
+    _, samples = wav_samples(path)
+    assert speech_regions(samples, 8000) == []
+
+
+def test_analyze_recording(tmp_path):
+    samples = np.concatenate([tone(1.5, amplitude=16384), np.full(12, 32767)])
+    path = write_wav(tmp_path / "call.wav", np.repeat(samples, 2), channels=2)
+    metadata = analyze_recording(path)
+    assert metadata.sample_rate == 8000
+    assert metadata.channels == 2
+    assert metadata.duration == pytest.approx(1.5, abs=0.01)
+    # A sine at half of full scale has an RMS of -9 dBFS
+    assert metadata.loudness_dbfs == pytest.approx(-9.03, abs=0.05)
+    assert metadata.clipping_ratio == pytest.approx(12 / len(samples))
+
+
+def test_analyze_recording_silence_and_other_formats(tmp_path):
+    metadata = analyze_recording(write_wav(tmp_path / "silence.wav", silence(1)))
+    assert metadata.loudness_dbfs == -200
+    assert metadata.clipping_ratio == 0
+    other = tmp_path / "call.mp3"
+    other.write_bytes(b"ID3" + bytes(100))
+    assert analyze_recording(str(other)) is None
+
+
+def test_waveform_peaks(tmp_path):
+    samples = np.concatenate([silence(0.5), tone(0.5, amplitude=16384)])
+    path = write_wav(tmp_path / "call.wav", samples)
+    _, mapped = wav_samples(path)
+    peaks = waveform_peaks(mapped, [100, 400], block_peaks=3)
+    assert [level for level, _ in peaks] == [100, 400]
+    fine, coarse = peaks[0][1], peaks[1][1]
+    assert fine.shape == (80, 2)
+    assert coarse.shape == (20, 2)
+    assert np.all(fine[:40] == 0)
+    assert fine[60, 0] == pytest.approx(-0.5, abs=0.01)
+    assert fine[60, 1] == pytest.approx(0.5, abs=0.01)
+    assert np.array_equal(coarse[:, 0], fine[:, 0].reshape(20, 4).min(axis=1))
+    with pytest.raises(ValueError):
+        waveform_peaks(mapped, [100, 250])
+
+
+def test_encode_peaks_round_trip(tmp_path):
+    path = write_wav(tmp_path / "call.wav", tone(1.05, amplitude=32767))
+    data = recording_peaks(path, [256, 1024])
+    sample_rate, levels = decode_peaks(data)
+    assert sample_rate == 8000
+    assert [(level, len(peaks)) for level, peaks in levels] == [(256, 33), (1024, 9)]
+    assert levels[1][1].max() == 127
+    assert levels[1][1].min() == -127
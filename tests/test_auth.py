@@ -1,7 +1,11 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import patch
+
 import pytest
 from fastapi import HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from app.auth import (
@@ -13,6 +17,11 @@ from app.auth import (
     create_access_token,
     get_current_user,
     get_current_active_user,
+    decode_token,
+    revoke_token,
+    set_user_disabled,
+    token_cache,
+    user_cache,
     Token,
     TokenData,
 )
@@ -127,3 +136,65 @@ def test_token_model():
 def test_token_data_model():
     token_data = TokenData(username="testuser")
     assert token_data.username == "testuser"
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_is_cached():
+    async with async_session() as session:
+        async with session.begin():
+            session.add(UserModel(username="cacheduser", hashed_password="testpassword"))
+    user_cache.clear()
+    token = create_access_token({"sub": "cacheduser"})
+    with patch("app.auth.get_user", wraps=get_user) as mock_get_user:
+        first = await get_current_active_user(await get_current_user(token))
+        second = await get_current_active_user(await get_current_user(token))
+        assert first.username == second.username == "cacheduser"
+        assert mock_get_user.call_count == 1
+
+        await set_user_disabled("cacheduser")
+        with pytest.raises(HTTPException):
+            await get_current_active_user(await get_current_user(token))
+        assert mock_get_user.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_decode_token_is_cached_until_revoked():
+    token_cache.clear()
+    token = create_access_token({"sub": "testuser"}, timedelta(minutes=5))
+    with patch("app.auth.jwt.decode", wraps=jwt.decode) as mock_decode:
+        claims = await decode_token(token)
+        assert await decode_token(token) == claims
+        assert mock_decode.call_count == 1
+    assert claims["sub"] == "testuser"
+
+    await revoke_token(token)
+    assert len(token_cache) == 0
+    with pytest.raises(HTTPException) as excinfo:
+        await get_current_user(token)
+    assert excinfo.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_revoking_during_verification_is_not_cached():
+    token_cache.clear()
+    token = create_access_token({"sub": "testuser"}, timedelta(minutes=5))
+    checking = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_revocation_check(digest):
+        checking.set()
+        await release.wait()
+        return False
+
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    with patch("app.auth.is_token_revoked", side_effect=slow_revocation_check):
+        pending = asyncio.ensure_future(decode_token(token))
+        await checking.wait()
+        # Another request, already past verification, logs the token out
+        with patch("app.auth.decode_token", return_value=claims):
+            await revoke_token(token)
+        release.set()
+        await pending
+    assert len(token_cache) == 0
+    with pytest.raises(JWTError):
+        await decode_token(token)
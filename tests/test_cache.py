@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.cache import LRUCache, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.pop("a") == 1
+    assert len(cache) == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(10, ttl=30, clock=clock)
+    cache.put("alice", "user")
+    clock.now = 29
+    assert cache.get("alice") == "user"
+    clock.now = 30
+    assert cache.get("alice") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["expirations"] == 1
+    assert stats["size"] == 0
+
+
+def test_ttl_cache_entry_ttl_is_capped():
+    clock = FakeClock()
+    cache = TTLCache(10, ttl=30, clock=clock)
+    cache.put("short", 1, ttl=5)
+    cache.put("long", 2, ttl=300)
+    clock.now = 10
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+    clock.now = 30
+    assert cache.get("long") is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_collapses_concurrent_misses():
+    cache = TTLCache(10, ttl=30)
+    calls = []
+
+    async def load(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key.upper()
+
+    results = await asyncio.gather(*(cache.get_or_load("alice", load) for _ in range(5)))
+    assert results == ["ALICE"] * 5
+    assert calls == ["alice"]
+    assert await cache.get_or_load("alice", load) == "ALICE"
+    assert calls == ["alice"]
+    assert cache.stats()["loads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_does_not_cache_missing_or_failed_loads():
+    cache = TTLCache(10, ttl=30)
+
+    async def missing(key):
+        return None
+
+    async def failing(key):
+        raise RuntimeError("database unavailable")
+
+    assert await cache.get_or_load("bob", missing) is None
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load("bob", failing)
+    assert len(cache) == 0
+    assert cache.stats()["loading"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pop_discards_load_in_flight():
+    cache = TTLCache(10, ttl=30)
+    release = asyncio.Event()
+
+    async def load(key):
+        await release.wait()
+        return "stale"
+
+    pending = asyncio.ensure_future(cache.get_or_load("alice", load))
+    await asyncio.sleep(0)
+    cache.pop("alice")
+    release.set()
+    assert await pending == "stale"
+    assert cache.get("alice") is None
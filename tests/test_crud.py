@@ -1,3 +1,9 @@
+import asyncio
+import io
+import os
+import wave
+from unittest.mock import patch
+
 import pytest
 from sqlalchemy import select, delete
 from app.database import async_session
@@ -8,9 +14,15 @@ from app.crud import (
     get_all_call_states,
     search_call_states,
     create_recording_file,
+    encode_cursor,
+    InvalidCursor,
+    decode_cursor,
+    build_fts_query,
+    search_transcripts,
+    normalize_caller_id,
 )
-from app.enums import CallStatus
-from app.models import CallState
+from app.enums import CallerMatch, CallStatus
+from app.models import CallState, DashboardRollup, WaveformPeaks
 
 
 @pytest.fixture(autouse=True)
@@ -18,6 +30,7 @@ async def clear_database():
     async with async_session() as session:
         async with session.begin():
             await session.execute(delete(CallState))
+            await session.execute(delete(DashboardRollup))
             await session.commit()
 
 @pytest.mark.asyncio
@@ -30,6 +43,19 @@ async def test_create_call_state():
             assert call_state is not None
             assert call_state.status == CallStatus.RECORDING.value
 
+@pytest.mark.asyncio
+async def test_create_call_state_is_idempotent():
+    created = await asyncio.gather(
+        *(create_call_state("test-uuid", CallStatus.RECORDING.value) for _ in range(5))
+    )
+    assert sorted(created) == [False, False, False, False, True]
+    assert await create_call_state("test-uuid", CallStatus.COMPLETED.value) is False
+    async with async_session() as session:
+        call_states = (await session.execute(select(CallState))).scalars().all()
+        assert [call_state.status for call_state in call_states] == [CallStatus.RECORDING.value]
+        rollup = (await session.execute(select(DashboardRollup))).scalar_one()
+        assert rollup.total_recordings == 1
+
 @pytest.mark.asyncio
 async def test_get_call_state():
     await create_call_state("test-uuid", CallStatus.RECORDING.value)
@@ -60,8 +86,136 @@ async def test_search_call_states():
     assert total == 2
 
 @pytest.mark.asyncio
-async def test_create_recording_file():
+async def test_search_call_states_pagination():
+    for i in range(5):
+        await create_call_state(f"test-uuid-{i}", CallStatus.RECORDING.value)
+    first_page, total = await search_call_states(None, 1, 2)
+    second_page, _ = await search_call_states(None, 2, 2)
+    assert total == 5
+    assert [c.uuid for c in first_page] == ["test-uuid-4", "test-uuid-3"]
+    assert [c.uuid for c in second_page] == ["test-uuid-2", "test-uuid-1"]
+
+@pytest.mark.asyncio
+async def test_search_call_states_cursor():
+    for i in range(5):
+        await create_call_state(f"test-uuid-{i}", CallStatus.RECORDING.value)
+    first_page, _ = await search_call_states(None, 1, 2)
+    next_page, total = await search_call_states(None, 1, 2, encode_cursor(first_page[-1]))
+    assert total == 5
+    assert [c.uuid for c in next_page] == ["test-uuid-2", "test-uuid-1"]
+
+def test_decode_cursor_invalid():
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor")
+
+def test_normalize_caller_id():
+    assert normalize_caller_id("+1 (636) 214-5464") == "16362145464"
+    assert normalize_caller_id("0044 20 7946 0018") == "442079460018"
+    assert normalize_caller_id("anonymous") is None
+
+@pytest.mark.asyncio
+async def test_search_call_states_caller_match():
+    async with async_session() as session:
+        async with session.begin():
+            for i, caller_id in enumerate(["+16362145464", "+442079460018", "+15552145518"]):
+                digits = normalize_caller_id(caller_id)
+                session.add(CallState(uuid=f"uuid-{i}", status=CallStatus.COMPLETED.value, caller_id=caller_id, caller_digits=digits, caller_digits_reversed=digits[::-1]))
+    call_states, total = await search_call_states("+1 636", 1, 10, match=CallerMatch.PREFIX)
+    assert total == 1
+    assert call_states[0].caller_id == "+16362145464"
+    call_states, total = await search_call_states("0018", 1, 10, match=CallerMatch.SUFFIX)
+    assert total == 1
+    assert call_states[0].caller_id == "+442079460018"
+    _, total = await search_call_states("18", 1, 10, match=CallerMatch.SUFFIX)
+    assert total == 2
+    _, total = await search_call_states("636", 1, 10, match=CallerMatch.EXACT)
+    assert total == 0
+    _, total = await search_call_states("abc", 1, 10, match=CallerMatch.PREFIX)
+    assert total == 0
+
+def test_build_fts_query():
+    assert build_fts_query('refund "OR" bill*') == '"refund" "OR" "bill"*'
+    with pytest.raises(ValueError):
+        build_fts_query("***")
+
+@pytest.mark.asyncio
+async def test_search_transcripts():
+    async with async_session() as session:
+        async with session.begin():
+            session.add(CallState(uuid="uuid-1", status=CallStatus.COMPLETED.value, transcript="i would like a refund please"))
+            session.add(CallState(uuid="uuid-2", status=CallStatus.COMPLETED.value, transcript="my bill is wrong", translation="mi factura es incorrecta"))
+    matches, total = await search_transcripts("refund", 1, 10)
+    assert total == 1
+    call_state, transcript_snippet, translation_snippet, rank = matches[0]
+    assert call_state.uuid == "uuid-1"
+    assert "<mark>refund</mark>" in transcript_snippet
+
+    matches, total = await search_transcripts("factura", 1, 10)
+    assert total == 1
+    assert matches[0][0].uuid == "uuid-2"
+
+@pytest.mark.asyncio
+async def test_search_transcripts_escapes_snippets():
+    async with async_session() as session:
+        async with session.begin():
+            session.add(CallState(uuid="uuid-1", status=CallStatus.COMPLETED.value, transcript="<img src=x onerror=alert(1)> refund"))
+    matches, _ = await search_transcripts("refund", 1, 10)
+    assert matches[0][1] == "&lt;img src=x onerror=alert(1)&gt; <mark>refund</mark>"
+
+@pytest.mark.asyncio
+async def test_search_transcripts_follows_updates():
+    async with async_session() as session:
+        async with session.begin():
+            session.add(CallState(uuid="uuid-1", status=CallStatus.COMPLETED.value))
+    async with async_session() as session:
+        async with session.begin():
+            call_state = (await session.execute(select(CallState))).scalar_one()
+            call_state.transcript = "cancel my subscription"
+    _, total = await search_transcripts("subscription", 1, 10)
+    assert total == 1
+    await delete_call_state("uuid-1")
+    _, total = await search_transcripts("subscription", 1, 10)
+    assert total == 0
+
+@pytest.mark.asyncio
+@patch("app.uploader.upload_file_to_s3", return_value="https://bucket.s3.amazonaws.com/recording.wav")
+async def test_create_recording_file(mock_upload_file_to_s3):
     audio_content = b"test audio content"
-    audio_file = type("File", (object,), {"file": type("File", (object,), {"read": lambda: audio_content})})()
+    audio_file = type("File", (object,), {"file": io.BytesIO(audio_content)})()
     recording_id = await create_recording_file(audio_file, "test-caller", 60)
     assert recording_id is not None
+    spooled_path = mock_upload_file_to_s3.call_args.args[0]
+    assert not os.path.exists(spooled_path)
+
+@pytest.mark.asyncio
+@patch("app.uploader.upload_file_to_s3", return_value="https://bucket.s3.amazonaws.com/recording.mp3")
+async def test_create_recording_file_keeps_other_formats(mock_upload_file_to_s3):
+    audio_file = type("File", (object,), {"file": io.BytesIO(b"ID3 not a wav"), "filename": "call.mp3"})()
+    recording_id = await create_recording_file(audio_file, "test-caller", 60)
+    call_state = await get_call_state(recording_id)
+    assert call_state.archive_codec == "original"
+    assert call_state.recording_key.endswith(".mp3")
+    assert mock_upload_file_to_s3.call_args.args[2] == call_state.recording_key
+
+@pytest.mark.asyncio
+@patch("app.uploader.upload_file_to_s3", return_value="https://bucket.s3.amazonaws.com/recording.flac")
+async def test_create_recording_file_measures_audio(mock_upload_file_to_s3):
+    audio_content = io.BytesIO()
+    with wave.open(audio_content, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\x00\x10" * 8000 * 3)
+    audio_content.seek(0)
+    audio_file = type("File", (object,), {"file": audio_content})()
+    recording_id = await create_recording_file(audio_file, "test-caller", 60)
+    call_state = await get_call_state(recording_id)
+    assert call_state.duration == 3
+    assert call_state.sample_rate == 8000
+    assert call_state.channels == 1
+    assert call_state.clipping_ratio == 0
+    async with async_session() as session:
+        rollup = (await session.execute(select(DashboardRollup))).scalar_one()
+        assert rollup.duration_sum == 3
+        peaks = await session.get(WaveformPeaks, call_state.recording_hash)
+        assert peaks.data.startswith(b"PEAK")
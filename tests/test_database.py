@@ -1,6 +1,14 @@
 import pytest
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import init_db, async_session
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+from app.database import (
+    add_missing_indexes,
+    async_session,
+    init_call_state_uuid_index,
+    init_caller_digits,
+    init_db,
+)
+from app.models import CallState
 
 @pytest.mark.asyncio
 async def test_init_db():
@@ -8,3 +16,49 @@ async def test_init_db():
         assert isinstance(session, AsyncSession)
         await init_db()
         # Add any additional assertions or checks if needed
+
+
+@pytest.mark.asyncio
+async def test_init_call_state_uuid_index_upgrades_old_databases(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("CREATE TABLE callstate (id INTEGER PRIMARY KEY, uuid VARCHAR, transcript VARCHAR, recording_hash VARCHAR)")
+        await conn.exec_driver_sql("CREATE INDEX ix_callstate_uuid ON callstate (uuid)")
+        await conn.exec_driver_sql("INSERT INTO callstate (uuid, recording_hash) VALUES ('a', NULL), ('b', NULL), ('a', 'abc123')")
+        assert await init_call_state_uuid_index(conn) == ["a"]
+        rows = (await conn.exec_driver_sql("SELECT id, uuid FROM callstate ORDER BY id")).all()
+        # The duplicate that holds the recording is the one kept
+        assert [tuple(row) for row in rows] == [(2, "b"), (3, "a")]
+        indexes = (await conn.exec_driver_sql("PRAGMA index_list('callstate')")).all()
+        assert [(row[1], row[2]) for row in indexes] == [("ix_callstate_uuid", 1)]
+        # Already unique: nothing to do
+        assert await init_call_state_uuid_index(conn) == []
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_init_caller_digits_backfills_old_rows(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("CREATE TABLE callstate (id INTEGER PRIMARY KEY, uuid VARCHAR, caller_id VARCHAR)")
+        await conn.exec_driver_sql("INSERT INTO callstate (uuid, caller_id) VALUES ('a', '+1 (636) 214-5464'), ('b', NULL), ('c', 'anonymous')")
+        await init_caller_digits(conn)
+        rows = (await conn.exec_driver_sql("SELECT uuid, caller_digits, caller_digits_reversed FROM callstate ORDER BY id")).all()
+        assert [tuple(row) for row in rows] == [("a", "16362145464", "46454126361"), ("b", None, None), ("c", None, None)]
+        indexes = {row[1] for row in (await conn.exec_driver_sql("PRAGMA index_list('callstate')")).all()}
+        assert {"ix_callstate_caller_digits", "ix_callstate_caller_digits_reversed"} <= indexes
+        # Columns present: nothing to do
+        await init_caller_digits(conn)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_add_missing_indexes_upgrades_old_tables(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.exec_driver_sql("DROP INDEX ix_callstate_created_at_id")
+        await add_missing_indexes(conn, CallState)
+        indexes = {row[1] for row in (await conn.exec_driver_sql("PRAGMA index_list('callstate')")).all()}
+        assert "ix_callstate_created_at_id" in indexes
+    await engine.dispose()
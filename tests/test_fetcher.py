@@ -0,0 +1,169 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from vonage import Auth
+
+from app.fetcher import (
+    RecordingFetcher,
+    UntrustedRecordingURL,
+    is_allowed_host,
+    vonage_auth_header,
+)
+
+
+def make_fetcher(handler, **kwargs):
+    kwargs.setdefault("retry_base", 0)
+    return RecordingFetcher(transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_vonage_auth_header():
+    auth = Auth(api_key="key", api_secret="secret")
+    assert vonage_auth_header(auth) == "Basic a2V5OnNlY3JldA=="
+
+
+def test_is_allowed_host():
+    assert is_allowed_host("https://api.nexmo.com/v1/files/abc")
+    assert is_allowed_host("https://api-us.vonage.com/v1/files/abc")
+    assert not is_allowed_host("http://api.nexmo.com/v1/files/abc")
+    assert not is_allowed_host("https://attacker.example/v1/files/abc")
+    assert not is_allowed_host("https://evilvonage.com/v1/files/abc")
+    assert not is_allowed_host("https://api.nexmo.com.attacker.example/abc")
+
+
+@pytest.mark.asyncio
+async def test_fetch_refuses_untrusted_hosts():
+    requests = []
+    fetcher = make_fetcher(lambda request: requests.append(request) or httpx.Response(200))
+    try:
+        with pytest.raises(UntrustedRecordingURL):
+            await fetcher.fetch("https://attacker.example/recording.wav")
+    finally:
+        await fetcher.close()
+    assert requests == []
+    assert fetcher.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_drops_auth_on_redirect_to_other_host():
+    seen = {}
+
+    def handler(request):
+        seen[request.url.host] = request.headers.get("Authorization")
+        if request.url.host == "api.nexmo.com":
+            return httpx.Response(302, headers={"Location": "https://cdn.example/abc"})
+        return httpx.Response(200, content=b"audio")
+
+    fetcher = make_fetcher(handler, auth=Auth(api_key="key", api_secret="secret"))
+    try:
+        path = await fetcher.fetch("https://api.nexmo.com/v1/files/abc")
+    finally:
+        await fetcher.close()
+    with open(path, "rb") as f:
+        assert f.read() == b"audio"
+    os.remove(path)
+    assert seen == {"api.nexmo.com": "Basic a2V5OnNlY3JldA==", "cdn.example": None}
+
+
+@pytest.mark.asyncio
+async def test_fetch_streams_to_spool_file():
+    body = os.urandom(3 * 1024 * 1024 + 17)
+
+    def handler(request):
+        assert request.headers["Authorization"] == "Basic a2V5OnNlY3JldA=="
+        return httpx.Response(200, content=body)
+
+    fetcher = make_fetcher(handler, auth=Auth(api_key="key", api_secret="secret"))
+    try:
+        async with fetcher.fetched("https://api.nexmo.com/v1/files/abc", ".wav") as path:
+            assert path.endswith(".wav")
+            with open(path, "rb") as f:
+                assert f.read() == body
+        assert not os.path.exists(path)
+    finally:
+        await fetcher.close()
+    assert fetcher.stats()["completed"] == 1
+    assert fetcher.stats()["bytes_downloaded"] == len(body)
+
+
+@pytest.mark.asyncio
+async def test_fetched_local_path_is_used_in_place(tmp_path):
+    path = tmp_path / "recording.wav"
+    path.write_bytes(b"RIFF")
+    fetcher = make_fetcher(lambda request: httpx.Response(500))
+    async with fetcher.fetched(str(path)) as fetched:
+        assert fetched == str(path)
+    assert path.exists()
+
+
+@pytest.mark.asyncio
+async def test_fetch_retries_transient_errors():
+    responses = [httpx.Response(503), httpx.ConnectError("reset"), httpx.Response(200, content=b"audio")]
+
+    def handler(request):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    fetcher = make_fetcher(handler)
+    try:
+        path = await fetcher.fetch("https://api.nexmo.com/v1/files/abc")
+    finally:
+        await fetcher.close()
+    with open(path, "rb") as f:
+        assert f.read() == b"audio"
+    os.remove(path)
+    assert fetcher.stats()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_fetch_gives_up(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.spool.SPOOL_DIR", str(tmp_path))
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        return httpx.Response(404 if len(attempts) > 5 else 503)
+
+    fetcher = make_fetcher(handler, max_attempts=3)
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            await fetcher.fetch("https://api.nexmo.com/v1/files/abc")
+        assert len(attempts) == 3
+        attempts.extend([None] * 3)
+        with pytest.raises(httpx.HTTPStatusError):
+            await fetcher.fetch("https://api.nexmo.com/v1/files/abc")
+        # 404 is not retried
+        assert len(attempts) == 7
+    finally:
+        await fetcher.close()
+    assert fetcher.stats()["failed"] == 2
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_fetch_caps_concurrent_downloads():
+    running = 0
+    peak = 0
+
+    class SlowStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            yield b"audio"
+
+    fetcher = make_fetcher(lambda request: httpx.Response(200, stream=SlowStream()), max_downloads=2)
+    try:
+        paths = await asyncio.gather(
+            *(fetcher.fetch(f"https://api.nexmo.com/v1/files/{i}") for i in range(6))
+        )
+    finally:
+        await fetcher.close()
+    for path in paths:
+        os.remove(path)
+    assert peak == 2
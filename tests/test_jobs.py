@@ -0,0 +1,186 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import delete, update
+
+from app.database import async_session
+from app.enums import JobStatus
+from app.jobs import (
+    JobWorkerPool,
+    PermanentJobError,
+    claim_next_job,
+    complete_job,
+    enqueue_transcription_job,
+    fail_job,
+    get_job,
+    renew_lease,
+    retry_delay,
+)
+from app.models import TranscriptionJob
+
+
+@pytest.fixture(autouse=True)
+async def clear_database():
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(TranscriptionJob))
+            await session.commit()
+
+
+def test_retry_delay():
+    assert 2.5 <= retry_delay(1) <= 5
+    assert 20 <= retry_delay(4) <= 40
+    assert retry_delay(100) <= 600
+
+
+@pytest.mark.asyncio
+async def test_claim_next_job():
+    job = await enqueue_transcription_job("test-uuid", "http://testserver/recording.mp3")
+    claimed = await claim_next_job()
+    assert claimed.id == job.id
+    assert claimed.status == JobStatus.RUNNING.value
+    assert claimed.attempts == 1
+    assert await claim_next_job() is None
+
+
+@pytest.mark.asyncio
+async def test_claim_expired_lease():
+    job = await enqueue_transcription_job("test-uuid", "http://testserver/recording.mp3")
+    await claim_next_job()
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(TranscriptionJob)
+                .where(TranscriptionJob.id == job.id)
+                .values(lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+            )
+    claimed = await claim_next_job()
+    assert claimed.id == job.id
+    assert claimed.attempts == 2
+
+
+async def expire_lease(job_id):
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(TranscriptionJob)
+                .where(TranscriptionJob.id == job_id)
+                .values(lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+            )
+
+
+@pytest.mark.asyncio
+async def test_claim_fails_expired_job_out_of_attempts():
+    job = await enqueue_transcription_job("test-uuid", "http://testserver/recording.mp3")
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(update(TranscriptionJob).where(TranscriptionJob.id == job.id).values(max_attempts=1))
+    await claim_next_job()
+    await expire_lease(job.id)
+    assert await claim_next_job() is None
+    job = await get_job(job.id)
+    assert job.status == JobStatus.FAILED.value
+    assert job.attempts == 1
+    assert job.last_error == "Lease expired on the last attempt"
+
+
+@pytest.mark.asyncio
+async def test_stale_worker_cannot_finish_reclaimed_job():
+    await enqueue_transcription_job("test-uuid", "http://testserver/recording.mp3")
+    stale = await claim_next_job()
+    await expire_lease(stale.id)
+    current = await claim_next_job()
+    assert current.lease_token != stale.lease_token
+    assert not await renew_lease(stale)
+    assert not await complete_job(stale)
+    assert not await fail_job(stale, "boom")
+    assert (await get_job(current.id)).status == JobStatus.RUNNING.value
+    assert await renew_lease(current)
+    assert await complete_job(current)
+    assert (await get_job(current.id)).status == JobStatus.SUCCEEDED.value
+
+
+@pytest.mark.asyncio
+async def test_fail_job_retries_with_backoff():
+    await enqueue_transcription_job("test-uuid", "http://testserver/recording.mp3")
+    job = await claim_next_job()
+    await fail_job(job, "boom")
+    job = await get_job(job.id)
+    assert job.status == JobStatus.QUEUED.value
+    assert job.last_error == "boom"
+    assert await claim_next_job() is None
+
+
+@pytest.mark.asyncio
+async def test_fail_job_gives_up():
+    await enqueue_transcription_job("test-uuid", "http://testserver/recording.mp3")
+    job = await claim_next_job()
+    job.attempts = job.max_attempts
+    await fail_job(job, "boom")
+    job = await get_job(job.id)
+    assert job.status == JobStatus.FAILED.value
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_runs_jobs():
+    handler = AsyncMock()
+    pool = JobWorkerPool(handler, concurrency=2, poll_interval=0.05)
+    pool.start()
+    try:
+        job = await enqueue_transcription_job("test-uuid", "http://testserver/recording.mp3")
+        for _ in range(100):
+            if (await get_job(job.id)).status == JobStatus.SUCCEEDED.value:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        await pool.stop()
+    assert (await get_job(job.id)).status == JobStatus.SUCCEEDED.value
+    assert handler.call_args.args[0].call_uuid == "test-uuid"
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_records_errors():
+    async def handler(job):
+        if job.call_uuid == "permanent":
+            raise PermanentJobError("ValueError: not a WAV file")
+        raise ConnectionError("reset")
+
+    pool = JobWorkerPool(handler, concurrency=1, poll_interval=0.05)
+    pool.start()
+    try:
+        permanent = await enqueue_transcription_job("permanent", "http://testserver/recording.mp3")
+        transient = await enqueue_transcription_job("transient", "http://testserver/recording.mp3")
+        for _ in range(100):
+            if (await get_job(transient.id)).last_error:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        await pool.stop()
+    permanent = await get_job(permanent.id)
+    assert permanent.status == JobStatus.FAILED.value
+    assert permanent.attempts == 1
+    assert permanent.last_error == "ValueError: not a WAV file"
+    transient = await get_job(transient.id)
+    assert transient.status == JobStatus.QUEUED.value
+    assert transient.last_error == "ConnectionError: reset"
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_bookkeeping_errors():
+    handler = AsyncMock()
+    complete = AsyncMock(side_effect=[ConnectionError("database is locked"), True])
+    pool = JobWorkerPool(handler, concurrency=1, poll_interval=0.05)
+    with patch("app.jobs.complete_job", complete):
+        pool.start()
+        try:
+            await enqueue_transcription_job("first", "http://testserver/recording.mp3")
+            await enqueue_transcription_job("second", "http://testserver/recording.mp3")
+            for _ in range(100):
+                if complete.await_count == 2:
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await pool.stop()
+    assert [call.args[0].call_uuid for call in handler.await_args_list] == ["first", "second"]
@@ -1,13 +1,19 @@
+import io
 import os
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import delete
+from botocore.response import StreamingBody
 from sqlmodel import select
 
+from app.auth import create_access_token, get_current_active_user
 from app.database import async_session, User
-from app.models import CallState
+from app.models import ApiKey, CallState, DashboardRollup, WaveformPeaks
+from app.passwords import PasswordHasherBusy
+from app.recording_cache import RecordingCache
 from main import app
 
 client = TestClient(app)
@@ -18,7 +24,10 @@ async def clear_database():
     async with async_session() as session:
         async with session.begin():
             await session.execute(delete(CallState))
+            await session.execute(delete(DashboardRollup))
             await session.execute(delete(User))
+            await session.execute(delete(WaveformPeaks))
+            await session.execute(delete(ApiKey))
             await session.commit()
 
 
@@ -34,6 +43,7 @@ async def test_answer_call():
         {
             "action": "record",
             "eventUrl": ["http://testserver/api/v1/calls/recordings"],
+            "format": "wav",
             "beepStart": False,
         },
         {
@@ -143,7 +153,7 @@ async def test_get_recordings():
 
 
 @patch(
-    "app.aws_setup.upload_file_to_s3", return_value="http://mock_s3_url/recording.mp3"
+    "app.uploader.upload_file_to_s3", return_value="http://mock_s3_url/recording.mp3"
 )
 @pytest.mark.asyncio
 async def test_create_recording(mock_upload_file_to_s3):
@@ -232,3 +242,240 @@ async def test_read_users_me_unauthorized():
     response = client.get("/api/v1/auth/user")
     assert response.status_code == 401
     assert response.json() == {"detail": "Not authenticated"}
+
+
+def test_get_call_analytics():
+    client.post("/api/v1/calls/answer", params={"uuid": "test-uuid"})
+    now = datetime.now(timezone.utc)
+    response = client.get(
+        "/api/v1/dashboard/analytics",
+        params={
+            "start": (now - timedelta(days=7)).isoformat(),
+            "end": (now + timedelta(days=1)).isoformat(),
+            "granularity": "day",
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["granularity"] == "day"
+    assert sum(bucket["call_count"] for bucket in data["buckets"]) >= 1
+
+
+def test_get_call_analytics_invalid_range():
+    response = client.get(
+        "/api/v1/dashboard/analytics",
+        params={"start": "2024-01-02T00:00:00", "end": "2024-01-01T00:00:00"},
+    )
+    assert response.status_code == 400
+    response = client.get(
+        "/api/v1/dashboard/analytics",
+        params={"start": "2000-01-01T00:00:00", "end": "2100-01-01T00:00:00", "granularity": "hour"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.fixture
+async def stored_recording(tmp_path):
+    app.dependency_overrides[get_current_active_user] = lambda: None
+    cache = RecordingCache(directory=str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    async with async_session() as session:
+        async with session.begin():
+            session.add(
+                CallState(
+                    uuid="test-uuid",
+                    status="completed",
+                    recording_key="test-uuid.wav",
+                    recording_hash="abc123",
+                )
+            )
+    with patch("app.crud.recording_cache", cache):
+        yield cache
+    app.dependency_overrides.clear()
+
+
+def cache_recording(cache, tmp_path, content):
+    source = tmp_path / "recording.wav"
+    source.write_bytes(content)
+    cache.add("abc123", str(source))
+
+
+@pytest.mark.asyncio
+async def test_get_recording_audio(stored_recording, tmp_path):
+    cache_recording(stored_recording, tmp_path, b"RIFF0123456789")
+    response = client.get("/api/v1/recordings/test-uuid/audio")
+    assert response.status_code == 200
+    assert response.content == b"RIFF0123456789"
+    assert response.headers["etag"] == '"abc123"'
+    assert response.headers["accept-ranges"] == "bytes"
+    # The recording was pinned while it was sent
+    assert stored_recording._pins == {}
+
+    response = client.get("/api/v1/recordings/test-uuid/audio", headers={"Range": "bytes=4-7"})
+    assert response.status_code == 206
+    assert response.content == b"0123"
+    assert response.headers["content-range"] == "bytes 4-7/14"
+
+    response = client.get(
+        "/api/v1/recordings/test-uuid/audio",
+        headers={"Range": "bytes=4-7", "If-Range": '"stale"'},
+    )
+    assert response.status_code == 200
+    assert response.content == b"RIFF0123456789"
+
+
+
+@pytest.mark.asyncio
+async def test_get_recording_audio_original_format(stored_recording, tmp_path):
+    async with async_session() as session:
+        async with session.begin():
+            call_state = (await session.execute(select(CallState))).scalar_one()
+            call_state.archive_codec = "original"
+            call_state.recording_key = "test-uuid.mp3"
+    cache_recording(stored_recording, tmp_path, b"ID3 not a wav")
+    response = client.get("/api/v1/recordings/test-uuid/audio")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert "test-uuid.mp3" in response.headers["content-disposition"]
+
+@pytest.mark.asyncio
+async def test_get_recording_audio_not_modified(stored_recording, tmp_path):
+    cache_recording(stored_recording, tmp_path, b"RIFF0123456789")
+    response = client.get(
+        "/api/v1/recordings/test-uuid/audio", headers={"If-None-Match": 'W/"other", "abc123"'}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"abc123"'
+    assert response.content == b""
+
+
+@pytest.mark.asyncio
+async def test_get_recording_audio_range_from_s3(stored_recording):
+    s3_object = {
+        "Body": StreamingBody(io.BytesIO(b"0123"), 4),
+        "ContentLength": 4,
+        "ContentRange": "bytes 4-7/14",
+    }
+    with patch("app.crud.get_s3_object", return_value=s3_object) as mock_get_s3_object:
+        response = client.get("/api/v1/recordings/test-uuid/audio", headers={"Range": "bytes=4-7"})
+    assert response.status_code == 206
+    assert response.content == b"0123"
+    assert response.headers["content-range"] == "bytes 4-7/14"
+    assert response.headers["etag"] == '"abc123"'
+    assert mock_get_s3_object.call_args.args[1:] == ("test-uuid.wav", "bytes=4-7")
+    # Seeking does not pull the whole recording into the cache
+    assert stored_recording.lookup("abc123") is None
+
+
+@pytest.mark.asyncio
+async def test_get_recording_audio_fills_cache_from_s3(stored_recording):
+    def download(bucket_name, s3_file_name, file_path):
+        with open(file_path, "wb") as f:
+            f.write(b"RIFF0123456789")
+
+    with patch("app.crud.download_file_from_s3", side_effect=download):
+        response = client.get("/api/v1/recordings/test-uuid/audio")
+    assert response.status_code == 200
+    assert response.content == b"RIFF0123456789"
+    assert stored_recording.lookup("abc123") is not None
+
+
+@pytest.mark.asyncio
+async def test_get_recording_audio_not_found(stored_recording):
+    response = client.get("/api/v1/recordings/missing-uuid/audio")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_recording_peaks(stored_recording):
+    async with async_session() as session:
+        async with session.begin():
+            session.add(WaveformPeaks(content_hash="abc123", data=b"PEAKdata"))
+    response = client.get("/api/v1/recordings/test-uuid/peaks")
+    assert response.status_code == 200
+    assert response.content == b"PEAKdata"
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+
+    response = client.get("/api/v1/recordings/test-uuid/peaks", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get("/api/v1/recordings/missing-uuid/peaks")
+    assert response.status_code == 404
+
+
+@patch("app.routes.authenticate_user", side_effect=PasswordHasherBusy())
+def test_login_rejected_when_password_hasher_busy(mock_authenticate_user):
+    response = client.post(
+        "/api/v1/auth/login", data={"username": "johndoe", "password": "secret"}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_logout_revokes_token():
+    token = create_access_token({"sub": "johndoe"})
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post("/api/v1/auth/logout", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"status": "success"}
+    response = client.post("/api/v1/auth/logout", headers=headers)
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_api_key_authentication():
+    async with async_session() as session:
+        async with session.begin():
+            session.add(User(username="service", hashed_password="unused"))
+    token = create_access_token({"sub": "service"})
+    response = client.post(
+        "/api/v1/auth/api-keys",
+        json={"name": "poller"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    created = response.json()
+    assert created["key"].startswith(f"vcr_{created['prefix']}_")
+
+    response = client.get("/api/v1/auth/user", headers={"X-API-Key": created["key"]})
+    assert response.status_code == 200
+    assert response.json()["username"] == "service"
+
+    response = client.get("/api/v1/auth/api-keys", headers={"X-API-Key": created["key"]})
+    assert [key["name"] for key in response.json()] == ["poller"]
+    assert "key" not in response.json()[0]
+
+    response = client.get("/api/v1/auth/user", headers={"X-API-Key": "vcr_wrong_key"})
+    assert response.status_code == 401
+    response = client.get("/api/v1/auth/user")
+    assert response.status_code == 401
+
+    # Keys cannot manage keys
+    response = client.post("/api/v1/auth/api-keys", json={"name": "copy"}, headers={"X-API-Key": created["key"]})
+    assert response.status_code == 401
+    response = client.delete(f"/api/v1/auth/api-keys/{created['id']}", headers={"X-API-Key": created["key"]})
+    assert response.status_code == 401
+
+    response = client.delete(
+        f"/api/v1/auth/api-keys/{created['id']}", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    response = client.get("/api/v1/auth/user", headers={"X-API-Key": created["key"]})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_list_recordings_invalid_cursor():
+    app.dependency_overrides[get_current_active_user] = lambda: None
+    try:
+        response = client.get("/api/v1/recordings/list", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+        # Other errors are not reported as a bad cursor
+        with patch("app.routes.get_recordings_data", side_effect=ValueError("bug")):
+            response = client.get("/api/v1/recordings/list")
+        assert response.status_code == 500
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+import pytest
+from passlib.context import CryptContext
+
+from app.passwords import PasswordHasher, PasswordHasherBusy
+
+
+def context(rounds):
+    return CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__rounds=rounds)
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    hasher = PasswordHasher(context(1000), max_workers=2)
+    hashed = await hasher.hash("secret")
+    assert await hasher.verify("secret", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    assert hasher.stats()["completed"] == 3
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_verify_and_update_rehashes_on_cost_change():
+    old_hash = context(1000).hash("secret")
+    hasher = PasswordHasher(context(2000), max_workers=1)
+    valid, new_hash = await hasher.verify_and_update("secret", old_hash)
+    assert valid
+    assert new_hash is not None
+    assert not context(2000).needs_update(new_hash)
+    assert await hasher.verify_and_update("secret", new_hash) == (True, None)
+    assert await hasher.verify_and_update("wrong", old_hash) == (False, None)
+    assert hasher.stats()["rehashed"] == 1
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_pool_stays_busy():
+    hasher = PasswordHasher(context(1000), max_workers=1, queue_timeout=0.05)
+    release = threading.Event()
+    busy = asyncio.ensure_future(hasher._run(release.wait))
+    await asyncio.sleep(0.01)
+    with pytest.raises(PasswordHasherBusy):
+        await hasher.hash("secret")
+    release.set()
+    assert await busy
+    assert await hasher.hash("secret")
+    stats = hasher.stats()
+    assert stats["rejected"] == 1
+    assert stats["waiting"] == 0
+    hasher.shutdown()
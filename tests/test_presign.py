@@ -0,0 +1,55 @@
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import boto3
+import pytest
+
+from app.presign import PresignedUrlService
+
+
+@pytest.fixture
+def service():
+    client = boto3.client(
+        "s3",
+        region_name="us-east-1",
+        aws_access_key_id="test-key",
+        aws_secret_access_key="test-secret",
+    )
+    return PresignedUrlService(
+        bucket_name="test-bucket", ttl=600, refresh_margin=60, client=client
+    )
+
+
+@pytest.mark.asyncio
+async def test_urls_for_signs_page_once(service):
+    urls = await service.urls_for(["a.wav", None, "b.wav", "a.wav"])
+    assert set(urls) == {"a.wav", "b.wav"}
+    url = urlparse(urls["a.wav"])
+    assert url.path.endswith("/a.wav")
+    query = parse_qs(url.query)
+    assert query.get("X-Amz-Expires", query.get("Expires")) is not None
+    assert service.stats()["signed"] == 2
+    assert service.stats()["sign_batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_urls_are_reused(service):
+    first = await service.url_for("a.wav")
+    urls = await service.urls_for(["a.wav", "b.wav"])
+    assert urls["a.wav"] == first
+    stats = service.stats()
+    assert stats["signed"] == 2
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_urls_are_refreshed_before_expiry(service):
+    with patch("app.presign.time.time", return_value=1000):
+        await service.url_for("a.wav")
+    with patch("app.presign.time.time", return_value=1000 + 539):
+        await service.url_for("a.wav")
+    assert service.stats()["signed"] == 1
+    with patch("app.presign.time.time", return_value=1000 + 540):
+        await service.url_for("a.wav")
+    assert service.stats()["signed"] == 2
@@ -0,0 +1,116 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app.crud import fill_recording_from_s3, lookup_recording
+from app.recording_cache import RecordingCache
+
+
+def write_source(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RecordingCache(directory=str(tmp_path / "cache"), max_bytes=250)
+
+
+def test_lookup_miss_then_hit(cache, tmp_path):
+    assert cache.lookup("abc") is None
+    source = write_source(tmp_path, "recording.wav", 100)
+    path = cache.add("abc", source)
+    assert os.path.exists(source)
+    assert cache.lookup("abc") == path
+    with open(path, "rb") as f, open(source, "rb") as g:
+        assert f.read() == g.read()
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["bytes_saved"] == 100
+    assert stats["bytes"] == 100
+
+
+def test_add_moves_source(cache, tmp_path):
+    source = write_source(tmp_path, "spool.wav", 10)
+    path = cache.add("abc", source, move=True)
+    assert not os.path.exists(source)
+    assert os.path.getsize(path) == 10
+
+
+def test_evicts_least_recently_used(cache, tmp_path):
+    for name in ("a", "b"):
+        cache.add(name, write_source(tmp_path, name, 100))
+    cache.lookup("a")
+    cache.add("c", write_source(tmp_path, "c", 100))
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") is not None
+    assert cache.lookup("c") is not None
+    assert not os.path.exists(cache.path_for("b"))
+    assert cache.stats()["bytes"] == 200
+    assert cache.stats()["evictions"] == 1
+
+
+def test_pinned_recordings_are_not_evicted(cache, tmp_path):
+    with cache.pinned("big"):
+        path = cache.add("big", write_source(tmp_path, "big", 300))
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+    assert cache.stats()["bytes"] == 0
+
+
+def test_pin_outlives_lookup(cache, tmp_path):
+    path = cache.add("a", write_source(tmp_path, "a", 100))
+    cache.pin("a")
+    for name in ("b", "c"):
+        cache.add(name, write_source(tmp_path, name, 100))
+    # The least recently used recording that is not being served goes instead
+    assert os.path.exists(path)
+    assert cache.lookup("b") is None
+    cache.unpin("a")
+    cache.add("d", write_source(tmp_path, "d", 100))
+    assert not os.path.exists(path)
+
+
+def test_failed_write_leaves_no_partial_file(cache):
+    def write(path):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+        raise IOError("connection reset")
+
+    with pytest.raises(IOError):
+        cache.add_from("abc", write)
+    assert os.listdir(cache.directory) == []
+    assert cache.lookup("abc") is None
+
+
+def test_index_is_rebuilt_from_disk(cache, tmp_path):
+    cache.add("a", write_source(tmp_path, "a", 100))
+    for name in ("stale.part", "writing.part", "notes.txt"):
+        open(os.path.join(cache.directory, name), "wb").close()
+    os.utime(os.path.join(cache.directory, "stale.part"), (0, 0))
+    reloaded = RecordingCache(directory=cache.directory, max_bytes=250)
+    assert reloaded.lookup("a") == cache.path_for("a")
+    assert reloaded.stats()["bytes"] == 100
+    # Only partial writes past the grace period are removed
+    assert sorted(os.listdir(cache.directory)) == ["a.wav", "notes.txt", "writing.part"]
+
+
+@pytest.mark.asyncio
+async def test_fill_recording_from_s3(cache):
+    def download(bucket_name, s3_file_name, file_path):
+        with open(file_path, "wb") as f:
+            f.write(b"RIFF" + s3_file_name.encode())
+
+    with patch("app.crud.recording_cache", cache), patch(
+        "app.crud.download_file_from_s3", side_effect=download
+    ) as mock_download:
+        assert await lookup_recording("abc") is None
+        path = await fill_recording_from_s3("abc", "uuid1.wav")
+        assert await lookup_recording("abc") == path
+    assert mock_download.call_count == 1
+    with open(path, "rb") as f:
+        assert f.read() == b"RIFFuuid1.wav"
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete
+from app.crud import create_call_state, delete_call_state, get_dashboard_rollup, get_stats_buckets
+from app.database import async_session, write_transaction
+from app.enums import BucketGranularity, CallStatus
+from app.models import CallState, CallStatsBucket, DashboardRollup
+from app.rollups import bucket_start, init_rollups, rebuild_dashboard_rollup, rollup_delta
+
+
+@pytest.fixture(autouse=True)
+async def clear_database():
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(CallState))
+            await session.execute(delete(DashboardRollup))
+            await session.execute(delete(CallStatsBucket))
+            await session.commit()
+
+def test_rollup_delta():
+    assert rollup_delta(None, (CallStatus.COMPLETED.value, 30)) == {
+        "total_recordings": 1,
+        "completed_count": 1,
+        "duration_sum": 30,
+        "duration_count": 1,
+    }
+    assert rollup_delta((CallStatus.FAILED.value, None), None) == {
+        "total_recordings": -1,
+        "completed_count": 0,
+        "duration_sum": 0,
+        "duration_count": 0,
+    }
+    assert rollup_delta((CallStatus.RECORDING.value, None), (CallStatus.COMPLETED.value, 30)) == {
+        "total_recordings": 0,
+        "completed_count": 1,
+        "duration_sum": 30,
+        "duration_count": 1,
+    }
+
+@pytest.mark.asyncio
+async def test_rollup_tracks_writes():
+    await create_call_state("uuid1", CallStatus.COMPLETED.value)
+    await create_call_state("uuid2", CallStatus.RECORDING.value)
+    await delete_call_state("uuid2")
+    rollup = await get_dashboard_rollup()
+    assert rollup.total_recordings == 1
+    assert rollup.completed_count == 1
+
+@pytest.mark.asyncio
+async def test_rebuild_dashboard_rollup():
+    async with async_session() as session:
+        async with session.begin():
+            session.add(CallState(uuid="uuid1", status=CallStatus.COMPLETED.value, duration=10))
+            session.add(CallState(uuid="uuid2", status=CallStatus.FAILED.value, duration=20))
+            session.add(CallState(uuid="uuid3", status=CallStatus.COMPLETED.value))
+    totals = await rebuild_dashboard_rollup(chunk_size=2)
+    assert totals == {
+        "total_recordings": 3,
+        "completed_count": 2,
+        "duration_sum": 30,
+        "duration_count": 2,
+    }
+    rollup = await get_dashboard_rollup()
+    assert rollup.duration_sum == 30
+
+@pytest.mark.asyncio
+async def test_init_rollups_fills_missing_counters():
+    async with async_session() as session:
+        async with session.begin():
+            session.add(CallState(uuid="uuid1", status=CallStatus.COMPLETED.value, duration=10))
+            session.add(CallState(uuid="uuid2", status=CallStatus.FAILED.value))
+    async with write_transaction() as conn:
+        await init_rollups(conn)
+    rollup = await get_dashboard_rollup()
+    assert (rollup.total_recordings, rollup.completed_count, rollup.duration_sum) == (2, 1, 10)
+    now = datetime.now(timezone.utc)
+    hourly = await get_stats_buckets(BucketGranularity.HOUR, now - timedelta(hours=1), now + timedelta(hours=1))
+    assert hourly[0].total_recordings == 2
+    # Counters that already exist are kept up to date by the call writes
+    await create_call_state("uuid3", CallStatus.COMPLETED.value)
+    async with write_transaction() as conn:
+        await init_rollups(conn)
+    rollup = await get_dashboard_rollup()
+    assert rollup.total_recordings == 3
+    # Rows removed behind the counters' back, e.g. merged duplicates
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(CallState).where(CallState.uuid == "uuid3"))
+    async with write_transaction() as conn:
+        await init_rollups(conn, rebuild=True)
+    rollup = await get_dashboard_rollup()
+    assert rollup.total_recordings == 2
+
+@pytest.mark.asyncio
+async def test_stats_buckets_track_writes():
+    await create_call_state("uuid1", CallStatus.COMPLETED.value)
+    await create_call_state("uuid2", CallStatus.FAILED.value)
+    now = datetime.now(timezone.utc)
+    hourly = await get_stats_buckets(BucketGranularity.HOUR, now - timedelta(hours=1), now + timedelta(hours=1))
+    daily = await get_stats_buckets(BucketGranularity.DAY, now - timedelta(days=1), now + timedelta(days=1))
+    assert len(hourly) == 1
+    assert hourly[0].total_recordings == 2
+    assert hourly[0].completed_count == 1
+    assert len(daily) == 1
+    assert daily[0].bucket_start == bucket_start(now, BucketGranularity.DAY)
+
+@pytest.mark.asyncio
+async def test_rebuild_stats_buckets():
+    created_at = datetime(2024, 1, 1, 10, 30, tzinfo=timezone.utc)
+    async with async_session() as session:
+        async with session.begin():
+            session.add(CallState(uuid="uuid1", status=CallStatus.COMPLETED.value, duration=10, created_at=created_at))
+            session.add(CallState(uuid="uuid2", status=CallStatus.FAILED.value, created_at=created_at + timedelta(hours=2)))
+    await rebuild_dashboard_rollup(chunk_size=1)
+    hourly = await get_stats_buckets(BucketGranularity.HOUR, datetime(2024, 1, 1), datetime(2024, 1, 2))
+    daily = await get_stats_buckets(BucketGranularity.DAY, datetime(2024, 1, 1), datetime(2024, 1, 2))
+    assert [b.bucket_start.hour for b in hourly] == [10, 12]
+    assert daily[0].total_recordings == 2
+    assert daily[0].duration_sum == 10
@@ -1,16 +1,36 @@
+from datetime import datetime, timezone
+
+import httpx
 import pytest
 from unittest.mock import patch, AsyncMock
+from sqlalchemy import delete
 from app.services import (
+    get_call_analytics,
     store_call_state,
     handle_recording,
     handle_call_event_service,
     get_dashboard_data,
     get_recordings_data,
     create_new_recording,
+    process_transcription_job,
 )
-from app.enums import CallStatus
+from app.fetcher import UntrustedRecordingURL
+from app.jobs import PermanentJobError
+from app.enums import BucketGranularity, CallStatus, JobStatus
 from app.schemas import DashboardData, Recording
-from app.crud import create_call_state, get_call_state, delete_call_state, get_all_call_states, search_call_states, create_recording_file
+from app.crud import create_call_state, get_call_state, get_dashboard_rollup, delete_call_state, get_all_call_states, search_call_states, create_recording_file
+from app.database import async_session
+from app.models import CallState, CallStatsBucket, DashboardRollup, TranscriptionJob
+
+
+@pytest.fixture(autouse=True)
+async def clear_database():
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(CallState))
+            await session.execute(delete(DashboardRollup))
+            await session.execute(delete(TranscriptionJob))
+            await session.commit()
 
 @pytest.mark.asyncio
 async def test_store_call_state():
@@ -21,24 +41,51 @@ async def test_store_call_state():
     assert call_state.uuid == call_uuid
     assert call_state.status == CallStatus.RECORDING.value
 
+@pytest.mark.asyncio
+async def test_handle_recording():
+    call_uuid = "test-uuid"
+    recording_url = "http://testserver/recording.mp3"
+    await create_call_state(call_uuid, CallStatus.RECORDING.value)
+    job = await handle_recording(call_uuid, recording_url, CallStatus.COMPLETED.value)
+    assert job.status == JobStatus.QUEUED.value
+    assert job.call_uuid == call_uuid
+    assert job.recording_url == recording_url
+
 @pytest.mark.asyncio
 @patch("app.services.transcribe_and_translate", new_callable=AsyncMock)
-async def test_handle_recording(mock_transcribe_and_translate):
+async def test_process_transcription_job(mock_transcribe_and_translate):
     call_uuid = "test-uuid"
     recording_url = "http://testserver/recording.mp3"
     await create_call_state(call_uuid, CallStatus.RECORDING.value)
-    await handle_recording(call_uuid, recording_url, CallStatus.COMPLETED.value)
+    job = await handle_recording(call_uuid, recording_url, CallStatus.COMPLETED.value)
+    await process_transcription_job(job)
     call_state = await get_call_state(call_uuid)
-    assert call_state is None
+    assert call_state.status == CallStatus.COMPLETED.value
     mock_transcribe_and_translate.assert_called_once_with(call_uuid, recording_url)
 
+@pytest.mark.asyncio
+async def test_process_transcription_job_permanent_errors():
+    await create_call_state("test-uuid", CallStatus.RECORDING.value)
+    job = await handle_recording("test-uuid", "https://attacker.example/a.wav", CallStatus.COMPLETED.value)
+    not_found = httpx.HTTPStatusError("missing", request=httpx.Request("GET", "https://api.nexmo.com"), response=httpx.Response(404))
+    for error in (UntrustedRecordingURL("untrusted"), not_found):
+        with patch("app.services.transcribe_and_translate", new_callable=AsyncMock, side_effect=error):
+            with pytest.raises(PermanentJobError):
+                await process_transcription_job(job)
+    # Transient failures are left for the worker to retry
+    with patch("app.services.transcribe_and_translate", new_callable=AsyncMock, side_effect=httpx.ConnectError("reset")):
+        with pytest.raises(httpx.ConnectError):
+            await process_transcription_job(job)
+
 @pytest.mark.asyncio
 async def test_handle_call_event_service():
     call_uuid = "test-uuid"
     await create_call_state(call_uuid, CallStatus.RECORDING.value)
     await handle_call_event_service(call_uuid, CallStatus.COMPLETED.value)
     call_state = await get_call_state(call_uuid)
-    assert call_state is None
+    assert call_state.status == CallStatus.COMPLETED.value
+    rollup = await get_dashboard_rollup()
+    assert (rollup.total_recordings, rollup.completed_count) == (1, 1)
 
 @pytest.mark.asyncio
 async def test_get_dashboard_data():
@@ -75,3 +122,26 @@ async def test_create_new_recording(mock_create_recording_file):
     recording_id = await create_new_recording(audio, caller_id, duration)
     assert recording_id == "test-uuid"
     mock_create_recording_file.assert_called_once_with(audio, caller_id, duration)
+
+@pytest.mark.asyncio
+async def test_get_recordings_data_without_duration():
+    # Uploads in formats that cannot be measured may arrive without a duration
+    await create_call_state("uuid1", CallStatus.COMPLETED.value)
+    recordings_data = await get_recordings_data("", 1, 10)
+    assert recordings_data["recordings"][0].duration is None
+
+
+@pytest.mark.asyncio
+async def test_get_call_analytics_fills_gaps():
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(CallStatsBucket))
+            for hour in (10, 12):
+                session.add(CallStatsBucket(granularity="hour", bucket_start=datetime(2024, 1, 1, hour, tzinfo=timezone.utc), total_recordings=2, completed_count=1, duration_sum=30, duration_count=1))
+    analytics = await get_call_analytics(BucketGranularity.HOUR, datetime(2024, 1, 1, 9, 30), datetime(2024, 1, 1, 13))
+    assert [bucket.bucket_start for bucket in analytics.buckets] == [
+        "2024-01-01T09:00:00", "2024-01-01T10:00:00", "2024-01-01T11:00:00", "2024-01-01T12:00:00",
+    ]
+    assert [bucket.call_count for bucket in analytics.buckets] == [0, 2, 0, 2]
+    assert analytics.buckets[1].completed_rate == 50
+    assert analytics.buckets[2].average_duration == 0
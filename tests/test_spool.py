@@ -0,0 +1,43 @@
+import io
+import os
+
+import pytest
+
+from app.spool import spool_fileobj, spooled_upload
+
+
+class FailingFile(io.BytesIO):
+    def read(self, size=-1):
+        raise IOError("connection reset")
+
+
+def test_spool_fileobj():
+    path = spool_fileobj(io.BytesIO(b"x" * 3_000_000), suffix=".wav")
+    try:
+        assert path.endswith(".wav")
+        assert os.path.getsize(path) == 3_000_000
+    finally:
+        os.remove(path)
+
+
+@pytest.mark.asyncio
+async def test_spooled_upload_removes_file():
+    upload = type("Upload", (object,), {"file": io.BytesIO(b"test audio content")})()
+    async with spooled_upload(upload) as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"test audio content"
+    assert not os.path.exists(path)
+
+
+@pytest.mark.asyncio
+async def test_spooled_upload_removes_file_on_error():
+    upload = type("Upload", (object,), {"file": io.BytesIO(b"test audio content")})()
+    with pytest.raises(RuntimeError):
+        async with spooled_upload(upload) as path:
+            raise RuntimeError("upload failed")
+    assert not os.path.exists(path)
+
+
+def test_spool_fileobj_read_error():
+    with pytest.raises(IOError):
+        spool_fileobj(FailingFile())
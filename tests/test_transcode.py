@@ -0,0 +1,94 @@
+import os
+import shutil
+import wave
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.crud import fill_recording_from_s3
+from app.recording_cache import RecordingCache
+from app.transcode import ORIGINAL_CODEC, Transcoder, archive_suffix, average_bitrate
+
+
+def write_wav(path, seconds=1.0, sample_rate=8000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = (3000 * np.sin(2 * np.pi * 440 * t)).astype("<i2")
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+    return str(path)
+
+
+def read_frames(path):
+    with wave.open(path, "rb") as f:
+        return f.getframerate(), f.readframes(f.getnframes())
+
+
+def test_average_bitrate():
+    assert average_bitrate(16000, 1.0) == 128000
+    assert average_bitrate(16000, 0) == 0
+
+
+@pytest.mark.asyncio
+async def test_flac_round_trip(tmp_path):
+    source = write_wav(tmp_path / "call.wav")
+    transcoder = Transcoder("flac", max_workers=2)
+    transcoded = await transcoder.transcode(source)
+    try:
+        assert transcoded.codec == "flac"
+        assert transcoded.path.endswith(".flac")
+        assert transcoded.size == os.path.getsize(transcoded.path)
+        assert transcoded.size < os.path.getsize(source)
+        assert 0 < transcoded.bitrate < 128000
+        stats = transcoder.stats()
+        assert stats["files"] == 1
+        assert stats["compression_ratio"] > 1
+
+        archive = tmp_path / "archive.flac"
+        shutil.copyfile(transcoded.path, archive)
+
+        def download(bucket_name, s3_file_name, file_path):
+            shutil.copyfile(archive, file_path)
+
+        cache = RecordingCache(directory=str(tmp_path / "cache"), max_bytes=10**6)
+        with patch("app.crud.recording_cache", cache), patch(
+            "app.crud.download_file_from_s3", side_effect=download
+        ):
+            path = await fill_recording_from_s3("abc", "uuid1.flac", "flac")
+        assert read_frames(path) == read_frames(source)
+    finally:
+        os.remove(transcoded.path)
+
+
+@pytest.mark.asyncio
+async def test_wav_codec_archives_source(tmp_path):
+    source = write_wav(tmp_path / "call.wav")
+    transcoded = await Transcoder("wav").transcode(source)
+    assert transcoded.path == source
+    assert transcoded.codec == "wav"
+    assert transcoded.bitrate == average_bitrate(os.path.getsize(source), 1.0)
+
+
+@pytest.mark.asyncio
+async def test_non_wav_upload_is_archived_as_received(tmp_path):
+    source = tmp_path / "call.wav"
+    source.write_bytes(b"test audio content")
+    transcoded = await Transcoder("flac").transcode(str(source))
+    assert transcoded.path == str(source)
+    assert transcoded.codec == ORIGINAL_CODEC
+    assert transcoded.size == 18
+    assert archive_suffix(transcoded.codec, "Call.MP3") == ".mp3"
+
+
+@pytest.mark.asyncio
+async def test_encoder_failure_falls_back_to_wav(tmp_path):
+    source = write_wav(tmp_path / "call.wav")
+    transcoder = Transcoder("flac")
+    with patch("app.transcode.encode_command", return_value=["false"]):
+        transcoded = await transcoder.transcode(source)
+    assert transcoded.path == source
+    assert transcoded.codec == "wav"
+    assert transcoder.stats()["failed"] == 1
@@ -0,0 +1,59 @@
+import hashlib
+
+import pytest
+from sqlalchemy import delete
+
+from app.database import async_session
+from app.models import TranscriptCacheEntry
+from app.transcript_cache import TranscriptCache, file_digest
+
+
+@pytest.fixture(autouse=True)
+async def clear_database():
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(TranscriptCacheEntry))
+            await session.commit()
+
+def make_entry(**overrides):
+    values = {
+        "content_hash": "abc",
+        "engine": "sphinx",
+        "language": "es",
+        "transcript": "hello",
+        "transcript_segments": [{"start": 0, "end": 1.0, "text": "hello"}],
+        "speech_ratio": 0.5,
+        "translation": "hola",
+        "s3_key": "uuid1.mp3",
+    }
+    values.update(overrides)
+    return TranscriptCacheEntry(**values)
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "recording.wav"
+    data = b"RIFF" + bytes(range(256)) * 100
+    path.write_bytes(data)
+    assert file_digest(str(path), chunk_size=1000) == hashlib.sha256(data).hexdigest()
+
+@pytest.mark.asyncio
+async def test_cache_miss_then_hit():
+    cache = TranscriptCache()
+    assert await cache.get("abc", "sphinx", "es") is None
+    await cache.put(make_entry())
+    entry = await cache.get("abc", "sphinx", "es")
+    assert entry.transcript == "hello"
+    assert entry.translation == "hola"
+    assert entry.transcript_segments == [{"start": 0, "end": 1.0, "text": "hello"}]
+    assert await cache.get("abc", "sphinx", "fr") is None
+    assert await cache.get("abc", "sphinx-2", "es") is None
+    assert cache.stats() == {"hits": 1, "misses": 3, "stores": 1, "hit_ratio": 0.25}
+
+@pytest.mark.asyncio
+async def test_cache_put_replaces_entry():
+    cache = TranscriptCache()
+    await cache.put(make_entry())
+    await cache.get("abc", "sphinx", "es")
+    await cache.put(make_entry(translation="hola!"))
+    entry = await cache.get("abc", "sphinx", "es")
+    assert entry.translation == "hola!"
+    assert entry.hit_count == 2
@@ -0,0 +1,149 @@
+import wave
+from multiprocessing import shared_memory
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import speech_recognition as sr
+
+from app.transcription import TranscriptionEngine, engine_version, stitch_segments
+
+
+@pytest.fixture
+def wav_file(tmp_path):
+    path = tmp_path / "recording.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(b"\x00\x00" * 16000)
+    return str(path)
+
+
+@pytest.mark.asyncio
+@patch("app.transcription._recognize", return_value="hello world")
+async def test_transcribe_file(mock_recognize, wav_file):
+    engine = TranscriptionEngine(max_workers=2)
+    try:
+        transcript = await engine.transcribe_file(wav_file)
+    finally:
+        engine.shutdown()
+    assert transcript == "hello world"
+    stats = engine.stats()
+    assert stats["max_workers"] == 2
+    assert sum(worker["tasks"] for worker in stats["workers"].values()) == 1
+
+
+@pytest.mark.asyncio
+@patch("app.transcription._recognize", return_value="hello world")
+async def test_transcribe_buffer(mock_recognize):
+    pcm = b"\x00\x00" * 16000
+    buffer = shared_memory.SharedMemory(create=True, size=len(pcm))
+    buffer.buf[: len(pcm)] = pcm
+    engine = TranscriptionEngine(max_workers=1)
+    try:
+        transcript = await engine.transcribe_buffer(buffer, len(pcm), 16000, 2)
+    finally:
+        engine.shutdown()
+        buffer.close()
+        buffer.unlink()
+    assert transcript == "hello world"
+
+
+@pytest.mark.asyncio
+@patch("app.transcription._recognize", side_effect=sr.UnknownValueError())
+async def test_transcribe_file_error(mock_recognize, wav_file):
+    engine = TranscriptionEngine(max_workers=1)
+    try:
+        with pytest.raises(sr.UnknownValueError):
+            await engine.transcribe_file(wav_file)
+    finally:
+        engine.shutdown()
+    assert list(engine.stats()["workers"].values())[0]["tasks"] == 1
+
+
+def test_stitch_segments():
+    transcript, segments = stitch_segments(
+        8000,
+        [(0, 80000), (80000, 160000), (160000, 200000)],
+        ["i would like a refund", "a refund for my bill", ""],
+    )
+    assert transcript == "i would like a refund for my bill"
+    assert segments[1] == {"start": 10.0, "end": 20.0, "text": "for my bill"}
+    assert segments[2]["text"] == ""
+
+
+def test_stitch_segments_keeps_repeats_longer_than_overlap():
+    texts = ["yes yes", "yes yes"]
+    transcript, _ = stitch_segments(8000, [(0, 8000), (8000, 16000)], texts, max_words=1)
+    assert transcript == "yes yes yes"
+    transcript, _ = stitch_segments(8000, [(0, 8000), (8000, 16000)], texts, max_words=0)
+    assert transcript == "yes yes yes yes"
+
+
+@pytest.mark.asyncio
+@patch("app.transcription._recognize", return_value="hello")
+@patch("app.transcription.TRANSCRIPTION_SEGMENT_SECONDS", 0.5)
+@patch("app.transcription.TRANSCRIPTION_SILENCE_SEARCH_SECONDS", 0)
+@patch("app.transcription.TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS", 0)
+@patch("app.transcription.TRANSCRIPTION_VAD_ENABLED", False)
+async def test_transcribe_recording(mock_recognize, wav_file):
+    engine = TranscriptionEngine(max_workers=2)
+    try:
+        transcript, segments, speech_ratio = await engine.transcribe_recording(wav_file)
+    finally:
+        engine.shutdown()
+    assert [(segment["start"], segment["end"]) for segment in segments] == [(0, 0.5), (0.5, 1.0)]
+    # Without overlap a word at both sides of a boundary is a real repeat
+    assert transcript == "hello hello"
+    assert speech_ratio == 1.0
+
+
+@pytest.mark.asyncio
+@patch("app.transcription._recognize", return_value="hello")
+async def test_transcribe_recording_skips_silence(mock_recognize, tmp_path):
+    t = np.arange(16000) / 16000
+    speech = (8000 * np.sin(2 * np.pi * 220 * t)).astype("<i2")
+    path = tmp_path / "recording.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(b"\x00\x00" * 48000 + speech.tobytes() + b"\x00\x00" * 48000)
+    engine = TranscriptionEngine(max_workers=1)
+    try:
+        transcript, segments, speech_ratio = await engine.transcribe_recording(str(path))
+    finally:
+        engine.shutdown()
+    assert transcript == "hello"
+    assert [(segment["start"], segment["end"]) for segment in segments] == [(2.7, 4.3)]
+    assert speech_ratio == pytest.approx(1.6 / 7)
+    assert engine.stats()["speech_seconds"] == pytest.approx(1.6)
+
+
+@pytest.mark.asyncio
+@patch("app.transcription._recognize", return_value="hello")
+async def test_transcribe_recording_silence(mock_recognize, wav_file):
+    engine = TranscriptionEngine(max_workers=1)
+    try:
+        transcription = await engine.transcribe_recording(wav_file)
+    finally:
+        engine.shutdown()
+    assert transcription.text == ""
+    assert transcription.segments == []
+    assert transcription.speech_ratio == 0
+
+
+def test_engine_version_covers_audio_settings():
+    version = engine_version()
+    for name in (
+        "TRANSCRIPTION_SEGMENT_SECONDS",
+        "TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS",
+        "TRANSCRIPTION_SILENCE_SEARCH_SECONDS",
+        "TRANSCRIPTION_VAD_PADDING_SECONDS",
+        "TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS",
+    ):
+        with patch(f"app.transcription.{name}", 0.123):
+            assert engine_version() != version
+    with patch("app.transcription.TRANSCRIPTION_VAD_ENABLED", False):
+        assert engine_version().endswith("/vad0")
@@ -0,0 +1,134 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.cache import LRUCache
+from app.translation import GoogleTranslateClient, LocalTranslator, TranslationService
+
+
+class CountingTranslator(LocalTranslator):
+    def __init__(self):
+        self.batches = []
+
+    async def translate_batch(self, texts, dest):
+        self.batches.append((dest, list(texts)))
+        return await super().translate_batch(texts, dest)
+
+
+class FailingTranslator:
+    async def translate_batch(self, texts, dest):
+        raise RuntimeError("service unavailable")
+
+
+class ShortTranslator(LocalTranslator):
+    async def translate_batch(self, texts, dest):
+        return (await super().translate_batch(texts, dest))[:-1]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_translations_are_batched():
+    client = CountingTranslator()
+    service = TranslationService(client, batch_size=10, batch_wait=0.01)
+    results = await asyncio.gather(
+        service.translate("hello", "es"),
+        service.translate("goodbye", "es"),
+        service.translate("hello", "es"),
+        service.translate("hello", "fr"),
+    )
+    assert results == ["[es] hello", "[es] goodbye", "[es] hello", "[fr] hello"]
+    assert sorted(client.batches) == [("es", ["hello", "goodbye"]), ("fr", ["hello"])]
+
+
+@pytest.mark.asyncio
+async def test_batch_flushes_when_full():
+    client = CountingTranslator()
+    service = TranslationService(client, batch_size=2, batch_max_chars=12, batch_wait=10)
+    results = await asyncio.gather(
+        service.translate("one", "es"),
+        service.translate("two", "es"),
+        service.translate("three four", "es"),
+        service.translate("five six", "es"),
+    )
+    assert results == ["[es] one", "[es] two", "[es] three four", "[es] five six"]
+    assert client.batches == [
+        ("es", ["one", "two"]),
+        ("es", ["three four"]),
+        ("es", ["five six"]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_translations_are_cached():
+    client = CountingTranslator()
+    service = TranslationService(client, batch_wait=0)
+    assert await service.translate("hello", "es") == "[es] hello"
+    assert await service.translate("hello", "es") == "[es] hello"
+    assert await service.translate("", "es") == ""
+    assert len(client.batches) == 1
+    stats = service.stats()
+    assert stats["requests"] == 1
+    assert stats["cache"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_translate_to_languages():
+    service = TranslationService(CountingTranslator(), batch_wait=0)
+    assert await service.translate_to(["hello", "", "world"], ["es", "de"]) == {
+        "es": "[es] hello [es] world",
+        "de": "[de] hello [de] world",
+    }
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_raises_for_every_caller():
+    service = TranslationService(FailingTranslator(), batch_wait=0)
+    results = await asyncio.gather(
+        service.translate("hello", "es"),
+        service.translate("world", "es"),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert service.stats()["failed_requests"] == 1
+    assert len(service.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_short_batch_response_fails_every_caller():
+    service = TranslationService(ShortTranslator(), batch_wait=0.01)
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            service.translate("hello", "es"),
+            service.translate("world", "es"),
+            return_exceptions=True,
+        ),
+        timeout=1,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert service.stats()["failed_requests"] == 1
+    assert len(service.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_google_client_sends_one_request_per_batch():
+    client = GoogleTranslateClient()
+    with patch(
+        "app.translation.Translator.translate",
+        new_callable=AsyncMock,
+        return_value=AsyncMock(text="hola\nadiós"),
+    ) as mock_translate:
+        assert await client.translate_batch(["hello", "good\nbye"], "es") == ["hola", "adiós"]
+    mock_translate.assert_called_once_with("hello\ngood bye", dest="es")
@@ -0,0 +1,62 @@
+import asyncio
+import os
+
+import boto3
+import pytest
+from boto3.s3.transfer import TransferConfig
+from moto import mock_aws
+
+from app.uploader import S3Uploader
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="test-bucket")
+        yield client
+
+
+@pytest.fixture
+def recording_file(tmp_path):
+    path = tmp_path / "recording.wav"
+    path.write_bytes(os.urandom(6 * 1024 * 1024))
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_upload(s3_client, recording_file):
+    uploader = S3Uploader(
+        bucket_name="test-bucket",
+        max_uploads=2,
+        transfer_config=TransferConfig(
+            multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024
+        ),
+        client=s3_client,
+    )
+    try:
+        urls = await asyncio.gather(
+            *(uploader.upload(recording_file, f"recording-{i}.wav") for i in range(3))
+        )
+    finally:
+        uploader.shutdown()
+    assert urls[0] == "https://test-bucket.s3.amazonaws.com/recording-0.wav"
+    head = s3_client.head_object(Bucket="test-bucket", Key="recording-2.wav")
+    assert head["ContentLength"] == 6 * 1024 * 1024
+    stats = uploader.stats()
+    assert stats["completed"] == 3
+    assert stats["queue_depth"] == 0
+    assert stats["active"] == 0
+    assert stats["bytes_uploaded"] == 3 * 6 * 1024 * 1024
+    assert stats["throughput_bytes_per_second"] > 0
+
+
+@pytest.mark.asyncio
+async def test_upload_failure(s3_client, recording_file):
+    uploader = S3Uploader(bucket_name="missing-bucket", client=s3_client)
+    try:
+        with pytest.raises(Exception):
+            await uploader.upload(recording_file, "recording.wav")
+    finally:
+        uploader.shutdown()
+    assert uploader.stats()["failed"] == 1
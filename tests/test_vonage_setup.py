@@ -1,8 +1,12 @@
+import os
+import wave
+
 import pytest
 from unittest.mock import patch, AsyncMock
 
-from app.models import CallState
-from app.vonage_setup import create_ncco, store_call_state, handle_recording, handle_call_event, transcribe_and_translate
+from app.models import CallState, CallTranslation, DashboardRollup, TranscriptCacheEntry
+from app.translation import LocalTranslator, translation_service
+from app.vonage_setup import create_ncco, store_call_state, transcribe_and_translate
 from fastapi import Request
 from app.enums import CallStatus
 from app.database import async_session
@@ -13,7 +17,11 @@ async def clear_database():
     async with async_session() as session:
         async with session.begin():
             await session.execute(delete(CallState))
+            await session.execute(delete(DashboardRollup))
+            await session.execute(delete(TranscriptCacheEntry))
+            await session.execute(delete(CallTranslation))
             await session.commit()
+    translation_service.cache.clear()
 
 @pytest.mark.asyncio
 async def test_create_ncco():
@@ -38,43 +46,105 @@ async def test_store_call_state():
             assert call_state.status == CallStatus.RECORDING.value
 
 @pytest.mark.asyncio
-@patch("app.vonage_setup.transcribe_and_translate", new_callable=AsyncMock)
-async def test_handle_recording(mock_transcribe_and_translate):
+@patch("app.uploader.upload_file_to_s3", return_value="http://mock_s3_url/recording.mp3")
+@patch("app.translation.Translator.translate", return_value=AsyncMock(text="translated text"))
+@patch("app.transcription.TranscriptionEngine.transcribe_recording", return_value=("transcribed text", [], 0.8))
+async def test_transcribe_and_translate(mock_recognize_sphinx, mock_translate, mock_upload_file_to_s3):
     call_uuid = "test-uuid"
     recording_url = "http://testserver/recording.mp3"
     await store_call_state(call_uuid)
-    await handle_recording(call_uuid, recording_url, CallStatus.COMPLETED.value)
+    await transcribe_and_translate(call_uuid, recording_url)
     async with async_session() as session:
         async with session.begin():
             result = await session.execute(select(CallState).where(CallState.uuid == call_uuid))
             call_state = result.scalar_one_or_none()
-            assert call_state is None
-    mock_transcribe_and_translate.assert_called_once_with(call_uuid, recording_url)
+            assert call_state is not None
+            assert call_state.transcript == "transcribed text"
+            assert call_state.translation == "translated text"
 
 @pytest.mark.asyncio
-async def test_handle_call_event():
-    call_uuid = "test-uuid"
-    await store_call_state(call_uuid)
-    await handle_call_event(call_uuid, CallStatus.COMPLETED.value)
+@patch("app.uploader.upload_file_to_s3", return_value="http://mock_s3_url/recording.mp3")
+@patch("app.translation.Translator.translate", return_value=AsyncMock(text="translated text"))
+@patch("app.transcription.TranscriptionEngine.transcribe_recording", return_value=("transcribed text", [], 0.8))
+async def test_transcribe_and_translate_reuses_cached_result(mock_transcribe, mock_translate, mock_upload_file_to_s3, tmp_path):
+    recording = tmp_path / "recording.wav"
+    recording.write_bytes(b"RIFF" + b"\x00" * 1000)
+    await store_call_state("uuid1")
+    await store_call_state("uuid2")
+    await transcribe_and_translate("uuid1", str(recording))
+    await transcribe_and_translate("uuid2", str(recording))
+    assert mock_transcribe.call_count == 1
+    assert mock_translate.call_count == 1
+    assert mock_upload_file_to_s3.call_count == 1
     async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(select(CallState).where(CallState.uuid == call_uuid))
-            call_state = result.scalar_one_or_none()
-            assert call_state is None
+        result = await session.execute(select(CallState).where(CallState.uuid == "uuid2"))
+        call_state = result.scalar_one()
+        assert call_state.transcript == "transcribed text"
+        assert call_state.translation == "translated text"
+        assert call_state.speech_ratio == 0.8
+
+class ShoutingTranslator(LocalTranslator):
+    version = "shouting-1"
+
+    async def translate_batch(self, texts, dest):
+        return [text.upper() for text in texts]
 
 @pytest.mark.asyncio
-@patch("app.vonage_setup.upload_file_to_s3", return_value="http://mock_s3_url/recording.mp3")
-@patch("app.vonage_setup.Translator.translate", return_value=AsyncMock(text="translated text"))
-@patch("app.vonage_setup.sr.Recognizer.recognize_sphinx", return_value="transcribed text")
-async def test_transcribe_and_translate(mock_recognize_sphinx, mock_translate, mock_upload_file_to_s3):
-    call_uuid = "test-uuid"
-    recording_url = "http://testserver/recording.mp3"
-    await store_call_state(call_uuid)
-    await transcribe_and_translate(call_uuid, recording_url)
+@patch("app.uploader.upload_file_to_s3", return_value="http://mock_s3_url/recording.mp3")
+@patch("app.transcription.TranscriptionEngine.transcribe_recording", return_value=("hello", [], 1.0))
+async def test_cached_translations_follow_translation_client(mock_transcribe, mock_upload_file_to_s3, tmp_path):
+    recording = tmp_path / "recording.wav"
+    recording.write_bytes(b"RIFF" + b"\x00" * 1000)
+    await store_call_state("uuid1")
+    await store_call_state("uuid2")
+    with patch.object(translation_service, "client", LocalTranslator()):
+        await transcribe_and_translate("uuid1", str(recording))
+    translation_service.cache.clear()
+    with patch.object(translation_service, "client", ShoutingTranslator()):
+        await transcribe_and_translate("uuid2", str(recording))
     async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(select(CallState).where(CallState.uuid == call_uuid))
-            call_state = result.scalar_one_or_none()
-            assert call_state is not None
-            assert call_state.transcript == "transcribed text"
-            assert call_state.translation == "translated text"
+        call_state = (await session.execute(select(CallState).where(CallState.uuid == "uuid2"))).scalar_one()
+        assert call_state.translation == "HELLO"
+
+@pytest.mark.asyncio
+@patch("app.uploader.upload_file_to_s3", return_value="http://mock_s3_url/recording.mp3")
+@patch("app.vonage_setup.TRANSLATION_LANGUAGES", ["es", "fr"])
+@patch.object(translation_service, "client", LocalTranslator())
+@patch(
+    "app.transcription.TranscriptionEngine.transcribe_recording",
+    return_value=("hello there", [{"start": 0, "end": 1.0, "text": "hello"}, {"start": 1.0, "end": 2.0, "text": "there"}], 1.0),
+)
+async def test_transcribe_and_translate_fans_out_languages(mock_transcribe, mock_upload_file_to_s3, tmp_path):
+    recording = tmp_path / "recording.wav"
+    recording.write_bytes(b"RIFF" + b"\x00" * 1000)
+    await store_call_state("uuid1")
+    await transcribe_and_translate("uuid1", str(recording))
+    async with async_session() as session:
+        call_state = (await session.execute(select(CallState).where(CallState.uuid == "uuid1"))).scalar_one()
+        assert call_state.translation == "[es] hello [es] there"
+        result = await session.execute(select(CallTranslation.language, CallTranslation.text).where(CallTranslation.call_uuid == "uuid1"))
+        assert dict(result.all()) == {"es": "[es] hello [es] there", "fr": "[fr] hello [fr] there"}
+
+@pytest.mark.asyncio
+@patch("app.uploader.upload_file_to_s3", return_value="http://mock_s3_url/uuid1.flac")
+@patch.object(translation_service, "client", LocalTranslator())
+@patch("app.transcription.TranscriptionEngine.transcribe_recording", return_value=("hello", [], 1.0))
+async def test_transcribe_and_translate_archives_flac(mock_transcribe, mock_upload_file_to_s3, tmp_path):
+    recording = tmp_path / "recording.wav"
+    with wave.open(str(recording), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\x10\x00" * 8000)
+    await store_call_state("uuid1")
+    await transcribe_and_translate("uuid1", str(recording))
+    uploaded_path, _, s3_key = mock_upload_file_to_s3.call_args.args[:3]
+    assert s3_key == "uuid1.flac"
+    assert not os.path.exists(uploaded_path)
+    async with async_session() as session:
+        call_state = (await session.execute(select(CallState).where(CallState.uuid == "uuid1"))).scalar_one()
+        assert call_state.recording_key == "uuid1.flac"
+        assert call_state.archive_codec == "flac"
+        assert 0 < call_state.archive_size < os.path.getsize(recording)
+        assert call_state.sample_rate == 8000
+        assert call_state.duration == 1